@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the per-record overhead of request and response formatting.
+
+usage: python3 benchmarks/formatter_overhead.py [--repeat 5]
+"""
+import os
+import sys
+import json
+import timeit
+import argparse
+import tempfile
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_PATH)
+
+from src.formatter import (  # noqa: E402
+    DialogRequestFormatter,
+    SingleCallRequestFormatter,
+    DialogResponseFormatter,
+    SingleCallResponseFormatter,
+)
+from src import utils  # noqa: E402
+from src.payload_creator import PayloadCreatorFactory  # noqa: E402
+
+
+def load_singlecall_arguments():
+    arguments_list = []
+    with open(f'{REPO_PATH}/data/FunctionChat-Singlecall.jsonl', 'r', encoding='utf-8') as ff:
+        for line in ff:
+            test_input = json.loads(line)
+            for q_idx, query in enumerate(test_input['query']):
+                messages = [{'role': 'system', 'content': 'system prompt'}, {'role': 'user', 'content': query['content']}]
+                for tools in test_input['tools']:
+                    arguments_list.append({
+                        'serial_num': query['serial_num'],
+                        'messages': messages,
+                        'temperature': 0.1,
+                        'tool_choice': 'auto',
+                        'tools': tools['content'],
+                        'tools_type': tools['type'],
+                        'acceptable_arguments': test_input['acceptable_arguments'][q_idx]['content'],
+                        'ground_truth': test_input['ground_truth'][q_idx]['content'],
+                    })
+    return arguments_list
+
+
+def load_dialog_arguments():
+    arguments_list = []
+    with open(f'{REPO_PATH}/data/FunctionChat-Dialog.jsonl', 'r', encoding='utf-8') as ff:
+        for line in ff:
+            test_input = json.loads(line)
+            for turn in test_input['turns']:
+                arguments = {key: turn[key] for key in ['serial_num', 'ground_truth', 'acceptable_arguments', 'type_of_output']}
+                arguments['tools'] = test_input['tools']
+                arguments['messages'] = [{'role': 'system', 'content': 'system prompt'}] + turn['query']
+                arguments['temperature'] = 0.1
+                arguments['tool_choice'] = 'auto'
+                arguments_list.append(arguments)
+    return arguments_list
+
+
+def get_evaluate_response():
+    return {
+        "id": "exact-match",
+        "choices": [{"finish_reason": "stop", "index": 0,
+                     "message": {"content": "exact-eval\n\n\npass\npass\n", "role": "assistant"}}],
+        "exact": "pass"
+    }
+
+
+def bench(name, func, records, repeat, n_records=None):
+    best = min(timeit.repeat(lambda: [func(record) for record in records], number=1, repeat=repeat))
+    n_records = n_records or len(records)
+    print(f"{name:<40} {best / n_records * 1e6:10.2f} us/record ({n_records} records)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    singlecall_arguments = load_singlecall_arguments()
+    dialog_arguments = load_dialog_arguments()
+    bench('singlecall request formatting',
+          lambda arguments: SingleCallRequestFormatter(**arguments).to_dict(), singlecall_arguments, args.repeat)
+    bench('dialog request formatting',
+          lambda arguments: DialogRequestFormatter(**arguments).to_dict(), dialog_arguments, args.repeat)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        payload_creator = PayloadCreatorFactory.get_payload_creator('singlecall', 0.1, f'{REPO_PATH}/data/system_prompt.txt')
+        test_set = utils.load_to_jsonl(f'{REPO_PATH}/data/FunctionChat-Singlecall.jsonl')
+        bench('singlecall payload compile (all)',
+              lambda _: payload_creator.compile_payload(test_set, tools_type='all'),
+              [None], args.repeat, n_records=len(singlecall_arguments))
+        bench('singlecall compiled payload load (all)',
+              lambda _: payload_creator.create_payload(input_file_path=f'{REPO_PATH}/data/FunctionChat-Singlecall.jsonl',
+                                                       request_file_path=f'{tmp_dir}/request.jsonl',
+                                                       reset=True, tools_type='all'),
+              [None], args.repeat, n_records=len(singlecall_arguments))
+
+    singlecall_requests = [SingleCallRequestFormatter(**arguments).to_dict() for arguments in singlecall_arguments]
+    dialog_requests = [DialogRequestFormatter(**arguments).to_dict() for arguments in dialog_arguments]
+    evaluate_response = get_evaluate_response()
+
+    def format_response(formatter_cls, request):
+        response_formatter = formatter_cls(
+            request_model=request,
+            response_model={'role': 'assistant', 'content': None, 'tool_calls': None},
+            evaluate_prompt='',
+            evaluate_response=evaluate_response
+        )
+        return response_formatter.to_dict(), response_formatter.to_tsv()
+
+    bench('singlecall response formatting',
+          lambda request: format_response(SingleCallResponseFormatter, request), singlecall_requests, args.repeat)
+    bench('dialog response formatting',
+          lambda request: format_response(DialogResponseFormatter, request), dialog_requests, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
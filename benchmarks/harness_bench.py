@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark suite of the pure-CPU stages of the harness over the bundled datasets.
+
+Each benchmark reports the best of --repeat runs over all records, in microseconds per record.
+Results can be saved as json and compared against a saved baseline to catch regressions.
+
+usage: python3 benchmarks/harness_bench.py [--repeat 5] [--filter create_payload]
+                                           [--save benchmarks/results/baseline.json]
+                                           [--compare benchmarks/results/baseline.json] [--threshold 0.1]
+"""
+import io
+import os
+import sys
+import json
+import copy
+import timeit
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+from contextlib import redirect_stdout, redirect_stderr
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_PATH)
+
+from src import utils  # noqa: E402
+from src.formatter import (  # noqa: E402
+    CommonResponseFormatter,
+    DialogResponseFormatter,
+    SingleCallResponseFormatter,
+    convert_eval_key,
+)
+from src.payload_creator import PayloadCreatorFactory  # noqa: E402
+from src.bedrock_utils import convert_openai_to_bedrock_messages, convert_openai_to_bedrock_tools  # noqa: E402
+from src.evaluation_registor import (  # noqa: E402
+    CommonEvaluationRegistor,
+    DialogEvaluationRegistor,
+    SingleCallEvaluationRegistor,
+)
+
+SUITES = {
+    'singlecall': (f'{REPO_PATH}/data/FunctionChat-Singlecall.jsonl', f'{REPO_PATH}/data/system_prompt.txt', {'tools_type': 'all'}),
+    'dialog': (f'{REPO_PATH}/data/FunctionChat-Dialog.jsonl', f'{REPO_PATH}/data/system_prompt.txt', {}),
+    'common': (f'{REPO_PATH}/data/FunctionChat-CallDecision.jsonl', None, {}),
+}
+RESPONSE_FORMATTER_OBJ = {
+    'common': CommonResponseFormatter,
+    'singlecall': SingleCallResponseFormatter,
+    'dialog': DialogResponseFormatter,
+}
+EVAlUATION_REGISTOR_OBJ = {
+    'common': CommonEvaluationRegistor,
+    'singlecall': SingleCallEvaluationRegistor,
+    'dialog': DialogEvaluationRegistor,
+}
+
+
+def get_ground_truth_call(request):
+    ground_truth = request.get('ground_truth') or {}
+    if 'tool_calls' in ground_truth:
+        return ground_truth['tool_calls'][0]['function']
+    return None
+
+
+def get_model_response(request, idx):
+    # every other call answer gets wrong arguments, so that both the pass and the fail paths are measured
+    ground_truth_call = get_ground_truth_call(request)
+    if ground_truth_call is None:
+        return {'role': 'assistant', 'content': 'mock answer', 'tool_calls': None}
+    arguments = ground_truth_call['arguments']
+    if idx % 2 == 1:
+        arguments = json.dumps({key: 'wrong' for key in json.loads(arguments)}, ensure_ascii=False)
+    return {'role': 'assistant', 'content': None,
+            'tool_calls': [{'id': 'call_0', 'type': 'function',
+                            'function': {'name': ground_truth_call['name'], 'arguments': arguments}}]}
+
+
+def get_evaluate_response(idx):
+    is_pass = 'pass' if idx % 2 == 0 else 'fail'
+    return {
+        "id": "exact-match",
+        "choices": [{"finish_reason": "stop", "index": 0,
+                     "message": {"content": f"exact-eval\n\n\n{is_pass}\n{is_pass}\n", "role": "assistant"}}],
+        "exact": is_pass
+    }
+
+
+def is_bedrock_convertible(messages):
+    # tool results that are not json can not be converted (toolResult.content.json), those dialogs are left out
+    try:
+        convert_openai_to_bedrock_messages(copy.deepcopy(messages))
+    except json.JSONDecodeError:
+        return False
+    return True
+
+
+def bench(results, name, func, records, repeat, n_records=None):
+    best = min(timeit.repeat(lambda: [func(record) for record in records], number=1, repeat=repeat))
+    n_records = n_records or len(records)
+    results[name] = {'us_per_record': best / n_records * 1e6, 'records': n_records, 'best_seconds': best}
+    print(f"{name:<50} {best / n_records * 1e6:10.2f} us/record ({n_records} records)")
+
+
+def load_evaluation_handler():
+    # EvaluationHandler imports every provider SDK through api_executor
+    try:
+        from src.evaluation_handler import EvaluationHandler
+    except ImportError as e:
+        print(f"[skip] EvaluationHandler benchmarks : {e}")
+        return None
+    # match and compare_arguments do not use the judge, so the handler is built without one
+    return object.__new__(EvaluationHandler)
+
+
+def run_benchmarks(args, selected):
+    results = {}
+    api_requests = {}
+    for eval_type, (input_path, system_prompt_path, payload_kwargs) in SUITES.items():
+        payload_creator = PayloadCreatorFactory.get_payload_creator(eval_type, 0.1, system_prompt_path)
+        with redirect_stderr(io.StringIO()):
+            test_set = utils.load_to_jsonl(input_path)
+            api_requests[eval_type] = payload_creator.compile_payload(test_set, **payload_kwargs)
+        n_records = len(api_requests[eval_type])
+        if selected(f'{eval_type} create_payload'):
+            tmp_dir = tempfile.mkdtemp()
+            try:
+                def create_payload(cold):
+                    if cold:
+                        for file_name in os.listdir(f'{tmp_dir}/compiled'):
+                            os.remove(f'{tmp_dir}/compiled/{file_name}')
+                    with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+                        return payload_creator.create_payload(input_file_path=input_path, request_file_path=f'{tmp_dir}/request.jsonl',
+                                                              reset=True, compiled_dir=f'{tmp_dir}/compiled', **payload_kwargs)
+                os.makedirs(f'{tmp_dir}/compiled')
+                bench(results, f'{eval_type} create_payload (cold)', create_payload, [True], args.repeat, n_records)
+                create_payload(False)
+                bench(results, f'{eval_type} create_payload (compiled)', create_payload, [False], args.repeat, n_records)
+            finally:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    all_requests = [request for requests in api_requests.values() for request in requests]
+    if selected('bedrock convert'):
+        # the converters fill in missing schema fields in place, so they run on copies
+        messages_list = [copy.deepcopy(request['messages']) for request in all_requests
+                         if is_bedrock_convertible(request['messages'])]
+        tools_list = [copy.deepcopy(request['tools']) for request in all_requests if request.get('tools')]
+        bench(results, 'bedrock convert_openai_to_bedrock_messages', convert_openai_to_bedrock_messages, messages_list, args.repeat)
+        bench(results, 'bedrock convert_openai_to_bedrock_tools', convert_openai_to_bedrock_tools, tools_list, args.repeat)
+    if selected('gemini convert'):
+        try:
+            from src.gemini_utils import convert_messages_gemini, convert_tools_gemini
+        except ImportError as e:
+            print(f"[skip] gemini benchmarks : {e}")
+        else:
+            messages_list = [request['messages'] for request in all_requests]
+            tools_list = [request['tools'] for request in all_requests if request.get('tools')]
+            bench(results, 'gemini convert_messages_gemini', convert_messages_gemini, messages_list, args.repeat)
+            bench(results, 'gemini convert_tools_gemini', convert_tools_gemini, tools_list, args.repeat)
+
+    evaluation_handler = None
+    if any(selected(f'{eval_type} match') or selected(f'{eval_type} compare_arguments') for eval_type in SUITES):
+        evaluation_handler = load_evaluation_handler()
+    for eval_type, requests in api_requests.items():
+        model_responses = [get_model_response(request, idx) for idx, request in enumerate(requests)]
+        call_pairs = [(request, response) for request, response in zip(requests, model_responses)
+                      if get_ground_truth_call(request) is not None]
+        if evaluation_handler is not None and call_pairs:
+            if selected(f'{eval_type} match'):
+                bench(results, f'{eval_type} EvaluationHandler.match',
+                      lambda pair: evaluation_handler.match(*pair), call_pairs, args.repeat)
+            if selected(f'{eval_type} compare_arguments'):
+                argument_triples = [(get_ground_truth_call(request)['arguments'],
+                                     response['tool_calls'][0]['function']['arguments'],
+                                     evaluation_handler.get_acceptable_arguments(request))
+                                    for request, response in call_pairs]
+                bench(results, f'{eval_type} EvaluationHandler.compare_arguments',
+                      lambda triple: evaluation_handler.compare_arguments(*triple), argument_triples, args.repeat)
+
+        formatter_cls = RESPONSE_FORMATTER_OBJ[eval_type]
+        format_records = [(request, response, get_evaluate_response(idx))
+                          for idx, (request, response) in enumerate(zip(requests, model_responses))]
+        if selected(f'{eval_type} ResponseFormatter'):
+            bench(results, f'{eval_type} ResponseFormatter construction + to_tsv',
+                  lambda record: formatter_cls(record[0], record[1], '', record[2]).to_tsv(), format_records, args.repeat)
+        if selected(f'{eval_type} convert_eval_key'):
+            bench(results, f'{eval_type} convert_eval_key',
+                  lambda record: convert_eval_key(record[2]), format_records, args.repeat)
+        if selected(f'{eval_type} registor display'):
+            eval_output = [formatter_cls(*record[:2], '', record[2]).to_dict() for record in format_records]
+
+            def display(_):
+                eval_reg = EVAlUATION_REGISTOR_OBJ[eval_type]()
+                eval_reg.set_eval_output(eval_output)
+                with redirect_stdout(io.StringIO()):
+                    eval_reg.display()
+            bench(results, f'{eval_type} registor display', display, [None], args.repeat, len(eval_output))
+    return results
+
+
+def get_git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_PATH,
+                                       stderr=subprocess.DEVNULL).decode('utf-8').strip()
+    except Exception:
+        return None
+
+
+def compare_results(base, results, threshold):
+    """
+    Prints the change of every benchmark against a baseline.
+
+    Returns:
+        list: names of the benchmarks slower than the baseline by more than the threshold.
+    """
+    meta = base['meta']
+    print(f"\n[[compare with {meta.get('git_revision')} ({meta.get('created_at')}, {meta.get('platform')}, {meta.get('cpu_count')} cpus)]]")
+    regressions = []
+    for name, result in results.items():
+        if name not in base['results']:
+            print(f"{name:<50} {'new':>10}")
+            continue
+        ratio = result['us_per_record'] / base['results'][name]['us_per_record']
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  << regression'
+            regressions.append(name)
+        print(f"{name:<50} {ratio:9.2f}x {base['results'][name]['us_per_record']:10.2f} -> {result['us_per_record']:.2f} us/record{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--filter', default=None, help='run only the benchmarks whose name contains this text')
+    parser.add_argument('--save', default=None, help='save the results to this json file')
+    parser.add_argument('--compare', default=None, help='compare the results with this saved json file')
+    parser.add_argument('--threshold', type=float, default=0.1, help='slowdown ratio reported as a regression')
+    args = parser.parse_args()
+
+    def selected(name):
+        return args.filter is None or args.filter in name
+
+    results = run_benchmarks(args, selected)
+    output = {
+        'meta': {
+            'git_revision': get_git_revision(),
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w', encoding='utf-8') as ff:
+            ff.write(json.dumps(output, ensure_ascii=False, indent=2))
+        print(f"[[benchmark results : {args.save}]]")
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as ff:
+            base = json.loads(ff.read())
+        if compare_results(base, results, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
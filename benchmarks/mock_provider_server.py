@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Deterministic local stand-in for the model providers, for load testing the harness without network.
+
+It serves
+  - POST /v1/chat/completions                   OpenAI chat-completions wire format (--model inhouse --base_url http://127.0.0.1:8000/v1),
+                                                streamed as server-sent events with "stream": true (--latency_bench)
+  - GET  /health, /v1/models                     health checks of the inhouse replica pool
+  - POST /model/{model_id}/converse             Bedrock Converse JSON (AWS_ENDPOINT_URL_BEDROCK_RUNTIME=http://127.0.0.1:8000)
+  - POST /v1/.../models/{model}:generateContent  Gemini generateContent JSON
+
+Latency, error rates, 429 bursts with Retry-After and canned tool calls are configurable.
+Latency and random errors are drawn from a generator seeded by the request body and its attempt number,
+so the same request sees the same latency and the same errors in every run, whatever the concurrency.
+
+usage: python3 benchmarks/mock_provider_server.py [--port 8000] [--latency_median 0.5] [--latency_sigma 0.5]
+                                                  [--error_rate 0.01] [--rate_limit_rate 0.0]
+                                                  [--burst_every 0] [--burst_length 0] [--retry_after 1]
+                                                  [--tool_call_rate 1.0] [--canned_path canned.jsonl] [--seed 0]
+                                                  [--stream_interval 0.02]
+"""
+import re
+import sys
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+BEDROCK_PATH = re.compile(r'^/model/(?P<model_id>[^/]+)/converse$')
+GEMINI_PATH = re.compile(r'^/.*/models/(?P<model>[^/:]+):generateContent$')
+SCHEMA_DEFAULTS = {'string': 'mock', 'integer': 1, 'number': 1.0, 'boolean': True, 'array': [], 'object': {}}
+
+
+def load_canned_responses(canned_path):
+    """
+    Loads canned responses, one JSON object per line:
+      {"match": "<substring of the last user message>", "tool_calls": [{"name": "...", "arguments": {...}}]}
+      {"match": "<substring of the last user message>", "content": "..."}
+    """
+    if canned_path is None:
+        return []
+    canned_responses = []
+    with open(canned_path, 'r', encoding='utf-8') as ff:
+        for line in ff:
+            if line.strip():
+                canned_responses.append(json.loads(line))
+    return canned_responses
+
+
+def get_mock_arguments(parameters):
+    # fills the required parameters of a JSON schema with placeholder values
+    arguments = {}
+    properties = (parameters or {}).get('properties', {})
+    for name in (parameters or {}).get('required', []):
+        schema = properties.get(name, {})
+        if schema.get('enum'):
+            arguments[name] = schema['enum'][0]
+        else:
+            arguments[name] = SCHEMA_DEFAULTS.get(schema.get('type'), 'mock')
+    return arguments
+
+
+class MockProvider:
+    """
+    A class that decides the latency, the outcome and the answer of every request, independently of the wire format.
+    Answers are normalized as {'content': str or None, 'tool_calls': [{'name', 'arguments'}] or None}.
+    """
+    def __init__(self, args):
+        self.args = args
+        self.canned_responses = load_canned_responses(args.canned_path)
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.attempts = {}
+
+    def get_rng(self, body):
+        body_hash = hashlib.sha256(body).hexdigest()
+        with self.lock:
+            self.request_count += 1
+            request_index = self.request_count
+            attempt = self.attempts.get(body_hash, 0)
+            self.attempts[body_hash] = attempt + 1
+        return random.Random(f'{self.args.seed}:{body_hash}:{attempt}'), request_index
+
+    def get_outcome(self, body):
+        """
+        Returns:
+            tuple: (latency in seconds, None | 'rate_limit' | 'error')
+        """
+        rng, request_index = self.get_rng(body)
+        latency = self.args.latency_median
+        if self.args.latency_sigma > 0:
+            latency = self.args.latency_median * math.exp(rng.gauss(0, self.args.latency_sigma))
+        if self.args.burst_every > 0 and (request_index - 1) % self.args.burst_every < self.args.burst_length:
+            return self.args.rate_limit_latency, 'rate_limit'
+        if rng.random() < self.args.rate_limit_rate:
+            return self.args.rate_limit_latency, 'rate_limit'
+        if rng.random() < self.args.error_rate:
+            return latency, 'error'
+        return latency, None
+
+    def get_answer(self, last_user_text, tools, body):
+        for canned_response in self.canned_responses:
+            if canned_response.get('match', '') in last_user_text:
+                return {'content': canned_response.get('content'), 'tool_calls': canned_response.get('tool_calls')}
+        rng = random.Random(f'{self.args.seed}:answer:{hashlib.sha256(body).hexdigest()}')
+        if tools and rng.random() < self.args.tool_call_rate:
+            name, parameters = tools[rng.randrange(len(tools))]
+            return {'content': None, 'tool_calls': [{'name': name, 'arguments': get_mock_arguments(parameters)}]}
+        return {'content': f'mock answer to: {last_user_text[:50]}', 'tool_calls': None}
+
+
+def get_text(content):
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return ' '.join(item.get('text', '') for item in content if isinstance(item, dict))
+    return ''
+
+
+def count_tokens(body):
+    # rough estimate, good enough to exercise the usage and cost accounting
+    return max(1, len(body) // 4)
+
+
+def to_openai_response(answer, body, model):
+    tool_calls = None
+    if answer['tool_calls']:
+        tool_calls = [{'id': f'call_{idx}', 'type': 'function',
+                       'function': {'name': tool_call['name'], 'arguments': json.dumps(tool_call['arguments'], ensure_ascii=False)}}
+                      for idx, tool_call in enumerate(answer['tool_calls'])]
+    completion_tokens = count_tokens(json.dumps(answer).encode('utf-8'))
+    return {
+        'id': f'chatcmpl-mock-{hashlib.sha256(body).hexdigest()[:12]}',
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': model,
+        'choices': [{'index': 0, 'finish_reason': 'tool_calls' if tool_calls else 'stop',
+                     'message': {'role': 'assistant', 'content': answer['content'], 'tool_calls': tool_calls}}],
+        'usage': {'prompt_tokens': count_tokens(body), 'completion_tokens': completion_tokens,
+                  'total_tokens': count_tokens(body) + completion_tokens},
+    }
+
+
+def to_openai_stream_chunks(response, include_usage, chunk_size=16):
+    # the streamed form of a chat completion: a role chunk, content / tool call name and arguments in pieces, the finish reason
+    choice = response['choices'][0]
+    message = choice['message']
+
+    def chunk(delta, finish_reason=None):
+        return {'id': response['id'], 'object': 'chat.completion.chunk', 'created': response['created'], 'model': response['model'],
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]}
+    chunks = [chunk({'role': 'assistant', 'content': ''})]
+    content = message['content'] or ''
+    chunks.extend(chunk({'content': content[i:i + chunk_size]}) for i in range(0, len(content), chunk_size))
+    for idx, tool_call in enumerate(message['tool_calls'] or []):
+        chunks.append(chunk({'tool_calls': [{'index': idx, 'id': tool_call['id'], 'type': 'function',
+                                             'function': {'name': tool_call['function']['name'], 'arguments': ''}}]}))
+        arguments = tool_call['function']['arguments']
+        chunks.extend(chunk({'tool_calls': [{'index': idx, 'function': {'arguments': arguments[i:i + chunk_size]}}]})
+                      for i in range(0, len(arguments), chunk_size))
+    chunks.append(chunk({}, choice['finish_reason']))
+    if include_usage:
+        chunks.append(dict(chunk({}), choices=[], usage=response['usage']))
+    return chunks
+
+
+def to_bedrock_response(answer, body, latency):
+    content = []
+    if answer['content'] is not None:
+        content.append({'text': answer['content']})
+    for idx, tool_call in enumerate(answer['tool_calls'] or []):
+        content.append({'toolUse': {'toolUseId': f'tooluse_{idx}', 'name': tool_call['name'], 'input': tool_call['arguments']}})
+    completion_tokens = count_tokens(json.dumps(answer).encode('utf-8'))
+    return {
+        'output': {'message': {'role': 'assistant', 'content': content}},
+        'stopReason': 'tool_use' if answer['tool_calls'] else 'end_turn',
+        'usage': {'inputTokens': count_tokens(body), 'outputTokens': completion_tokens,
+                  'totalTokens': count_tokens(body) + completion_tokens},
+        'metrics': {'latencyMs': int(latency * 1000)},
+    }
+
+
+def to_gemini_response(answer, body):
+    parts = []
+    if answer['content'] is not None:
+        parts.append({'text': answer['content']})
+    for tool_call in answer['tool_calls'] or []:
+        parts.append({'functionCall': {'name': tool_call['name'], 'args': tool_call['arguments']}})
+    completion_tokens = count_tokens(json.dumps(answer).encode('utf-8'))
+    return {
+        'candidates': [{'content': {'role': 'model', 'parts': parts}, 'finishReason': 'STOP', 'index': 0}],
+        'usageMetadata': {'promptTokenCount': count_tokens(body), 'candidatesTokenCount': completion_tokens,
+                          'totalTokenCount': count_tokens(body) + completion_tokens},
+    }
+
+
+def parse_openai_request(request):
+    last_user_text = next((get_text(message.get('content')) for message in reversed(request.get('messages', []))
+                           if message.get('role') == 'user'), '')
+    tools = [(tool['function']['name'], tool['function'].get('parameters')) for tool in request.get('tools') or []]
+    return last_user_text, tools
+
+
+def parse_bedrock_request(request):
+    last_user_text = ''
+    for message in reversed(request.get('messages', [])):
+        if message.get('role') == 'user' and any('text' in item for item in message.get('content', [])):
+            last_user_text = get_text(message['content'])
+            break
+    tools = [(tool['toolSpec']['name'], tool['toolSpec'].get('inputSchema', {}).get('json'))
+             for tool in (request.get('toolConfig') or {}).get('tools', [])]
+    return last_user_text, tools
+
+
+def parse_gemini_request(request):
+    last_user_text = ''
+    for content in reversed(request.get('contents', [])):
+        if content.get('role') == 'user':
+            last_user_text = get_text(content.get('parts'))
+            break
+    tools = [(declaration['name'], declaration.get('parameters'))
+             for tool in request.get('tools', []) for declaration in tool.get('functionDeclarations', [])]
+    return last_user_text, tools
+
+
+class MockProviderHandler(BaseHTTPRequestHandler):
+    provider = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.provider.args.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_event_stream(self, chunks, interval):
+        # no content length, the end of the stream is the end of the connection
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        for idx, chunk in enumerate(chunks):
+            if idx > 0:
+                time.sleep(interval)
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def send_failure(self, api, outcome):
+        retry_after = str(self.provider.args.retry_after)
+        if api == 'bedrock':
+            if outcome == 'rate_limit':
+                self.send_json(429, {'message': 'Too many requests, please wait before trying again.'},
+                               {'x-amzn-ErrorType': 'ThrottlingException', 'Retry-After': retry_after})
+            else:
+                self.send_json(500, {'message': 'mock internal error'}, {'x-amzn-ErrorType': 'InternalServerException'})
+        elif api == 'gemini':
+            if outcome == 'rate_limit':
+                self.send_json(429, {'error': {'code': 429, 'message': 'Resource exhausted.', 'status': 'RESOURCE_EXHAUSTED'}},
+                               {'Retry-After': retry_after})
+            else:
+                self.send_json(500, {'error': {'code': 500, 'message': 'mock internal error', 'status': 'INTERNAL'}})
+        else:
+            if outcome == 'rate_limit':
+                self.send_json(429, {'error': {'message': 'Rate limit reached.', 'type': 'requests', 'code': 'rate_limit_exceeded'}},
+                               {'Retry-After': retry_after})
+            else:
+                self.send_json(500, {'error': {'message': 'mock internal error', 'type': 'server_error', 'code': None}})
+
+    def do_GET(self):
+        # health checks of the inhouse replica pool (vLLM serves both)
+        path = self.path.split('?')[0]
+        if path == '/health':
+            self.send_json(200, {})
+        elif path.endswith('/models'):
+            self.send_json(200, {'object': 'list', 'data': [{'id': 'mock', 'object': 'model', 'owned_by': 'mock'}]})
+        else:
+            self.send_json(404, {'error': {'message': f'unknown path: {path}'}})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        path = self.path.split('?')[0]
+        if path.endswith('/chat/completions'):
+            api, parse_request = 'openai', parse_openai_request
+        elif BEDROCK_PATH.match(path):
+            api, parse_request = 'bedrock', parse_bedrock_request
+        elif GEMINI_PATH.match(path):
+            api, parse_request = 'gemini', parse_gemini_request
+        else:
+            self.send_json(404, {'error': {'message': f'unknown path: {path}'}})
+            return
+        try:
+            request = json.loads(body or b'{}')
+        except json.JSONDecodeError:
+            self.send_json(400, {'error': {'message': 'invalid json'}})
+            return
+        latency, outcome = self.provider.get_outcome(body)
+        time.sleep(latency)
+        if outcome is not None:
+            self.send_failure(api, outcome)
+            return
+        last_user_text, tools = parse_request(request)
+        answer = self.provider.get_answer(last_user_text, tools, body)
+        if api == 'bedrock':
+            self.send_json(200, to_bedrock_response(answer, body, latency))
+        elif api == 'gemini':
+            self.send_json(200, to_gemini_response(answer, body))
+        elif request.get('stream'):
+            # the sampled latency is the time to the first chunk, the following chunks come every --stream_interval
+            include_usage = (request.get('stream_options') or {}).get('include_usage', False)
+            self.send_event_stream(to_openai_stream_chunks(to_openai_response(answer, body, request.get('model', 'mock')), include_usage),
+                                   self.provider.args.stream_interval)
+        else:
+            self.send_json(200, to_openai_response(answer, body, request.get('model', 'mock')))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--seed', type=int, default=0)
+    # latency is log-normal around the median, sigma 0 gives a fixed latency
+    parser.add_argument('--latency_median', type=float, default=0.5, help='median latency (seconds)')
+    parser.add_argument('--latency_sigma', type=float, default=0.5, help='sigma of the log-normal latency')
+    parser.add_argument('--rate_limit_latency', type=float, default=0.01, help='latency of 429 responses (seconds)')
+    # failures
+    parser.add_argument('--error_rate', type=float, default=0.0, help='probability of a 500 response')
+    parser.add_argument('--rate_limit_rate', type=float, default=0.0, help='probability of a 429 response')
+    parser.add_argument('--burst_every', type=int, default=0, help='start a 429 burst every N requests (0: no bursts)')
+    parser.add_argument('--burst_length', type=int, default=0, help='number of requests rejected with 429 in each burst')
+    parser.add_argument('--retry_after', type=int, default=1, help='Retry-After of 429 responses (seconds)')
+    # answers
+    parser.add_argument('--tool_call_rate', type=float, default=1.0, help='probability of answering with a tool call when tools are given')
+    parser.add_argument('--canned_path', default=None, help='jsonl of canned answers matched against the last user message')
+    parser.add_argument('--stream_interval', type=float, default=0.02, help='seconds between the chunks of a streamed openai response')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    MockProviderHandler.provider = MockProvider(args)
+    server = ThreadingHTTPServer((args.host, args.port), MockProviderHandler)
+    server.daemon_threads = True
+    print(f"mock provider server on http://{args.host}:{args.port} (openai: /v1/chat/completions, "
+          f"bedrock: /model/{{model_id}}/converse, gemini: .../models/{{model}}:generateContent)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
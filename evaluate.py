@@ -11,19 +11,50 @@ from src.default_click_type import (
     DefaultModelPathPromptOptions,
     DefaultResetPromptOptions,
     DefaultSamplePromptOptions,
+    DefaultSampleFracPromptOptions,
+    DefaultSampleNPromptOptions,
     DefaultDebugPromptOptions,
     DefaultGPidPromptOptions,
     DefaultGLocPromptOptions,
     DefaultApiKeyPromptOptions,
-    DefaultUseAsyncPromptOptions
+    DefaultUseAsyncPromptOptions,
+    DefaultTargetCiWidthPromptOptions,
+    DefaultRejectBelowPromptOptions,
+    DefaultEvalFormatPromptOptions,
+    DefaultTracePromptOptions,
+    DefaultProfilePromptOptions,
+    DefaultRecordPromptOptions,
+    DefaultReplayPromptOptions,
+    DefaultReplayLatencyScalePromptOptions,
+    DefaultPlanPromptOptions,
+    DefaultLatencyBenchPromptOptions,
+    DefaultDialogStickyPromptOptions,
+    DefaultBedrockPromptCachePromptOptions,
+    DefaultHttp2PromptOptions,
+    DefaultRequestTimeoutPromptOptions,
+    DefaultCallTimeoutPromptOptions,
+    DefaultHedgePromptOptions,
+    DefaultAutotunePromptOptions,
+    DefaultRetryErrorsPromptOptions
 )
 
 # .env 파일 로드
 dotenv.load_dotenv()
 
 from src.payload_creator import PayloadCreatorFactory
-from src.response_handler import ResponseHandler
+from src.response_handler import ResponseHandler, get_model_concurrency
 from src.evaluation_handler import EvaluationHandler
+from src.sequential_handler import SequentialEvaluationHandler
+from src.evaluation_registor import compare_eval_outputs
+from src.sampling_utils import stratified_sample
+from src.run_directory import RunDirectory, get_run_config
+from src.metrics_collector import MetricsCollector
+from src.trace_recorder import tracing
+from src.stage_profiler import profiling
+from src.cassette import get_cassette
+from src.run_planner import plan_run
+from src.openai_utils import configure_http_pool
+from src.autotuner import get_autotuner
 
 
 REPO_PATH = os.path.dirname(os.path.abspath(__file__))
@@ -43,12 +74,15 @@ def default_eval_options(f):
     f = click.option('--input_path', prompt='input file path', help='golden set file name (*.jsonl)')(f)
     # test option
     f = click.option('--reset', prompt='recreate request file', help='reset request file', cls=DefaultResetPromptOptions)(f)
+    f = click.option('--retry_errors', prompt='retry errors', help='re-run only the responses tagged as an error, then re-judge only the affected items', is_flag=True, default=False, cls=DefaultRetryErrorsPromptOptions)(f)
     f = click.option('--sample', prompt='Run only 1 case.', help='run sample', cls=DefaultSamplePromptOptions)(f)
+    f = click.option('--sample_frac', prompt='sample fraction', help='run a stratified, seeded sample of this fraction of requests', cls=DefaultSampleFracPromptOptions)(f)
+    f = click.option('--sample_n', prompt='sample size', help='run a stratified, seeded sample of this many requests', cls=DefaultSampleNPromptOptions)(f)
     f = click.option('--debug', prompt='debug flag', help='debugging', cls=DefaultDebugPromptOptions)(f)
     # openai type
     f = click.option('--temperature', prompt='temperature', help='generate temperature', default=0.1)(f)
-    f = click.option('--api_key', prompt='model api key', help='api key', cls=DefaultApiKeyPromptOptions)(f)
-    f = click.option('--base_url', prompt='model api url', help='base url', cls=DefaultBaseUrlPromptOptions)(f)
+    f = click.option('--api_key', prompt='model api key', help='api key (comma separated for an openai / azure key pool)', cls=DefaultApiKeyPromptOptions)(f)
+    f = click.option('--base_url', prompt='model api url', help='base url (comma separated for a pool of inhouse replicas)', cls=DefaultBaseUrlPromptOptions)(f)
     # openai - hosting server type
     f = click.option('--model_path', prompt='inhouse model path', help='model path in header', cls=DefaultModelPathPromptOptions)(f)
     # gemini
@@ -56,24 +90,50 @@ def default_eval_options(f):
     f = click.option('--gcloud_location', prompt='gemini location', help='google cloud location', cls=DefaultGLocPromptOptions)(f)
     # bedrock
     f = click.option('--aws_secret_key', prompt='aws secret key', help='AWS Secret Access Key', default=None)(f)
-    f = click.option('--aws_region', prompt='aws region', help='AWS Region', default='us-west-2')(f)
+    f = click.option('--aws_region', prompt='aws region', help='AWS Region (comma separated for a region pool)', default='us-west-2')(f)
     f = click.option('--bedrock_model_id', prompt='bedrock model id', help='Bedrock Model ID', default='anthropic.claude-3-sonnet-20240229-v1:0')(f)
+    f = click.option('--bedrock_prompt_cache', prompt='bedrock prompt cache', help='add Bedrock cachePoints after the system prompt and the tool list (models with prompt caching only)', is_flag=True, default=False, cls=DefaultBedrockPromptCachePromptOptions)(f)
     # batch processing
     f = click.option('--batch_size', prompt='batch size', help='Batch processing size', default=1, type=int)(f)
     f = click.option('--use_async', prompt='use async', help='Use async processing', is_flag=True, default=False, cls=DefaultUseAsyncPromptOptions)(f)
+    f = click.option('--autotune', prompt='autotune', help='tune the concurrency of the model and judge calls from their latency and errors, batch_size being its ceiling (32 if not set)', is_flag=True, default=False, cls=DefaultAutotunePromptOptions)(f)
+    # http connection pool of the openai compatible clients
+    f = click.option('--http2', prompt='http2', help='negotiate HTTP/2 with the openai compatible servers (requires h2)', is_flag=True, default=False, cls=DefaultHttp2PromptOptions)(f)
+    f = click.option('--request_timeout', prompt='request timeout', help='seconds before an openai compatible call times out (default 600)', cls=DefaultRequestTimeoutPromptOptions)(f)
+    # deadline and hedging of the provider calls
+    f = click.option('--call_timeout', prompt='call timeout', help='seconds before a model or judge call, retries included, fails', cls=DefaultCallTimeoutPromptOptions)(f)
+    f = click.option('--hedge', prompt='hedge', help='send a duplicate of the calls slower than the rolling p95 latency of their provider, the first answer wins', is_flag=True, default=False, cls=DefaultHedgePromptOptions)(f)
     # evaluation
     f = click.option('--only_exact', prompt='evaluate exact match', help='only exact match(True, False)', cls=DefaultDebugPromptOptions)(f)
     # judge model settings
     f = click.option('--judge_type', prompt='judge type', help='judge type (openai, azure, bedrock)', default='bedrock')(f)
-    f = click.option('--judge_api_key', prompt='judge api key', help='judge api key', default=None)(f)
+    f = click.option('--judge_api_key', prompt='judge api key', help='judge api key (comma separated for an openai / azure key pool)', default=None)(f)
     f = click.option('--judge_aws_secret_key', prompt='judge aws secret key', help='Judge AWS Secret Access Key', default=None)(f)
-    f = click.option('--judge_aws_region', prompt='judge aws region', help='Judge AWS Region', default='us-west-2')(f)
+    f = click.option('--judge_aws_region', prompt='judge aws region', help='Judge AWS Region (comma separated for a region pool)', default='us-west-2')(f)
     f = click.option('--judge_bedrock_model_id', prompt='judge bedrock model id', help='Judge Bedrock Model ID', default='anthropic.claude-3-sonnet-20240229-v1:0')(f)
+    # sequential early-stopping evaluation
+    f = click.option('--target_ci_width', prompt='target ci width', help='stop once the 95% CI of the pass rate is narrower than this', cls=DefaultTargetCiWidthPromptOptions)(f)
+    f = click.option('--reject_below', prompt='reject below', help='stop once the pass rate is provably below this threshold', cls=DefaultRejectBelowPromptOptions)(f)
+    # evaluation record format
+    f = click.option('--eval_format', prompt='eval format', help='full: embed requests in eval records, slim: reference requests by key', cls=DefaultEvalFormatPromptOptions)(f)
+    # chrome trace-event export
+    f = click.option('--trace', prompt='trace file', help='write Chrome trace events of the run to this file (chrome://tracing, ui.perfetto.dev)', cls=DefaultTracePromptOptions)(f)
+    # stage profiling
+    f = click.option('--profile', prompt='profiler', help='profile the payload, generation and judge stages (cprofile, pyinstrument)', cls=DefaultProfilePromptOptions)(f)
+    # record / replay of provider calls
+    f = click.option('--record', prompt='record cassette', help='record the model and judge calls into this cassette file', cls=DefaultRecordPromptOptions)(f)
+    f = click.option('--replay', prompt='replay cassette', help='replay the model and judge calls from this cassette file instead of calling the providers', cls=DefaultReplayPromptOptions)(f)
+    f = click.option('--replay_latency_scale', prompt='replay latency scale', help='0: replay without waiting, 1: wait the recorded latency, 0.5: half of it', cls=DefaultReplayLatencyScalePromptOptions)(f)
+    # dry run
+    f = click.option('--plan', prompt='plan only', help='estimate the calls, input tokens and wall time of the run without calling any provider', is_flag=True, default=False, cls=DefaultPlanPromptOptions)(f)
+    # streaming latency benchmark
+    f = click.option('--latency_bench', prompt='latency bench', help='stream the model calls and report time to first token, time to tool call and total time', is_flag=True, default=False, cls=DefaultLatencyBenchPromptOptions)(f)
     return f
 
 
 def dialog_eval_options(f):
     f = click.option('--system_prompt_path', prompt='system_prompt_path', help='system prompt file path')(f)
+    f = click.option('--dialog_sticky', prompt='dialog sticky', help='run the turns of each dialog back to back on the same replica / key / region (prefix cache reuse), batch_size dialogs in parallel', is_flag=True, default=False, cls=DefaultDialogStickyPromptOptions)(f)
     return f
 
 
@@ -83,133 +143,201 @@ def singlecall_eval_options(f):
     return f
 
 
+def get_sampled_requests(eval_type, api_request_list, sample_n, sample_frac):
+    if sample_n is not None or sample_frac is not None:
+        sampled_indices = stratified_sample(api_request_list, eval_type, sample_n=sample_n, sample_frac=sample_frac)
+        print(f"[[stratified sample : {len(sampled_indices)}/{len(api_request_list)}]]")
+        api_request_list = [api_request_list[idx] for idx in sampled_indices]
+    return api_request_list
+
+
+def plan_evaluation(eval_type, payload_creator, payload_kwargs, run_directory, predict_file_path, eval_file_path,
+                    model, batch_size, use_async, only_exact, sample_n, sample_frac):
+    # builds the payloads and estimates the run, without writing any run file or calling any provider
+    api_request_list = payload_creator.create_payload(save_request_file=False, **payload_kwargs)
+    api_request_list = get_sampled_requests(eval_type, api_request_list, sample_n, sample_frac)
+    plan_run(eval_type, api_request_list, run_directory, predict_file_path, eval_file_path,
+             model, batch_size, use_async, only_exact)
+
+
+def run_evaluation(eval_type, api_request_list, response_handler, evaluation_handler,
+                   predict_file_path, eval_file_path, eval_log_file_path,
+                   reset, sample, debug, only_exact, target_ci_width, reject_below,
+                   sample_n, sample_frac, retry_errors=False):
+    api_request_list = get_sampled_requests(eval_type, api_request_list, sample_n, sample_frac)
+    if target_ci_width is not None or reject_below is not None:
+        SequentialEvaluationHandler(
+            eval_type, response_handler, evaluation_handler,
+            target_ci_width=target_ci_width, reject_below=reject_below,
+            step_size=max(response_handler.batch_size, 20)
+        ).evaluate(
+            api_request_list, predict_file_path,
+            eval_file_path, eval_log_file_path,
+            reset, debug, only_exact, retry_errors
+        )
+        return
+    api_response_list = response_handler.fetch_and_save(
+        api_request_list, predict_file_path, reset, sample, debug, retry_errors
+    )
+    evaluation_handler.evaluate(
+        api_request_list, api_response_list,
+        eval_file_path, eval_log_file_path,
+        reset, sample, debug, only_exact, retry_errors
+    )
+
+
+def get_output_tag(model, target_ci_width, reject_below, sample_n, sample_frac, latency_bench=False):
+    output_tag = model
+    # sampled and sequential runs hold other requests or another order, so they must not share files with full runs
+    if sample_n is not None:
+        output_tag += f'.sample-n{sample_n}'
+    elif sample_frac is not None:
+        output_tag += f'.sample-f{sample_frac:g}'
+    if target_ci_width is not None or reject_below is not None:
+        output_tag += '.sequential'
+    # streamed responses are timed, they must not be resumed from the responses of a non-streaming run
+    if latency_bench:
+        output_tag += '.latency-bench'
+    return output_tag
+
+
+def get_run_directory(eval_type, run_name):
+    # every option of the running command is part of the run configuration, except secrets
+    config = get_run_config(eval_type, click.get_current_context().params)
+    return RunDirectory(f'{REPO_PATH}/output', run_name, config)
+
+
+def configure_connections(params):
+    # one connection per concurrent model call and per concurrent judge call (two when hedged), all kept alive for the whole run
+    model_concurrency = get_model_concurrency(params['batch_size'], params['use_async'], params.get('dialog_sticky', False), params['autotune'])
+    judge_concurrency = get_autotuner(params['autotune'], params['batch_size']).max_concurrency if params['autotune'] else 1
+    configure_http_pool(max_connections=(model_concurrency + judge_concurrency) * (2 if params['hedge'] else 1),
+                        http2=params['http2'], request_timeout=params['request_timeout'])
+
+
+def build_handlers(eval_type, metrics_collector, cassette):
+    """
+    Builds the model and judge handlers from the options of the running command,
+    after the HTTP connection pool they share is sized for the concurrent calls of both stages.
+
+    Returns:
+        tuple: (ResponseHandler, EvaluationHandler)
+    """
+    params = click.get_current_context().params
+    configure_connections(params)
+    response_handler = ResponseHandler(
+        params['model'], params['api_key'], params['base_url'], params['model_path'],
+        params['gcloud_project_id'], params['gcloud_location'],
+        params['aws_secret_key'], params['aws_region'], params['bedrock_model_id'],
+        params['batch_size'], params['use_async'], metrics_collector, cassette, params['latency_bench'],
+        params.get('dialog_sticky', False), bedrock_prompt_cache=params['bedrock_prompt_cache'],
+        call_timeout=params['call_timeout'], hedge=params['hedge'], autotune=params['autotune']
+    )
+    evaluation_handler = EvaluationHandler(eval_type, params['judge_type'], params['judge_api_key'], params['judge_aws_secret_key'],
+                                           params['judge_aws_region'], params['judge_bedrock_model_id'],
+                                           params['eval_format'], metrics_collector, cassette, params['call_timeout'], params['hedge'],
+                                           autotune=params['autotune'], batch_size=params['batch_size'])
+    return response_handler, evaluation_handler
+
+
+def evaluate_command(eval_type, test_prefix, payload_creator_args, run_name_suffix='', only_exact=None, **payload_kwargs):
+    """
+    Runs the payload, generation and judge stages of an evaluation command (dialog, singlecall, common).
+
+    Parameters:
+        eval_type (str): The evaluation type, the name of the command.
+        test_prefix (str): The prefix of the run files.
+        payload_creator_args (tuple): The arguments of the payload creator after eval_type (temperature, system prompt path).
+        run_name_suffix (str): Appended to the run name (e.g. the tools type).
+        only_exact (bool, optional): Overrides --only_exact.
+        payload_kwargs: Extra arguments of create_payload (e.g. tools_type).
+    """
+    params = click.get_current_context().params
+    if only_exact is None:
+        only_exact = params['only_exact']
+    utils.create_directory(f'{REPO_PATH}/output/')
+
+    output_tag = get_output_tag(params['model'], params['target_ci_width'], params['reject_below'],
+                                params['sample_n'], params['sample_frac'], params['latency_bench'])
+    run_name = f'{test_prefix}.{output_tag}{run_name_suffix}'
+    run_directory = get_run_directory(eval_type, run_name)
+    request_file_path = run_directory.get_file_path(f'{test_prefix}.input.jsonl')
+    predict_file_path = run_directory.get_file_path(f'{run_name}.output.jsonl')
+    eval_file_path = run_directory.get_file_path(f'{run_name}.eval.jsonl')
+    eval_log_file_path = run_directory.get_file_path(f'{run_name}.eval_report.tsv')
+
+    payload_kwargs = dict(input_file_path=params['input_path'], request_file_path=request_file_path,
+                          reset=params['reset'], compiled_dir=f'{REPO_PATH}/output', **payload_kwargs)
+    if params['plan']:
+        plan_evaluation(eval_type, PayloadCreatorFactory.get_payload_creator(eval_type, *payload_creator_args),
+                        payload_kwargs, run_directory, predict_file_path, eval_file_path,
+                        params['model'], params['batch_size'], params['use_async'], only_exact,
+                        params['sample_n'], params['sample_frac'])
+        return
+
+    with run_directory, tracing(params['trace']), profiling(params['profile'], run_directory.path, run_name) as stage_profiler:
+        metrics_collector = MetricsCollector(stage_profiler=stage_profiler)
+        cassette = get_cassette(params['record'], params['replay'], params['replay_latency_scale'])
+        with metrics_collector.stage('payload'):
+            api_request_list = PayloadCreatorFactory.get_payload_creator(
+                eval_type, *payload_creator_args
+            ).create_payload(**payload_kwargs)
+        response_handler, evaluation_handler = build_handlers(eval_type, metrics_collector, cassette)
+        run_evaluation(
+            eval_type, api_request_list, response_handler, evaluation_handler,
+            predict_file_path, eval_file_path, eval_log_file_path,
+            params['reset'], params['sample'], params['debug'], only_exact,
+            params['target_ci_width'], params['reject_below'],
+            params['sample_n'], params['sample_frac'], params['retry_errors']
+        )
+
+
 # program command
 @cli.command()
 @default_eval_options
 @dialog_eval_options
-def dialog(model,
-           input_path, system_prompt_path,
-           temperature, api_key, base_url, model_path,
-           reset, sample, debug,
-           gcloud_project_id, gcloud_location, 
-           aws_secret_key, aws_region, bedrock_model_id,
-           batch_size, use_async, only_exact,
-           judge_type, judge_api_key, judge_aws_secret_key, judge_aws_region, judge_bedrock_model_id):
+def dialog(model, input_path, system_prompt_path, temperature, **params):
     eval_type = inspect.stack()[0][3]
     TEST_PREFIX = f'FunctionChat-{eval_type.capitalize()}'
 
     print(f"[[{model} {TEST_PREFIX} evaluate start]]")
-    utils.create_directory(f'{REPO_PATH}/output/')
-
-    request_file_path = f'{REPO_PATH}/output/{TEST_PREFIX}.input.jsonl'
-    predict_file_path = f'{REPO_PATH}/output/{TEST_PREFIX}.{model}.output.jsonl'
-    eval_file_path = f'{REPO_PATH}/output/{TEST_PREFIX}.{model}.eval.jsonl'
-    eval_log_file_path = f'{REPO_PATH}/output/{TEST_PREFIX}.{model}.eval_report.tsv'
-
-    api_request_list = PayloadCreatorFactory.get_payload_creator(
-        eval_type, temperature, system_prompt_path
-    ).create_payload(
-        input_file_path=input_path, request_file_path=request_file_path, reset=reset)
-    api_response_list = ResponseHandler(
-        model, api_key, base_url, model_path, 
-        gcloud_project_id, gcloud_location,
-        aws_secret_key, aws_region, bedrock_model_id,
-        batch_size, use_async
-    ).fetch_and_save(
-        api_request_list, predict_file_path, reset, sample, debug
-    )
-    EvaluationHandler(eval_type, judge_type, judge_api_key, judge_aws_secret_key, judge_aws_region, judge_bedrock_model_id).evaluate(
-        api_request_list, api_response_list,
-        eval_file_path, eval_log_file_path,
-        reset, sample, debug
-    )
+    evaluate_command(eval_type, TEST_PREFIX, (temperature, system_prompt_path), only_exact=False)
 
 
 @cli.command()
 @default_eval_options
 @singlecall_eval_options
-def singlecall(model,
-               input_path, tools_type,
-               system_prompt_path,
-               temperature, api_key, base_url, model_path,
-               reset, sample, debug, only_exact,
-               gcloud_project_id, gcloud_location,
-               aws_secret_key, aws_region, bedrock_model_id,
-               batch_size, use_async,
-               judge_type, judge_api_key, judge_aws_secret_key, judge_aws_region, judge_bedrock_model_id):
-
+def singlecall(model, input_path, tools_type, system_prompt_path, temperature, **params):
     eval_type = inspect.stack()[0][3]
     TEST_PREFIX = f'FunctionChat-{eval_type.capitalize()}'
 
     print(f"[[{model} {TEST_PREFIX} {tools_type} evaluate start]]")
-    utils.create_directory(f'{REPO_PATH}/output/')
-
-    request_file_path = f'{REPO_PATH}/output/{TEST_PREFIX}.input.jsonl'
-    predict_file_path = f'{REPO_PATH}/output/{TEST_PREFIX}.{model}.{tools_type}.output.jsonl'
-    eval_file_path = f'{REPO_PATH}/output/{TEST_PREFIX}.{model}.{tools_type}.eval.jsonl'
-    eval_log_file_path = f'{REPO_PATH}/output/{TEST_PREFIX}.{model}.{tools_type}.eval_report.tsv'
-
-    api_request_list = PayloadCreatorFactory.get_payload_creator(
-        eval_type, temperature, system_prompt_path
-    ).create_payload(
-        input_file_path=input_path, request_file_path=request_file_path,
-        reset=reset, tools_type=tools_type
-    )
-    api_response_list = ResponseHandler(
-        model, api_key, base_url, model_path,
-        gcloud_project_id, gcloud_location,
-        aws_secret_key, aws_region, bedrock_model_id,
-        batch_size, use_async
-    ).fetch_and_save(
-        api_request_list, predict_file_path, reset, sample, debug
-    )
-    EvaluationHandler(eval_type, judge_type, judge_api_key, judge_aws_secret_key, judge_aws_region, judge_bedrock_model_id).evaluate(
-        api_request_list, api_response_list,
-        eval_file_path, eval_log_file_path,
-        reset, sample, debug, only_exact
-    )
+    evaluate_command(eval_type, TEST_PREFIX, (temperature, system_prompt_path), run_name_suffix=f'.{tools_type}', tools_type=tools_type)
 
 
 @cli.command()
 @default_eval_options
-def common(model, input_path,
-           temperature, api_key, base_url, model_path,
-           reset, sample, debug, only_exact,
-           gcloud_project_id, gcloud_location,
-           aws_secret_key, aws_region, bedrock_model_id,
-           batch_size, use_async,
-           judge_type, judge_api_key, judge_aws_secret_key, judge_aws_region, judge_bedrock_model_id):
-
+def common(model, input_path, temperature, **params):
     eval_type = inspect.stack()[0][3]
     TEST_PREFIX = os.path.splitext(os.path.basename(input_path))[0]
 
     print(f"[[{model} {TEST_PREFIX} evaluate start]]")
-    utils.create_directory(f'{REPO_PATH}/output/')
+    evaluate_command(eval_type, TEST_PREFIX, (temperature,))
 
-    request_file_path = f'{REPO_PATH}/output/{TEST_PREFIX}.input.jsonl'
-    predict_file_path = f'{REPO_PATH}/output/{TEST_PREFIX}.{model}.output.jsonl'
-    eval_file_path = f'{REPO_PATH}/output/{TEST_PREFIX}.{model}.eval.jsonl'
-    eval_log_file_path = f'{REPO_PATH}/output/{TEST_PREFIX}.{model}.eval_report.tsv'
 
-    api_request_list = PayloadCreatorFactory.get_payload_creator(
-        eval_type, temperature
-    ).create_payload(
-        input_file_path=input_path, request_file_path=request_file_path,
-        reset=reset
-    )
-    api_response_list = ResponseHandler(
-        model, api_key, base_url, model_path,
-        gcloud_project_id, gcloud_location,
-        aws_secret_key, aws_region, bedrock_model_id,
-        batch_size, use_async
-    ).fetch_and_save(
-        api_request_list, predict_file_path, reset, sample, debug
-    )
-    EvaluationHandler(eval_type, judge_type, judge_api_key, judge_aws_secret_key, judge_aws_region, judge_bedrock_model_id).evaluate(
-        api_request_list, api_response_list,
-        eval_file_path, eval_log_file_path,
-        reset, sample, debug, only_exact
-    )
+@cli.command()
+@click.option('--base_eval_path', prompt='base eval file path', help='baseline evaluation result file (*.eval.jsonl)')
+@click.option('--target_eval_path', prompt='target eval file path', help='compared evaluation result file (*.eval.jsonl)')
+def compare(base_eval_path, target_eval_path):
+    print(f"[[compare {base_eval_path} -> {target_eval_path}]]")
+    result = compare_eval_outputs(utils.load_to_jsonl(base_eval_path), utils.load_to_jsonl(target_eval_path))
+    bootstrap = result['bootstrap']
+    mcnemar = result['mcnemar']
+    print(f"* paired count : {result['paired_count']}")
+    print(f"* pass rate : {result['base_pass_rate']:.4f} -> {result['target_pass_rate']:.4f}")
+    print(f"* difference : {bootstrap['difference']:+.4f} [{bootstrap['lower']:+.4f}, {bootstrap['upper']:+.4f}] (bootstrap 95% CI)")
+    print(f"* mcnemar ({mcnemar['method']}) : only base pass {mcnemar['only_a']}, only target pass {mcnemar['only_b']}, "
+          f"statistic {mcnemar['statistic']:.4f}, p-value {mcnemar['p_value']:.4f}")
 
 
 if __name__ == '__main__':
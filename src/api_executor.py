@@ -1,23 +1,35 @@
 import sys
 import os
 import json
-import openai
 
 from mistralai.client import MistralClient
 from mistralai.exceptions import MistralAPIException
 
 import vertexai
 
-from src.openai_utils import retry_on_limit
+from src.openai_utils import (
+    OpenaiClientPool,
+    OpenaiReplicaPool,
+    create_chat_completion,
+    create_openai_client,
+    retry_on_limit,
+    record_openai_usage,
+    warm_up_clients
+)
+from src.metrics_collector import record_retry
+from src.formatter import mark_error_response
 from src.gemini_utils import (
     convert_messages_gemini,
     convert_tools_gemini,
     convert_gemini_to_response,
-    call_gemini_model
+    call_gemini_model,
+    record_gemini_usage
 )
 from src.bedrock_utils import (
-    create_bedrock_client,
-    call_bedrock_model
+    BedrockClientPool,
+    call_bedrock_model,
+    is_throttling_error,
+    split_option_list
 )
 
 import qwen_agent
@@ -57,35 +69,44 @@ class OpenaiModelAzureAPI(AbstractModelAPIExecutor):
         Initialize the OpenaiModelAzureAPI class.
 
         Parameters:
-        model (str): The name of the model to use.
-        api_key (str): The API key for authenticating with Azure OpenAI.
-        api_base (str): The base URL for the Azure OpenAI API endpoint.
+        model (str): The name of the model (deployment) to use. Comma separated, one per endpoint, for a deployment pool.
+        api_key (str): The API key for authenticating with Azure OpenAI. Comma separated, one per endpoint, for a key pool.
+        api_base (str): The base URL for the Azure OpenAI API endpoint. Comma separated for an endpoint pool.
         api_version (str): The version of the Azure OpenAI API to use.
         """
         super().__init__(model, api_key)  # 수정된 부분
-        self.client = openai.AzureOpenAI(azure_endpoint=api_base,
-                                         api_key=api_key,
-                                         api_version=api_version)
-        self.openai_chat_completion = retry_on_limit(self.client.chat.completions.create)
+        self.client_pool = OpenaiClientPool(split_option_list(api_key),
+                                            api_bases=split_option_list(api_base),
+                                            models=split_option_list(model),
+                                            api_version=api_version)
+        if len(self.client_pool.members) > 1:
+            print(f"azure openai pool: {[member.name for member in self.client_pool.members]}")
+        self.openai_chat_completion = self.client_pool.create
 
-    def predict(self, api_request):
+    def warm_up(self, connections):
+        self.client_pool.warm_up(connections)
+
+    def predict(self, api_request, stream=False):
         """
         A method get model predictions for a request.
 
         Parameters:
         api_request (dict): The API request data for making predictions.
+        stream (bool): Whether to stream the response and record its timing (--latency_bench).
         """
         response = None
         try_cnt = 0
         while True:
             try:
-                response = self.openai_chat_completion(
+                response = create_chat_completion(
+                    self.openai_chat_completion,
+                    stream,
                     model=self.model,
                     temperature=api_request['temperature'],
                     messages=api_request['messages'],
                     tools=api_request.get('tools')
                 )
-                response = response.model_dump()
+                record_openai_usage(response)
             except Exception as e:
                 print(f".. retry api call .. {try_cnt}")
                 try_cnt += 1
@@ -93,11 +114,15 @@ class OpenaiModelAzureAPI(AbstractModelAPIExecutor):
                 print(json.dumps(api_request['messages'], ensure_ascii=False))
                 if try_cnt >= 3:  # 최대 3번 재시도
                     raise
+                record_retry(e)
                 continue
             else:
                 break
         return response
 
+    def predict_stream(self, api_request):
+        return self.predict(api_request, stream=True)
+
 
 class OpenaiModelAPI(AbstractModelAPIExecutor):
     def __init__(self, model, api_key, use_eval=False):
@@ -106,40 +131,49 @@ class OpenaiModelAPI(AbstractModelAPIExecutor):
 
         Parameters:
         model (str): The name of the model to use.
-        api_key (str): The API key for authenticating with OpenAI.
+        api_key (str): The API key for authenticating with OpenAI. Comma separated for a key pool.
         use_eval (bool): Whether the API is for evaluation.
         """
         super().__init__(model, api_key)  # 수정된 부분
-        self.client = openai.OpenAI(api_key=api_key)
-        self.openai_chat_completion = self.client.chat.completions.create
+        self.client_pool = OpenaiClientPool(split_option_list(api_key))
+        if len(self.client_pool.members) > 1:
+            print(f"openai key pool: {[member.name for member in self.client_pool.members]}")
+        self.openai_chat_completion = self.client_pool.create
         if use_eval is True:
             self.predict = self.predict_eval
         else:
             self.predict = self.predict_tool
 
-    def predict_tool(self, api_request):
+    def warm_up(self, connections):
+        self.client_pool.warm_up(connections)
+
+    def predict_tool(self, api_request, stream=False):
         """
         A method get model predictions for a request.
 
         Parameters:
         api_request (dict): The API request data for making predictions.
+        stream (bool): Whether to stream the response and record its timing (--latency_bench).
         """
         response = None
         try_cnt = 0
         while True:
             try:
-                response = self.openai_chat_completion(
+                response = create_chat_completion(
+                    self.openai_chat_completion,
+                    stream,
                     model=self.model,
                     temperature=api_request['temperature'],
                     messages=api_request['messages'],
                     tools=api_request['tools']
                 )
-                response = response.model_dump()
+                record_openai_usage(response)
             except KeyError as e:
                 print(e)
                 print(json.dumps(api_request['messages'], ensure_ascii=False))
                 sys.exit(1)
             except Exception as e:
+                record_retry(e)
                 print(f".. retry api call .. {try_cnt}")
                 try_cnt += 1
                 print(e)
@@ -150,6 +184,9 @@ class OpenaiModelAPI(AbstractModelAPIExecutor):
         response_output = response['choices'][0]['message']
         return response_output
 
+    def predict_stream(self, api_request):
+        return self.predict_tool(api_request, stream=True)
+
     def predict_eval(self, api_request):
         """
         A method get model predictions for a requests for evaluation purposes.
@@ -167,11 +204,13 @@ class OpenaiModelAPI(AbstractModelAPIExecutor):
                     messages=api_request['messages']
                 )
                 response = response.model_dump()
+                record_openai_usage(response)
             except KeyError as e:
                 print(e)
                 print(json.dumps(api_request['messages'], ensure_ascii=False))
                 sys.exit(1)
             except Exception as e:
+                record_retry(e)
                 print(f".. retry api call .. {try_cnt}")
                 try_cnt += 1
                 print(e)
@@ -193,9 +232,12 @@ class SolarModelAPI(AbstractModelAPIExecutor):
         base_url (str): The base URL for the Solar API endpoint.
         """
         super().__init__(model, api_key)
-        self.client = openai.OpenAI(base_url=base_url, api_key=api_key)
+        self.client = create_openai_client(base_url=base_url, api_key=api_key)
         self.openai_chat_completion = retry_on_limit(self.client.chat.completions.create)
 
+    def warm_up(self, connections):
+        warm_up_clients([self.client], connections)
+
     def predict(self, api_request):
         """
         A method get model predictions for a request.
@@ -214,7 +256,9 @@ class SolarModelAPI(AbstractModelAPIExecutor):
                     tools=api_request['tools']
                 )
                 response = response.model_dump()
+                record_openai_usage(response)
             except Exception as e:
+                record_retry(e)
                 print(f".. retry api call .. {try_cnt}")
                 try_cnt += 1
                 print(e)
@@ -272,6 +316,7 @@ class MistralModelAPI(AbstractModelAPIExecutor):
                     tools=api_request['tools']
                 )
                 response = response.model_dump()
+                record_openai_usage(response)
                 print(">> response *", json.dumps(response, ensure_ascii=False))
             except MistralAPIException as e:
                 msg = json.loads(str(e).split('Message:')[1]).get('message')
@@ -279,9 +324,11 @@ class MistralModelAPI(AbstractModelAPIExecutor):
                     api_request['messages'] = self.remove_content_for_toolcalls(api_request['messages'])
                     print(f"[error] {msg}")
                     print(json.dumps(api_request['messages'], ensure_ascii=False))
+                record_retry(e)
                 print(f".. retry api call .. {try_cnt} {msg} {msg == 'Assistant message must have either content or tool_calls, but not both.'}")
                 try_cnt += 1
             except Exception as e:
+                record_retry(e)
                 print(f".. retry api call .. {try_cnt}")
                 try_cnt += 1
                 print(e)
@@ -301,16 +348,19 @@ class InhouseModelAPI(AbstractModelAPIExecutor):
         Parameters:
         model (str): The name of the model to use.
         api_key (str): The API key for authenticating with OpenAI.
-        base_url (str): The base URL for the Inhouse API endpoint.
+        base_url (str): The base URL for the Inhouse API endpoint. Comma separated for a pool of replicas.
         model_path (str): This is the information that needs to be passed in the header when calling the model API.
         """
         super().__init__(model, api_key)
         print(f"base_url: {base_url}")
         print(f"api_key: {api_key}")
-        self.client = openai.OpenAI(base_url=base_url, api_key=api_key)
-        self.openai_chat_completion = retry_on_limit(self.client.chat.completions.create)
+        self.replica_pool = OpenaiReplicaPool(split_option_list(base_url), api_key=api_key)
+        self.openai_chat_completion = retry_on_limit(self.replica_pool.create)
         self.model_path = model_path
 
+    def warm_up(self, connections):
+        self.replica_pool.warm_up(connections)
+
     def predict(self, api_request):
         """
         A method get model predictions for a request.
@@ -329,7 +379,9 @@ class InhouseModelAPI(AbstractModelAPIExecutor):
                     tools=api_request['tools']
                 )
                 response = response.model_dump()
+                record_openai_usage(response)
             except Exception as e:
+                record_retry(e)
                 print(f".. retry api call .. {try_cnt}")
                 try_cnt += 1
                 print(e)
@@ -400,12 +452,13 @@ class GeminiModelAPI(AbstractModelAPIExecutor):
         super().__init__(model, None)
         vertexai.init(project=gcloud_project_id, location=gcloud_location)
 
-    def predict(self, api_request):
+    def predict(self, api_request, stream=False):
         """
         A method get model predictions for a request.
 
         Parameters:
         api_request (dict): The API request data for making predictions.
+        stream (bool): Whether to stream the response and record its timing (--latency_bench).
         """
         try_cnt = 0
         response = None
@@ -421,13 +474,20 @@ class GeminiModelAPI(AbstractModelAPIExecutor):
                     gemini_temperature=gemini_temperature,
                     gemini_system_instruction=gemini_system_instruction,
                     gemini_tools=gemini_tools,
-                    gemini_messages=gemini_messages)
+                    gemini_messages=gemini_messages,
+                    stream=stream)
+                record_gemini_usage(response)
                 gemini_response = response['candidates'][0]
                 if "content" not in gemini_response and gemini_response["finish_reason"] == "SAFETY":
-                    response_output = {"role": "assistant", "content": None, "tool_calls": None}
+                    response_output = mark_error_response({"role": "assistant", "content": None, "tool_calls": None},
+                                                          "gemini: finish_reason SAFETY")
                 else:
                     response_output = convert_gemini_to_response(gemini_response["content"])
+                    # stub of a call_gemini_model that failed with an internal server error
+                    if gemini_response["finish_reason"] == "ERROR":
+                        mark_error_response(response_output, "gemini: finish_reason ERROR")
             except Exception as e:
+                record_retry(e)
                 print(f".. retry api call .. {try_cnt}")
                 try_cnt += 1
                 print(e)
@@ -437,9 +497,12 @@ class GeminiModelAPI(AbstractModelAPIExecutor):
                 break
         return response_output
 
+    def predict_stream(self, api_request):
+        return self.predict(api_request, stream=True)
+
 
 class BedrockModelAPI(AbstractModelAPIExecutor):
-    def __init__(self, model, api_key, aws_secret_key, aws_region, bedrock_model_id):
+    def __init__(self, model, api_key, aws_secret_key, aws_region, bedrock_model_id, prompt_cache=False):
         """
         Bedrock 모델 API 실행기를 초기화합니다.
 
@@ -447,51 +510,76 @@ class BedrockModelAPI(AbstractModelAPIExecutor):
         model (str): 모델 이름
         api_key (str): AWS 액세스 키 ID
         aws_secret_key (str): AWS 시크릿 액세스 키
-        aws_region (str): AWS 리전
-        bedrock_model_id (str): Bedrock 모델 ID
+        aws_region (str): AWS 리전. 쉼표로 구분하면 리전 풀을 사용합니다 (예: "us-east-1,us-west-2")
+        bedrock_model_id (str): Bedrock 모델 ID. 하나 또는 리전별로 쉼표로 구분 (cross-region inference profile ID 가능)
+        prompt_cache (bool): 시스템 프롬프트와 도구 목록 뒤에 cachePoint 를 추가할지 여부 (프롬프트 캐시를 지원하는 모델만)
         """
         super().__init__(model, api_key)
         self.aws_secret_key = aws_secret_key
         self.aws_region = aws_region
         self.bedrock_model_id = bedrock_model_id
-        self.client = create_bedrock_client(
-            region_name=aws_region,
+        self.prompt_cache = prompt_cache
+        self.client_pool = BedrockClientPool(
+            split_option_list(aws_region),
+            split_option_list(bedrock_model_id),
             aws_access_key_id=api_key,
             aws_secret_access_key=aws_secret_key
         )
+        if len(self.client_pool.members) > 1:
+            print(f"bedrock region pool: {[(m.region_name, m.model_id) for m in self.client_pool.members]}")
 
-    def predict(self, api_request):
+    def predict(self, api_request, stream=False):
         """
         요청에 대한 모델 예측을 가져옵니다.
 
         Parameters:
         api_request (dict): 예측을 위한 API 요청 데이터
+        stream (bool): ConverseStream 으로 호출하고 응답 시간을 기록할지 여부 (--latency_bench)
         """
         try_cnt = 0
+        throttle_cnt = 0
         response_output = None
         
         while True:
+            member = self.client_pool.acquire()
             try:
                 response_output = call_bedrock_model(
-                    bedrock_client=self.client,
-                    model_id=self.bedrock_model_id,
+                    bedrock_client=member.client,
+                    model_id=member.model_id,
                     messages=api_request['messages'],
                     tools=api_request.get('tools'),
-                    temperature=api_request['temperature']
+                    temperature=api_request['temperature'],
+                    stream=stream,
+                    prompt_cache=self.prompt_cache
                 )
             except Exception as e:
+                throttled = is_throttling_error(e)
+                self.client_pool.release(member, throttled=throttled)
+                if throttled:
+                    # 스로틀링은 다른 리전으로 넘깁니다 (리전마다 최대 3번)
+                    throttle_cnt += 1
+                    print(f".. throttled in {member.region_name}, failover .. {throttle_cnt}")
+                    if throttle_cnt >= 3 * len(self.client_pool.members):
+                        raise
+                    record_retry(e)
+                    continue
                 print(f".. retry api call .. {try_cnt}")
                 try_cnt += 1
                 print(e)
                 print(json.dumps(api_request['messages'], ensure_ascii=False))
                 if try_cnt >= 3:  # 최대 3번 재시도
                     raise
+                record_retry(e)
                 continue
             else:
+                self.client_pool.release(member)
                 break
                 
         return response_output
 
+    def predict_stream(self, api_request):
+        return self.predict(api_request, stream=True)
+
 
 class APIExecutorFactory:
     """
@@ -500,7 +588,7 @@ class APIExecutorFactory:
 
     @staticmethod
     def get_model_api(model_name, api_key=None, model_path=None, base_url=None, gcloud_project_id=None, gcloud_location=None, 
-                     aws_secret_key=None, aws_region=None, bedrock_model_id=None):
+                     aws_secret_key=None, aws_region=None, bedrock_model_id=None, bedrock_prompt_cache=False):
         """
         Creates and returns an API executor for a given model by identifying the type of model and initializing the appropriate API class.
 
@@ -514,6 +602,7 @@ class APIExecutorFactory:
             aws_secret_key (str, optional): AWS 시크릿 액세스 키 (Bedrock 모델용)
             aws_region (str, optional): AWS 리전 (Bedrock 모델용)
             bedrock_model_id (str, optional): Bedrock 모델 ID
+            bedrock_prompt_cache (bool, optional): Bedrock 프롬프트 캐시 cachePoint 사용 여부
 
         Returns:
             An instance of an API executor for the specified model.
@@ -542,6 +631,6 @@ class APIExecutorFactory:
         elif model_name.startswith('gemini'):  # Google developed model
             return GeminiModelAPI(model_name, gcloud_project_id=gcloud_project_id, gcloud_location=gcloud_location)
         elif model_name.startswith('bedrock'):  # AWS Bedrock model
-            return BedrockModelAPI(model_name, api_key, aws_secret_key, aws_region, bedrock_model_id)
+            return BedrockModelAPI(model_name, api_key, aws_secret_key, aws_region, bedrock_model_id, prompt_cache=bedrock_prompt_cache)
         else:
             raise ValueError("Unsupported model name")
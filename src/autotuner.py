@@ -0,0 +1,122 @@
+import numpy as np
+from collections import deque
+"""
+This is a package that tunes the number of concurrent provider calls of a stage from the latency, throughput and errors
+of its batches (--autotune), instead of a fixed --batch_size.
+"""
+
+# ceiling of the concurrency when --batch_size does not set one
+AUTOTUNE_MAX_CONCURRENCY = 32
+# calls queued at the provider (vegas: concurrency * (1 - base latency / latency)) below ALPHA raise the concurrency, above BETA lower it
+VEGAS_ALPHA = 1.0
+VEGAS_BETA = 3.0
+# a batch whose throughput fell by more than this share does not raise the concurrency
+THROUGHPUT_NOISE = 0.1
+DECREASE_FACTOR = 0.5
+# the base latency is the lowest batch latency of the recent batches, so that it follows a provider that gets slower
+BASE_LATENCY_WINDOW = 30
+SETTLE_WINDOW = 10
+
+
+class ConcurrencyAutotuner:
+    """
+    A class that sets the concurrency of the next batch of provider calls, in the style of TCP Vegas and AIMD.
+
+    * slow start : the concurrency doubles after every clean batch, until the first back-off.
+    * errors (failed or retried calls) : the concurrency is halved.
+    * latency inflation : when the calls queued at the provider, estimated from the batch median latency against
+      the base latency, exceed VEGAS_BETA, the concurrency goes down by one.
+    * otherwise it goes up by one while the latency stays flat (queued calls below VEGAS_ALPHA) and the throughput does not fall.
+    """
+    def __init__(self, max_concurrency=AUTOTUNE_MAX_CONCURRENCY, min_concurrency=1, initial_concurrency=1):
+        """
+        Initializes the ConcurrencyAutotuner.
+
+        Parameters:
+            max_concurrency (int): The highest concurrency.
+            min_concurrency (int): The lowest concurrency.
+            initial_concurrency (int): The concurrency of the first batch.
+        """
+        self.max_concurrency = max(max_concurrency, min_concurrency)
+        self.min_concurrency = min_concurrency
+        self.concurrency = min(max(initial_concurrency, min_concurrency), self.max_concurrency)
+        self.slow_start = True
+        self.batch_latencies = deque(maxlen=BASE_LATENCY_WINDOW)
+        self.last_throughput = None
+        self.history = []
+
+    def get_concurrency(self):
+        return self.concurrency
+
+    def update(self, request_metrics, wall_time):
+        """
+        Adjusts the concurrency after a batch.
+
+        Parameters:
+            request_metrics (list): The request metrics of the provider calls of the batch (MetricsCollector).
+            wall_time (float): The wall time of the batch (seconds).
+
+        Returns:
+            int: The concurrency of the next batch.
+        """
+        if len(request_metrics) == 0 or wall_time <= 0:
+            return self.concurrency
+        latency = float(np.median([m['latency'] for m in request_metrics]))
+        throughput = len(request_metrics) / wall_time
+        errors = sum(m['retries'] + (1 if m['error_class'] else 0) for m in request_metrics)
+        self.batch_latencies.append(latency)
+        base_latency = min(self.batch_latencies)
+        queued = self.concurrency * (1 - base_latency / latency) if latency > 0 else 0.0
+        concurrency = self.concurrency
+        if errors > 0:
+            decision = 'errors'
+            self.slow_start = False
+            concurrency = int(concurrency * DECREASE_FACTOR)
+        elif queued > VEGAS_BETA:
+            decision = 'latency'
+            self.slow_start = False
+            concurrency -= 1
+        elif queued < VEGAS_ALPHA and (self.last_throughput is None or throughput >= self.last_throughput * (1 - THROUGHPUT_NOISE)):
+            decision = 'increase'
+            concurrency = concurrency * 2 if self.slow_start else concurrency + 1
+        else:
+            decision = 'hold'
+        self.history.append({'concurrency': self.concurrency, 'calls': len(request_metrics), 'latency': latency,
+                             'base_latency': base_latency, 'throughput': throughput, 'errors': errors, 'decision': decision})
+        self.last_throughput = throughput
+        self.concurrency = min(max(concurrency, self.min_concurrency), self.max_concurrency)
+        return self.concurrency
+
+    def get_settled_concurrency(self):
+        if len(self.history) == 0:
+            return self.concurrency
+        return int(np.median([h['concurrency'] for h in self.history[-SETTLE_WINDOW:]]))
+
+    def get_report(self):
+        """
+        Returns:
+            dict: the concurrency settled on (median of the last batches), its range, and the batch history.
+        """
+        concurrencies = [h['concurrency'] for h in self.history] or [self.concurrency]
+        return {
+            'settled_concurrency': self.get_settled_concurrency(),
+            'min_concurrency': min(concurrencies),
+            'max_concurrency': max(concurrencies),
+            'concurrency_ceiling': self.max_concurrency,
+            'batches': len(self.history),
+            'backoffs': {decision: sum(1 for h in self.history if h['decision'] == decision) for decision in ('errors', 'latency')},
+            'base_latency': min(self.batch_latencies) if self.batch_latencies else None,
+            'history': self.history,
+        }
+
+
+def get_autotuner(autotune, batch_size=1):
+    """
+    Creates the autotuner of a stage from the --autotune / --batch_size options.
+
+    Returns:
+        ConcurrencyAutotuner or None: None without --autotune. --batch_size, if above 1, is the ceiling of the concurrency.
+    """
+    if not autotune:
+        return None
+    return ConcurrencyAutotuner(max_concurrency=batch_size if batch_size > 1 else AUTOTUNE_MAX_CONCURRENCY)
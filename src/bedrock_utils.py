@@ -3,13 +3,24 @@ Bedrock API 호출을 위한 유틸리티 함수
 """
 
 import json
+import time
+import threading
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 import logging
+from src.metrics_collector import record_usage, record_stream_event
+from src.sticky_routing import StickyRoutes
+from src.formatter import mark_error_response
 
 logger = logging.getLogger(__name__)
 
-def create_bedrock_client(region_name, aws_access_key_id=None, aws_secret_access_key=None):
+# 리전 할당량 초과로 판단하는 오류 코드
+THROTTLING_ERROR_CODES = ('ThrottlingException', 'TooManyRequestsException', 'ServiceQuotaExceededException')
+# 프롬프트 캐시 체크포인트 (앞부분 전체가 캐시됩니다)
+CACHE_POINT = {'cachePoint': {'type': 'default'}}
+
+def create_bedrock_client(region_name, aws_access_key_id=None, aws_secret_access_key=None, config=None):
     """
     Bedrock 클라이언트를 생성합니다.
     
@@ -17,6 +28,7 @@ def create_bedrock_client(region_name, aws_access_key_id=None, aws_secret_access
         region_name (str): AWS 리전 이름
         aws_access_key_id (str, optional): AWS 액세스 키 ID
         aws_secret_access_key (str, optional): AWS 시크릿 액세스 키
+        config (botocore.config.Config, optional): 클라이언트 설정 (재시도 등)
         
     Returns:
         boto3.client: Bedrock 클라이언트
@@ -26,17 +38,158 @@ def create_bedrock_client(region_name, aws_access_key_id=None, aws_secret_access
             service_name='bedrock-runtime',
             region_name=region_name,
             aws_access_key_id=aws_access_key_id,
-            aws_secret_access_key=aws_secret_access_key
+            aws_secret_access_key=aws_secret_access_key,
+            config=config
         )
     else:
         return boto3.client(
             service_name='bedrock-runtime',
-            region_name=region_name
+            region_name=region_name,
+            config=config
         )
 
+def is_throttling_error(error):
+    return isinstance(error, ClientError) and error.response.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES
+
+def split_option_list(value):
+    """
+    쉼표로 구분된 옵션 값을 목록으로 변환합니다. (예: "us-east-1,us-west-2")
+    """
+    if value is None:
+        return [None]
+    return [item.strip() for item in str(value).split(',') if item.strip()] or [None]
+
+
+class BedrockRegionMember:
+    """
+    리전 풀의 한 리전 (클라이언트, 모델 ID, 최근 스로틀링 상태).
+    """
+    def __init__(self, region_name, model_id, client):
+        self.region_name = region_name
+        self.model_id = model_id
+        self.client = client
+        self.in_flight = 0
+        self.throttle_score = 0.0
+        self.throttle_score_updated_at = 0.0
+        self.consecutive_throttles = 0
+        self.cooldown_until = 0.0
+        self.requests = 0
+        self.throttles = 0
+
+
+class BedrockClientPool:
+    """
+    여러 리전(또는 cross-region inference profile)의 Bedrock 클라이언트 풀.
+
+    요청마다 최근 스로틀링이 가장 적고 처리 중인 요청이 가장 적은 리전으로 라우팅합니다.
+    ThrottlingException 을 받은 리전은 cooldown 동안 제외되고 요청은 다른 리전으로 넘어갑니다.
+    """
+    # 스로틀링 점수의 반감기 (초). 점수가 0.05 아래로 내려가면 스로틀링이 없던 리전과 같게 취급합니다
+    THROTTLE_HALF_LIFE = 30.0
+
+    def __init__(self, region_names, model_ids, aws_access_key_id=None, aws_secret_access_key=None,
+                 base_cooldown=1.0, max_cooldown=60.0):
+        """
+        Parameters:
+            region_names (list): AWS 리전 목록
+            model_ids (list): 모델 ID 목록. 하나이면 모든 리전에서 같은 모델 ID (inference profile) 를 사용하고,
+                              리전 수와 같으면 리전별 모델 ID 를 사용합니다.
+            aws_access_key_id (str, optional): AWS 액세스 키 ID
+            aws_secret_access_key (str, optional): AWS 시크릿 액세스 키
+            base_cooldown (float): 첫 스로틀링 후 리전을 제외하는 시간 (초), 연속 스로틀링마다 두 배
+            max_cooldown (float): 최대 제외 시간 (초)
+        """
+        if len(model_ids) == 1:
+            model_ids = model_ids * len(region_names)
+        if len(model_ids) != len(region_names):
+            raise Exception(f"bedrock model ids ({len(model_ids)}) must be one or one per region ({len(region_names)})")
+        # 여러 리전이면 boto3 내부 재시도 대신 바로 다른 리전으로 넘깁니다
+        config = Config(retries={'total_max_attempts': 1}) if len(region_names) > 1 else None
+        self.members = [
+            BedrockRegionMember(region_name, model_id, create_bedrock_client(
+                region_name=region_name,
+                aws_access_key_id=aws_access_key_id,
+                aws_secret_access_key=aws_secret_access_key,
+                config=config
+            ))
+            for region_name, model_id in zip(region_names, model_ids)
+        ]
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self.lock = threading.Lock()
+        self.sticky_routes = StickyRoutes()
+
+    def acquire(self):
+        """
+        가장 여유가 있는 리전을 선택합니다. 세션(sticky_route)에 고정된 리전이 사용 가능하면 그 리전을 선택합니다.
+        모든 리전이 cooldown 중이면 가장 먼저 풀리는 리전을 기다립니다.
+
+        Returns:
+            BedrockRegionMember: 선택된 리전
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                available = [member for member in self.members if member.cooldown_until <= now]
+                if available:
+                    member = self.sticky_routes.get(available) or min(
+                        available, key=lambda m: (round(self.get_throttle_score(m, now), 1), m.in_flight, m.requests))
+                    self.sticky_routes.pin(member)
+                    member.in_flight += 1
+                    member.requests += 1
+                    return member
+                wait = min(member.cooldown_until for member in self.members) - now
+            time.sleep(max(wait, 0.0))
+
+    def get_throttle_score(self, member, now):
+        return member.throttle_score * 0.5 ** ((now - member.throttle_score_updated_at) / self.THROTTLE_HALF_LIFE)
+
+    def release(self, member, throttled=False):
+        """
+        요청 결과를 리전 상태에 반영합니다.
+
+        Parameters:
+            member (BedrockRegionMember): acquire 로 선택된 리전
+            throttled (bool): ThrottlingException 여부
+        """
+        with self.lock:
+            member.in_flight -= 1
+            if throttled:
+                now = time.monotonic()
+                member.throttles += 1
+                member.throttle_score = self.get_throttle_score(member, now) + 1.0
+                member.throttle_score_updated_at = now
+                member.consecutive_throttles += 1
+                cooldown = min(self.base_cooldown * 2 ** (member.consecutive_throttles - 1), self.max_cooldown)
+                member.cooldown_until = now + cooldown
+            else:
+                member.consecutive_throttles = 0
+
+    def get_status(self):
+        with self.lock:
+            return [{'region': member.region_name, 'model_id': member.model_id, 'requests': member.requests,
+                     'throttles': member.throttles, 'in_flight': member.in_flight} for member in self.members]
+
+def convert_openai_to_bedrock_system(messages, cache_point=False):
+    """
+    OpenAI 형식의 시스템 메시지를 Converse 의 system 블록으로 변환합니다.
+
+    Parameters:
+        messages (list): OpenAI 형식의 메시지 목록
+        cache_point (bool, optional): 시스템 프롬프트 뒤에 cachePoint 를 추가할지 여부
+
+    Returns:
+        list: Converse system 블록 목록 (시스템 메시지가 없으면 빈 목록)
+    """
+    system_blocks = [{'text': msg['content']} for msg in messages if msg.get('role') == 'system' and msg.get('content')]
+    if system_blocks and cache_point:
+        system_blocks.append(CACHE_POINT)
+    return system_blocks
+
 def convert_openai_to_bedrock_messages(messages):
     """
     OpenAI 형식의 메시지를 Bedrock 형식으로 변환합니다.
+    시스템 메시지는 제외됩니다 (convert_openai_to_bedrock_system 으로 system 필드에 전달).
     
     Parameters:
         messages (list): OpenAI 형식의 메시지 목록
@@ -45,31 +198,18 @@ def convert_openai_to_bedrock_messages(messages):
         list: Bedrock 형식의 메시지 목록
     """
     bedrock_messages = []
-    system_content = None
-    
-    # 시스템 메시지가 있는지 확인하고 별도로 저장
-    for msg in messages:
-        if msg.get('role') == 'system':
-            system_content = msg.get('content')
-            break
     
     for msg in messages:
         role = msg.get('role')
         content = msg.get('content')
         
         if role == 'system':
-            # 시스템 메시지는 건너뛰고 나중에 첫 번째 사용자 메시지에 추가
+            # 시스템 메시지는 Converse 의 system 필드로 전달
             continue
         elif role == 'user':
-            user_content = content
-            
-            # 첫 번째 사용자 메시지이고 시스템 메시지가 있으면 결합
-            if system_content and len(bedrock_messages) == 0:
-                user_content = f"<system>\n{system_content}\n</system>\n\n{content}"
-            
             bedrock_messages.append({
                 'role': 'user',
-                'content': [{'text': user_content}]
+                'content': [{'text': content}]
             })
         elif role == 'assistant':
             # 도구 호출이 있는 경우
@@ -115,12 +255,13 @@ def convert_openai_to_bedrock_messages(messages):
     
     return bedrock_messages
 
-def convert_openai_to_bedrock_tools(tools):
+def convert_openai_to_bedrock_tools(tools, cache_point=False):
     """
     OpenAI 형식의 도구를 Bedrock 형식으로 변환합니다.
     
     Parameters:
         tools (list): OpenAI 형식의 도구 목록
+        cache_point (bool, optional): 도구 목록 뒤에 cachePoint 를 추가할지 여부
         
     Returns:
         dict: Bedrock 형식의 도구 설정
@@ -150,6 +291,8 @@ def convert_openai_to_bedrock_tools(tools):
                 }
             })
     
+    if bedrock_tools and cache_point:
+        bedrock_tools.append(CACHE_POINT)
     return {"tools": bedrock_tools}
 
 def convert_bedrock_to_openai_response(bedrock_response):
@@ -199,7 +342,72 @@ def convert_bedrock_to_openai_response(bedrock_response):
     
     return response_output
 
-def call_bedrock_model(bedrock_client, model_id, messages, tools=None, temperature=0.1):
+def record_bedrock_usage(bedrock_response):
+    """
+    Converse 응답의 usage 와 metrics.latencyMs 를 기록합니다.
+    Converse 의 inputTokens 는 캐시에서 읽거나 캐시에 쓴 토큰을 포함하지 않으므로 prompt_tokens 에 더합니다.
+
+    Parameters:
+        bedrock_response (dict): Bedrock Converse API 응답
+    """
+    usage = bedrock_response.get('usage') or {}
+    cached_tokens = usage.get('cacheReadInputTokens') or 0
+    cache_write_tokens = usage.get('cacheWriteInputTokens') or 0
+    prompt_tokens = (usage.get('inputTokens') or 0) + cached_tokens + cache_write_tokens
+    latency_ms = (bedrock_response.get('metrics') or {}).get('latencyMs')
+    record_usage(prompt_tokens=prompt_tokens,
+                 completion_tokens=usage.get('outputTokens'),
+                 cached_tokens=cached_tokens,
+                 cache_write_tokens=cache_write_tokens,
+                 provider_latency=latency_ms / 1000 if latency_ms is not None else None)
+
+
+def collect_bedrock_stream(stream_response):
+    """
+    ConverseStream 이벤트를 읽어 Converse 응답 형식으로 재구성합니다.
+    첫 토큰, 도구 이름, 스트림 종료까지의 시간을 기록합니다 (--latency_bench). 시간은 요청 전에 record_stream_event('start') 로 시작합니다.
+
+    Parameters:
+        stream_response (dict): Bedrock ConverseStream API 응답
+
+    Returns:
+        dict: Converse API 응답 형식 (output, stopReason, usage, metrics)
+    """
+    response = {'output': {'message': {'role': 'assistant', 'content': []}}, 'stopReason': None, 'usage': None, 'metrics': None}
+    blocks = {}
+    for event in stream_response['stream']:
+        if 'contentBlockStart' in event:
+            tool_use = event['contentBlockStart'].get('start', {}).get('toolUse')
+            if tool_use is not None:
+                record_stream_event('first_token')
+                record_stream_event('tool_call')
+                blocks[event['contentBlockStart']['contentBlockIndex']] = {
+                    'toolUse': {'toolUseId': tool_use.get('toolUseId'), 'name': tool_use.get('name'), 'input': ''}
+                }
+        elif 'contentBlockDelta' in event:
+            index = event['contentBlockDelta']['contentBlockIndex']
+            delta = event['contentBlockDelta']['delta']
+            if 'text' in delta:
+                record_stream_event('first_token')
+                blocks.setdefault(index, {'text': ''})['text'] += delta['text']
+            elif 'toolUse' in delta:
+                blocks.setdefault(index, {'toolUse': {'toolUseId': None, 'name': '', 'input': ''}})['toolUse']['input'] += delta['toolUse'].get('input', '')
+        elif 'messageStop' in event:
+            response['stopReason'] = event['messageStop'].get('stopReason')
+        elif 'metadata' in event:
+            response['usage'] = event['metadata'].get('usage')
+            response['metrics'] = event['metadata'].get('metrics')
+    record_stream_event('end')
+    # 도구 입력은 JSON 문자열 조각으로 전달되므로 마지막에 파싱합니다
+    for index in sorted(blocks):
+        block = blocks[index]
+        if 'toolUse' in block:
+            block['toolUse']['input'] = json.loads(block['toolUse']['input'] or '{}')
+        response['output']['message']['content'].append(block)
+    return response
+
+
+def call_bedrock_model(bedrock_client, model_id, messages, tools=None, temperature=0.1, stream=False, prompt_cache=False):
     """
     Bedrock 모델을 호출합니다.
     
@@ -209,6 +417,8 @@ def call_bedrock_model(bedrock_client, model_id, messages, tools=None, temperatu
         messages (list): 메시지 목록
         tools (list, optional): 도구 목록
         temperature (float, optional): 온도 설정
+        stream (bool, optional): ConverseStream 으로 호출하고 응답 시간을 기록할지 여부 (--latency_bench)
+        prompt_cache (bool, optional): 시스템 프롬프트와 도구 목록 뒤에 cachePoint 를 추가할지 여부 (--bedrock_prompt_cache)
         
     Returns:
         dict: 모델 응답
@@ -223,13 +433,23 @@ def call_bedrock_model(bedrock_client, model_id, messages, tools=None, temperatu
             'messages': bedrock_messages
         }
         
+        # 시스템 프롬프트 추가
+        system_blocks = convert_openai_to_bedrock_system(messages, cache_point=prompt_cache)
+        if system_blocks:
+            request_params['system'] = system_blocks
+        
         # 도구 설정 추가
         if tools:
-            bedrock_tools = convert_openai_to_bedrock_tools(tools)
+            bedrock_tools = convert_openai_to_bedrock_tools(tools, cache_point=prompt_cache)
             request_params['toolConfig'] = bedrock_tools
         
         # 모델 호출
-        response = bedrock_client.converse(**request_params)
+        if stream:
+            record_stream_event('start')
+            response = collect_bedrock_stream(bedrock_client.converse_stream(**request_params))
+        else:
+            response = bedrock_client.converse(**request_params)
+        record_bedrock_usage(response)
         
         # 응답 변환
         openai_response = convert_bedrock_to_openai_response(response)
@@ -241,9 +461,9 @@ def call_bedrock_model(bedrock_client, model_id, messages, tools=None, temperatu
         raise
     except Exception as e:
         logger.error(f"일반 오류 발생: {e}")
-        # 오류 발생 시 빈 응답 반환
-        return {
+        # 오류 발생 시 빈 응답 반환 (--retry_errors 로 다시 실행할 수 있도록 오류 마커를 붙입니다)
+        return mark_error_response({
             'role': 'assistant',
             'content': f"오류 발생: {str(e)}",
             'tool_calls': None
-        }
\ No newline at end of file
+        }, f"bedrock: {type(e).__name__}: {e}")
\ No newline at end of file
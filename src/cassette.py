@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import deque
+from datetime import datetime
+from src.metrics_collector import get_model_id, get_call_usage, record_usage, get_call_stream_timing, record_stream_timing
+"""
+This is a package that records provider traffic into a cassette file and replays it, with its original timing, without calling the providers.
+"""
+
+# the parts of a request that are sent to the provider, the rest (ground truth, serial_num, ..) does not identify the call
+REQUEST_KEYS = ('messages', 'tools', 'tool_choice', 'temperature')
+
+
+def get_cassette_key(stage, model, api_request):
+    request = {key: api_request[key] for key in REQUEST_KEYS if key in api_request}
+    return hashlib.sha256(json.dumps({'stage': stage, 'model': model, 'request': request},
+                                     ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class Cassette:
+    """
+    A class that holds the recorded provider calls of a cassette file (*.jsonl, one call per line).
+
+    In record mode every call of a wrapped executor is appended with its request, response, measured latency, token usage
+    and stream timing (--latency_bench).
+    In replay mode calls are served from the file, matched by stage, model id and request, so no provider is called.
+    Only the parts of the request sent to the provider (REQUEST_KEYS) identify a call: requests that differ only in
+    serial_num, tools_type, ground truth, .. are the same provider call and share their recordings, e.g. the tools_type
+    rows of a query whose tools are the same.
+    A request recorded several times is replayed in the recorded order, and its last recording is reused once they run out.
+    """
+    def __init__(self, cassette_file_path, mode, latency_scale=0.0):
+        """
+        Initializes the Cassette.
+
+        Parameters:
+            cassette_file_path (str): The cassette file path.
+            mode (str): record or replay.
+            latency_scale (float): replay only. 0 replays without waiting, 1 waits the recorded latency, 0.5 half of it.
+        """
+        if mode not in ('record', 'replay'):
+            raise Exception(f"Unsupported cassette mode: {mode}")
+        self.cassette_file_path = cassette_file_path
+        self.mode = mode
+        self.latency_scale = latency_scale or 0.0
+        self.lock = threading.Lock()
+        self.entries = {}
+        if mode == 'replay':
+            self.load()
+
+    def load(self):
+        if not os.path.isfile(self.cassette_file_path):
+            raise Exception(f"cassette file not found: {self.cassette_file_path}")
+        with open(self.cassette_file_path, 'r', encoding='utf-8') as ff:
+            for line in ff:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.entries.setdefault(entry['key'], deque()).append(entry)
+        print(f"[[cassette replay : {sum(len(entries) for entries in self.entries.values())} calls, {self.cassette_file_path}]]")
+
+    def wrap(self, executor, stage):
+        """
+        Wraps an API executor, so that its calls are recorded or replayed.
+
+        Parameters:
+            executor (AbstractModelAPIExecutor): The API executor.
+            stage (str): The stage of its calls (generation, judge).
+        """
+        return CassetteExecutor(executor, self, stage)
+
+    def record(self, stage, model, api_request, response, latency):
+        entry = {
+            'key': get_cassette_key(stage, model, api_request),
+            'stage': stage,
+            'model': model,
+            'serial_num': api_request.get('serial_num'),
+            'request': api_request,
+            'response': response,
+            'latency': latency,
+            'usage': get_call_usage(),
+            'stream': get_call_stream_timing(),
+            'recorded_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        line = json.dumps(entry, ensure_ascii=False, default=str)
+        with self.lock:
+            with open(self.cassette_file_path, 'a', encoding='utf-8') as ff:
+                ff.write(f'{line}\n')
+
+    def replay(self, stage, model, api_request):
+        key = get_cassette_key(stage, model, api_request)
+        with self.lock:
+            entries = self.entries.get(key)
+            if not entries:
+                raise Exception(f"call not recorded in cassette (stage {stage}, model {model}, serial_num {api_request.get('serial_num')}): "
+                                f"{self.cassette_file_path}")
+            entry = entries.popleft() if len(entries) > 1 else entries[0]
+        if self.latency_scale > 0:
+            time.sleep(entry['latency'] * self.latency_scale)
+        if entry.get('usage'):
+            record_usage(**entry['usage'])
+        if entry.get('stream'):
+            record_stream_timing(**entry['stream'])
+        return entry['response']
+
+
+class CassetteExecutor:
+    """
+    A class that stands in for an API executor and records or replays its predict calls.
+    The wrapped executor is only called in record mode.
+    """
+    def __init__(self, executor, cassette, stage):
+        self.executor = executor
+        self.cassette = cassette
+        self.stage = stage
+        self.model_id = get_model_id(executor)
+
+    def predict(self, api_request):
+        if self.cassette.mode == 'replay':
+            return self.cassette.replay(self.stage, self.model_id, api_request)
+        start = time.perf_counter()
+        response = self.executor.predict(api_request)
+        self.cassette.record(self.stage, self.model_id, api_request, response, time.perf_counter() - start)
+        return response
+
+
+def get_cassette(record, replay, replay_latency_scale=0.0):
+    """
+    Creates the cassette of a run from the --record / --replay options.
+
+    Returns:
+        Cassette or None: None if neither option is given.
+    """
+    if record and replay:
+        raise Exception("--record and --replay can not be used together")
+    if record:
+        return Cassette(record, 'record')
+    if replay:
+        return Cassette(replay, 'replay', replay_latency_scale)
+    return None
@@ -16,6 +16,40 @@ DEFAULTS = {
     "gcloud_project_id": "user_gcloud_project_id",
     "gcloud_location": "user_gcloud_project_location",
     "use_async": False,
+    # sequential evaluation
+    "target_ci_width": None,
+    "reject_below": None,
+    # stratified subsampling
+    "sample_frac": None,
+    "sample_n": None,
+    # evaluation record format
+    "eval_format": "full",
+    # chrome trace-event export
+    "trace": None,
+    # stage profiling
+    "profile": None,
+    # record / replay of provider calls
+    "record": None,
+    "replay": None,
+    "replay_latency_scale": 0.0,
+    # dry run
+    "plan": False,
+    # streaming latency benchmark
+    "latency_bench": False,
+    # dialog-sticky scheduling
+    "dialog_sticky": False,
+    # bedrock prompt caching
+    "bedrock_prompt_cache": False,
+    # http connection pool
+    "http2": False,
+    "request_timeout": None,
+    # deadline and hedging of the provider calls
+    "call_timeout": None,
+    "hedge": False,
+    # concurrency autotuning
+    "autotune": False,
+    # targeted re-run of the errored responses
+    "retry_errors": False,
 }
 
 
@@ -59,6 +93,30 @@ class DefaultSamplePromptOptions(click.Option):
         return super().prompt_for_value(ctx)
 
 
+class DefaultSampleFracPromptOptions(click.Option):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('type', click.FloatRange(0, 1, min_open=True))
+        super(DefaultSampleFracPromptOptions, self).__init__(*args, **kwargs)
+
+    def prompt_for_value(self, ctx):
+        q = ctx.obj.get("q")
+        if q:
+            return DEFAULTS['sample_frac']
+        return super().prompt_for_value(ctx)
+
+
+class DefaultSampleNPromptOptions(click.Option):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('type', click.IntRange(min=1))
+        super(DefaultSampleNPromptOptions, self).__init__(*args, **kwargs)
+
+    def prompt_for_value(self, ctx):
+        q = ctx.obj.get("q")
+        if q:
+            return DEFAULTS['sample_n']
+        return super().prompt_for_value(ctx)
+
+
 class DefaultDebugPromptOptions(click.Option):
     def __init__(self, *args, **kwargs):
         kwargs.setdefault('type', click.BOOL)
@@ -105,3 +163,219 @@ class DefaultUseAsyncPromptOptions(click.Option):
         if q:
             return DEFAULTS['use_async']
         return super().prompt_for_value(ctx)
+
+
+class DefaultTargetCiWidthPromptOptions(click.Option):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('type', click.FLOAT)
+        super(DefaultTargetCiWidthPromptOptions, self).__init__(*args, **kwargs)
+
+    def prompt_for_value(self, ctx):
+        q = ctx.obj.get("q")
+        if q:
+            return DEFAULTS['target_ci_width']
+        return super().prompt_for_value(ctx)
+
+
+class DefaultRejectBelowPromptOptions(click.Option):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('type', click.FLOAT)
+        super(DefaultRejectBelowPromptOptions, self).__init__(*args, **kwargs)
+
+    def prompt_for_value(self, ctx):
+        q = ctx.obj.get("q")
+        if q:
+            return DEFAULTS['reject_below']
+        return super().prompt_for_value(ctx)
+
+
+class DefaultEvalFormatPromptOptions(click.Option):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('type', click.Choice(['full', 'slim']))
+        super(DefaultEvalFormatPromptOptions, self).__init__(*args, **kwargs)
+
+    def prompt_for_value(self, ctx):
+        q = ctx.obj.get("q")
+        if q:
+            return DEFAULTS['eval_format']
+        return super().prompt_for_value(ctx)
+
+
+class DefaultTracePromptOptions(click.Option):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('type', click.Path(dir_okay=False))
+        super(DefaultTracePromptOptions, self).__init__(*args, **kwargs)
+
+    def prompt_for_value(self, ctx):
+        q = ctx.obj.get("q")
+        if q:
+            return DEFAULTS['trace']
+        return super().prompt_for_value(ctx)
+
+
+class DefaultProfilePromptOptions(click.Option):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('type', click.Choice(['cprofile', 'pyinstrument']))
+        super(DefaultProfilePromptOptions, self).__init__(*args, **kwargs)
+
+    def prompt_for_value(self, ctx):
+        q = ctx.obj.get("q")
+        if q:
+            return DEFAULTS['profile']
+        return super().prompt_for_value(ctx)
+
+
+class DefaultRecordPromptOptions(click.Option):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('type', click.Path(dir_okay=False))
+        super(DefaultRecordPromptOptions, self).__init__(*args, **kwargs)
+
+    def prompt_for_value(self, ctx):
+        q = ctx.obj.get("q")
+        if q:
+            return DEFAULTS['record']
+        return super().prompt_for_value(ctx)
+
+
+class DefaultReplayPromptOptions(click.Option):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('type', click.Path(exists=True, dir_okay=False))
+        super(DefaultReplayPromptOptions, self).__init__(*args, **kwargs)
+
+    def prompt_for_value(self, ctx):
+        q = ctx.obj.get("q")
+        if q:
+            return DEFAULTS['replay']
+        return super().prompt_for_value(ctx)
+
+
+class DefaultReplayLatencyScalePromptOptions(click.Option):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('type', click.FLOAT)
+        super(DefaultReplayLatencyScalePromptOptions, self).__init__(*args, **kwargs)
+
+    def prompt_for_value(self, ctx):
+        q = ctx.obj.get("q")
+        if q:
+            return DEFAULTS['replay_latency_scale']
+        return super().prompt_for_value(ctx)
+
+
+class DefaultPlanPromptOptions(click.Option):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('type', click.BOOL)
+        super(DefaultPlanPromptOptions, self).__init__(*args, **kwargs)
+
+    def prompt_for_value(self, ctx):
+        q = ctx.obj.get("q")
+        if q:
+            return DEFAULTS['plan']
+        return super().prompt_for_value(ctx)
+
+
+class DefaultLatencyBenchPromptOptions(click.Option):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('type', click.BOOL)
+        super(DefaultLatencyBenchPromptOptions, self).__init__(*args, **kwargs)
+
+    def prompt_for_value(self, ctx):
+        q = ctx.obj.get("q")
+        if q:
+            return DEFAULTS['latency_bench']
+        return super().prompt_for_value(ctx)
+
+
+class DefaultDialogStickyPromptOptions(click.Option):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('type', click.BOOL)
+        super(DefaultDialogStickyPromptOptions, self).__init__(*args, **kwargs)
+
+    def prompt_for_value(self, ctx):
+        q = ctx.obj.get("q")
+        if q:
+            return DEFAULTS['dialog_sticky']
+        return super().prompt_for_value(ctx)
+
+
+class DefaultBedrockPromptCachePromptOptions(click.Option):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('type', click.BOOL)
+        super(DefaultBedrockPromptCachePromptOptions, self).__init__(*args, **kwargs)
+
+    def prompt_for_value(self, ctx):
+        q = ctx.obj.get("q")
+        if q:
+            return DEFAULTS['bedrock_prompt_cache']
+        return super().prompt_for_value(ctx)
+
+
+class DefaultHttp2PromptOptions(click.Option):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('type', click.BOOL)
+        super(DefaultHttp2PromptOptions, self).__init__(*args, **kwargs)
+
+    def prompt_for_value(self, ctx):
+        q = ctx.obj.get("q")
+        if q:
+            return DEFAULTS['http2']
+        return super().prompt_for_value(ctx)
+
+
+class DefaultRequestTimeoutPromptOptions(click.Option):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('type', click.FLOAT)
+        super(DefaultRequestTimeoutPromptOptions, self).__init__(*args, **kwargs)
+
+    def prompt_for_value(self, ctx):
+        q = ctx.obj.get("q")
+        if q:
+            return DEFAULTS['request_timeout']
+        return super().prompt_for_value(ctx)
+
+
+class DefaultCallTimeoutPromptOptions(click.Option):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('type', click.FLOAT)
+        super(DefaultCallTimeoutPromptOptions, self).__init__(*args, **kwargs)
+
+    def prompt_for_value(self, ctx):
+        q = ctx.obj.get("q")
+        if q:
+            return DEFAULTS['call_timeout']
+        return super().prompt_for_value(ctx)
+
+
+class DefaultHedgePromptOptions(click.Option):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('type', click.BOOL)
+        super(DefaultHedgePromptOptions, self).__init__(*args, **kwargs)
+
+    def prompt_for_value(self, ctx):
+        q = ctx.obj.get("q")
+        if q:
+            return DEFAULTS['hedge']
+        return super().prompt_for_value(ctx)
+
+
+class DefaultAutotunePromptOptions(click.Option):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('type', click.BOOL)
+        super(DefaultAutotunePromptOptions, self).__init__(*args, **kwargs)
+
+    def prompt_for_value(self, ctx):
+        q = ctx.obj.get("q")
+        if q:
+            return DEFAULTS['autotune']
+        return super().prompt_for_value(ctx)
+
+
+class DefaultRetryErrorsPromptOptions(click.Option):
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('type', click.BOOL)
+        super(DefaultRetryErrorsPromptOptions, self).__init__(*args, **kwargs)
+
+    def prompt_for_value(self, ctx):
+        q = ctx.obj.get("q")
+        if q:
+            return DEFAULTS['retry_errors']
+        return super().prompt_for_value(ctx)
@@ -1,11 +1,18 @@
 import os
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 
 CUR_PATH = os.path.dirname(os.path.abspath(__file__))
 REPO_PATH = '/'.join(CUR_PATH.split('/')[:-1])
 
 from src.utils import load_config_with_env_vars, is_exist_file, load_to_jsonl
+from src.metrics_collector import MetricsCollector, get_model_id
+from src.latency_report import report_latency
+from src.trace_recorder import trace_span
+from src.hedging import HedgedCaller, CallDeadlineExceeded
+from src.autotuner import get_autotuner
 from src.api_executor import (
     OpenaiModelAzureAPI,
     OpenaiModelAPI,
@@ -15,6 +22,12 @@ from src.formatter import (
     CommonResponseFormatter,
     DialogResponseFormatter,
     SingleCallResponseFormatter,
+    resolve_eval_output,
+    mark_error_response,
+    is_error_response,
+    is_error_evaluation,
+    strip_error_marker,
+    ERROR_MARKER_KEY,
 )
 from src.evaluation_registor import (
     CommonEvaluationRegistor,
@@ -40,7 +53,8 @@ class EvaluationHandler:
     A class to handle different types of evaluations for models.
     It manages the setup, execution, and storage of evaluation results based on evaluation metrics and configurations.
     """
-    def __init__(self, evaluation_type, judge_type=None, judge_api_key=None, judge_aws_secret_key=None, judge_aws_region=None, judge_bedrock_model_id=None):
+    def __init__(self, evaluation_type, judge_type=None, judge_api_key=None, judge_aws_secret_key=None, judge_aws_region=None, judge_bedrock_model_id=None,
+                 eval_format='full', metrics_collector=None, cassette=None, call_timeout=None, hedge=False, autotune=False, batch_size=1):
         """
         Initializes the EvaluationHandler with a specific type of evaluation.
 
@@ -51,6 +65,14 @@ class EvaluationHandler:
             judge_aws_secret_key (str): AWS secret key for judge model (bedrock only)
             judge_aws_region (str): AWS region for judge model (bedrock only)
             judge_bedrock_model_id (str): Bedrock model ID for judge model (bedrock only)
+            eval_format (str): Format of the evaluation records (full, slim). slim records only keep the request key,
+                               verdict, reasoning and model output, the request is resolved from the request file.
+            metrics_collector (MetricsCollector, optional): Collector of the judge metrics, shared with the other stages of the run.
+            cassette (Cassette, optional): Records or replays the judge calls (--record, --replay).
+            call_timeout (float, optional): Seconds before a judge call, retries included, fails (--call_timeout).
+            hedge (bool, optional): Sends a duplicate of the judge calls slower than their rolling p95 latency (--hedge).
+            autotune (bool, optional): Runs the judge calls concurrently, the concurrency tuned from their latency and errors (--autotune).
+            batch_size (int, optional): The ceiling of the autotuned concurrency (--batch_size).
 
         Attributes:
             evaluation_type (str): Stores the type of evaluation.
@@ -60,6 +82,7 @@ class EvaluationHandler:
             eval_reg (object): An instance of the evaluation register object for storing and managing evaluation results.
         """
         self.evaluation_type = evaluation_type
+        self.eval_format = eval_format
         # load prompt
         self.rubric_prompts = self.get_rubric_prompts()
         
@@ -88,8 +111,32 @@ class EvaluationHandler:
             
         self.temperature = float(cfg.get('temperature'))
         self.executor = self.load_api_executor(cfg, judge_type)
+        self.provider = type(self.executor).__name__
+        self.model_id = get_model_id(self.executor)
+        self.metrics_collector = metrics_collector if metrics_collector is not None else MetricsCollector()
+        self.autotuner = get_autotuner(autotune, batch_size)
+        if call_timeout is not None or hedge:
+            self.executor.predict = HedgedCaller(self.executor.predict, call_timeout=call_timeout, hedge=hedge,
+                                                 max_concurrency=self.autotuner.max_concurrency if self.autotuner is not None else 1)
+            self.metrics_collector.add_hedged_caller('judge', self.provider, self.executor.predict)
+        # replayed calls open no connection
+        self.warm_up_connections = None
+        if cassette is None or cassette.mode == 'record':
+            self.warm_up_connections = getattr(self.executor, 'warm_up', None)
+        if cassette is not None:
+            self.executor = cassette.wrap(self.executor, 'judge')
         self.eval_reg = EVAlUATION_REGISTOR_OBJ[self.evaluation_type]()
 
+    def warm_up(self):
+        """
+        Opens the connection of the judge calls before the judge stage is timed (OpenAI / Azure judges).
+        """
+        if self.warm_up_connections is None:
+            return
+        with trace_span('warm_up', 'io', connections=1):
+            self.warm_up_connections(1)
+        self.warm_up_connections = None
+
     def get_rubric_prompts(self):
         rubric_prompts = {}
         for output_type in ['call', 'completion', 'relevance', 'slot']:
@@ -105,7 +152,7 @@ class EvaluationHandler:
         
         # set evaluation-model based on judge_type
         if judge_type == "azure":
-            executor = OpenaiModelAzureAPI(cfg.get('instance'), cfg.get('api_key'), cfg.get('api_base'), cfg.get('api_version'))
+            executor = OpenaiModelAzureAPI(cfg.get('instance', cfg.get('model')), cfg.get('api_key'), cfg.get('api_base'), cfg.get('api_version'))
         elif judge_type == "openai":
             executor = OpenaiModelAPI(cfg.get('api_version'), cfg.get('api_key'), use_eval=True)
         elif judge_type == "bedrock":
@@ -122,19 +169,17 @@ class EvaluationHandler:
         return executor
 
     def clean_tool_calls(self, tools):
+        # copies without the call ids, the requests and responses are shared between evaluation threads
         if not tools:
             return tools
-        for tool in tools:
-            if 'id' in tool:
-                del tool['id']
-        return tools
+        return [{key: value for key, value in tool.items() if key != 'id'} for tool in tools]
 
     def get_input_prompt(self, inp, out):
-        ground_truth = inp['ground_truth']
+        ground_truth = dict(inp['ground_truth'])
         answer_tool_calls = self.clean_tool_calls(ground_truth.get('tool_calls', None))
         if answer_tool_calls:
             ground_truth['tool_calls'] = answer_tool_calls
-        out['tool_calls'] = self.clean_tool_calls(out.get('tool_calls', None))
+        out = dict(out, tool_calls=self.clean_tool_calls(out.get('tool_calls', None)))
         # create rubric evaluation prompt
         output_type = inp['type_of_output']
         rubric_prompt = self.rubric_prompts.get(output_type, None)
@@ -143,7 +188,8 @@ class EvaluationHandler:
         tools = json.dumps(inp['tools'], ensure_ascii=False)
         query = json.dumps(inp['messages'], ensure_ascii=False)
         ground_truth = json.dumps(ground_truth, ensure_ascii=False)
-        response = json.dumps(out, ensure_ascii=False)
+        # the judge sees the response as the model gave it, without the error marker of a failed call
+        response = json.dumps(strip_error_marker(out), ensure_ascii=False)
         if output_type == 'call':
             acceptable_arguments = json.dumps(inp['acceptable_arguments'], ensure_ascii=False)
             return rubric_prompt.format(tools=tools,
@@ -275,16 +321,26 @@ class EvaluationHandler:
     def fetch(self, inp, out, debug=False):
         input_prompt = self.get_input_prompt(inp, out)
         messages = [{'role': 'user', 'content': input_prompt}]
-        evaluate_response = self.executor.predict({'temperature': self.temperature, 'messages': messages})
+        try:
+            evaluate_response = self.metrics_collector.call(
+                'judge', self.provider, self.executor.predict,
+                {'temperature': self.temperature, 'messages': messages}, tag_request=inp, model=self.model_id
+            )
+        except CallDeadlineExceeded as e:
+            # judged as fail instead of stopping the run, --retry_errors re-judges it
+            evaluate_response = mark_error_response(self.get_skip_response('judge-deadline', f"judge-deadline\n{e}\n\nfail\nfail\n"),
+                                                    f"deadline: {e}")
         if debug is True:
             print(f"\nserial_num : {inp['serial_num']}")
             print(f'evaluate_request : {input_prompt}')
             print(f"evaluate_response : {evaluate_response['choices'][0]['message']['content']}\n")
         return evaluate_response, input_prompt
 
-    def load_cached_evaluation_result(self, eval_file_path, max_size):
+    def load_cached_evaluation_result(self, eval_file_path, max_size, api_request_list=None):
         if is_exist_file(eval_file_path):
             eval_output = load_to_jsonl(eval_file_path)
+            if api_request_list is not None:
+                eval_output = resolve_eval_output(eval_output, api_request_list)
             if len(eval_output) == max_size:
                 print(f"[[already evaluate]] .. {len(eval_output)}/{max_size}\npath : {eval_file_path}")
                 return eval_output
@@ -293,7 +349,186 @@ class EvaluationHandler:
                 return eval_output
         return []
 
-    def evaluate(self, input_set, output_set, eval_file_path, eval_log_file_path, reset, sample, debug=False, only_exact=False):
+    def evaluate_request(self, inp, out, only_exact=False):
+        """
+        Evaluates a single input/output pair, by exact match when possible and by the judge model otherwise.
+        An errored response (failed model call) is not judged, it is recorded as a fail with its error marker.
+
+        Parameters:
+            inp (dict): The model request.
+            out (dict): The model response.
+            only_exact (bool): If True, the judge model is never called.
+
+        Returns:
+            ResponseFormatter: The formatted evaluation result.
+        """
+        # 'else case' is dialog, the request is copied rather than changed (evaluated concurrently with --autotune)
+        if self.evaluation_type == 'singlecall':
+            inp = dict(inp, type_of_output='call')
+        # default
+        evaluate_response, input_prompt = {}, ''
+        fetch_flag = True
+        if is_error_response(out):
+            # a failed model call is not judged: recorded as a fail, left out of the pass rates (error), re-run by --retry_errors
+            fetch_flag = False
+            evaluate_response = self.get_skip_response('model-error', f"model-error\n{out[ERROR_MARKER_KEY]}\n\nfail\nfail\n")
+        elif inp['type_of_output'] == 'call':  # exact match
+            fetch_flag, evaluate_response, input_prompt = self.match(inp, out)
+        if only_exact:
+            fetch_flag = False
+        if fetch_flag:
+            evaluate_response, input_prompt = self.fetch(inp, out)
+        else:
+            if len(evaluate_response) == 0:
+                evaluate_response = self.get_skip_response('exact-match', 'skip evaluation')
+        # formatting
+        return RESPONSE_FORMATTER_OBJ[self.evaluation_type](
+            request_model=inp,
+            response_model=out,
+            evaluate_prompt=input_prompt,
+            evaluate_response=evaluate_response
+        )
+
+    def get_skip_response(self, response_id, content):
+        # formatted like a judge response, a fail that was not judged (skipped or errored model call)
+        return {
+            "id": response_id,
+            "choices": [{
+                "finish_reason": "stop",
+                "index": 0,
+                "message": {
+                    "content": content,
+                    "role": "assistant"
+                },
+                "function_call": None,
+                "tool_calls": None,
+            }],
+            "exact": 'fail'
+        }
+
+    def save_evaluation(self, response_formatter, eval_raw_fw, eval_tsv_fw):
+        """
+        Registers a formatted evaluation result and appends it to the raw and formatted logs.
+
+        Parameters:
+            response_formatter (ResponseFormatter): The formatted evaluation result.
+            eval_raw_fw (file): File object of the raw evaluation results (*.eval.jsonl).
+            eval_tsv_fw (file): File object of the formatted evaluation logs (*.eval_report.tsv).
+        """
+        if self.eval_reg.get_eval_output_length() == 0:
+            title = response_formatter.get_slim_tsv_title() if self.eval_format == 'slim' else response_formatter.get_tsv_title()
+            eval_tsv_fw.write(f"{title}\n")
+        # update eval_output
+        eval_data, raw_line, tsv_line = self.format_evaluation(response_formatter)
+        self.eval_reg.add_eval_output(eval_data)
+        eval_raw_fw.write(f"{raw_line}\n")
+        eval_tsv_fw.write(f"{tsv_line}\n")
+
+    def format_evaluation(self, response_formatter):
+        """
+        Formats an evaluation result in the evaluation format of the run (full, slim).
+
+        Returns:
+            tuple: The record of the evaluation registor, its line in the raw evaluation results and in the formatted logs.
+        """
+        if self.eval_format == 'slim':
+            # the registor needs the request, the file only keeps its key
+            output_data = response_formatter.to_slim_dict()
+            return (dict(output_data, model_request=response_formatter.request_model),
+                    json.dumps(output_data, ensure_ascii=False), response_formatter.to_slim_tsv().strip())
+        output_data = response_formatter.to_dict()
+        return output_data, json.dumps(output_data, ensure_ascii=False), response_formatter.to_tsv().strip()
+
+    def retry_error_evaluations(self, input_set, output_set, eval_output, eval_file_path, eval_log_file_path, only_exact=False):
+        """
+        Re-judges the evaluated requests whose judge call failed, or whose errored response has been re-run (--retry_errors),
+        and rewrites their lines of the evaluation files. The other lines are kept as they are,
+        as are the records of the responses that are still errored (they are not judged).
+
+        Parameters:
+            input_set (list): The model requests, in the order of the evaluation records.
+            output_set (list): The current model responses.
+            eval_output (list): The cached evaluation records.
+            eval_file_path (str): File path of the raw evaluation results (*.eval.jsonl).
+            eval_log_file_path (str): File path of the formatted evaluation logs (*.eval_report.tsv).
+            only_exact (bool): If True, the judge model is never called.
+
+        Returns:
+            list: The evaluation records, the re-judged ones replaced.
+        """
+        retry_indices = [idx for idx, data in enumerate(eval_output)
+                         if not is_error_response(output_set[idx])
+                         and (is_error_evaluation(data) or is_error_response(data['model_response']))]
+        if len(retry_indices) == 0:
+            return eval_output
+        print(f" ** retry errors : re-judging {len(retry_indices)} evaluations")
+        with open(eval_file_path, 'r') as ff:
+            raw_lines = ff.read().splitlines()
+        with open(eval_log_file_path, 'r') as ff:
+            tsv_lines = ff.read().splitlines()
+        # one raw line per record, and the title before the log lines
+        if len(raw_lines) != len(eval_output) or len(tsv_lines) != len(eval_output) + 1:
+            raise Exception(f"evaluation files out of step with their records, re-run with --reset: {eval_file_path}")
+        if not only_exact:
+            self.warm_up()
+        eval_output = list(eval_output)
+        for idx in tqdm(retry_indices):
+            eval_output[idx], raw_lines[idx], tsv_lines[idx + 1] = self.format_evaluation(
+                self.evaluate_request(input_set[idx], output_set[idx], only_exact))
+        # the evaluation files are replaced at once, a crash leaves the previous ones
+        for file_path, lines in ((eval_file_path, raw_lines), (eval_log_file_path, tsv_lines)):
+            with trace_span('flush', 'io', path=file_path):
+                with open(f'{file_path}.tmp', 'w') as ff:
+                    ff.write(''.join(f'{line}\n' for line in lines))
+                os.replace(f'{file_path}.tmp', file_path)
+        return eval_output
+
+    def report_metrics(self, eval_log_file_path):
+        """
+        Prints the metrics summary of the run and writes the metrics next to the evaluation report (*.metrics.json),
+        and the latency report (*.latency.json) if the model calls were streamed (--latency_bench).
+
+        Parameters:
+            eval_log_file_path (str): File path of the formatted evaluation logs (*.eval_report.tsv).
+        """
+        file_prefix = eval_log_file_path.rsplit('.eval_report.tsv', 1)[0]
+        metrics_file_path = f"{file_prefix}.metrics.json"
+        self.metrics_collector.display()
+        self.metrics_collector.save(metrics_file_path)
+        print(f"[[metrics file : {metrics_file_path}]]")
+        report_latency(self.metrics_collector.get_request_metrics('generation'), self.eval_reg.eval_output,
+                       f"{file_prefix}.latency.json")
+
+    def evaluate_autotuned(self, requests, eval_raw_fw, eval_tsv_fw):
+        """
+        Evaluates the input/output pairs in concurrent batches sized by the autotuner (--autotune),
+        and saves the results in request order.
+
+        Parameters:
+            requests (list): The (input, output) pairs to evaluate.
+            eval_raw_fw (file): File object of the raw evaluation results (*.eval.jsonl).
+            eval_tsv_fw (file): File object of the formatted evaluation logs (*.eval_report.tsv).
+        """
+        index = 0
+        with ThreadPoolExecutor(max_workers=self.autotuner.max_concurrency) as pool, tqdm(total=len(requests)) as progress:
+            while index < len(requests):
+                batch = requests[index:index + self.autotuner.get_concurrency()]
+                measured = len(self.metrics_collector.get_request_metrics('judge'))
+                started_at = time.perf_counter()
+                with trace_span('batch', 'batch', size=len(batch), autotune=True):
+                    response_formatters = list(pool.map(lambda inp_out: self.evaluate_request(*inp_out), batch))
+                wall_time = time.perf_counter() - started_at
+                for response_formatter in response_formatters:
+                    self.save_evaluation(response_formatter, eval_raw_fw, eval_tsv_fw)
+                # exact matches make no judge call, a batch without any leaves the concurrency as it is
+                self.autotuner.update(self.metrics_collector.get_request_metrics('judge')[measured:], wall_time)
+                if self.autotuner.history:
+                    self.metrics_collector.record_autotune('judge', self.provider, self.autotuner.get_report())
+                index += len(batch)
+                progress.update(len(batch))
+
+    def evaluate(self, input_set, output_set, eval_file_path, eval_log_file_path, reset, sample, debug=False, only_exact=False,
+                 retry_errors=False):
         """
         Perform the evaluation based on input and output sets, and manage caching and logging of results.
 
@@ -305,6 +540,7 @@ class EvaluationHandler:
             reset (bool): Whether to reset (overwrite) the existing evaluation results.
             sample (bool): If True, perform a quick evaluation on a small sample.
             debug (bool): If True, print detailed debug information during evaluation.
+            retry_errors (bool): If True, the cached evaluations of failed judge calls or re-run responses are re-judged first.
 
         Process:
             1. Manages evaluation result caching.
@@ -316,10 +552,15 @@ class EvaluationHandler:
         eval_output = []
         write_option = 'w'
         if reset is False:
-            eval_output = self.load_cached_evaluation_result(eval_file_path, len(input_set))
-            self.eval_reg.set_eval_output(eval_output)
+            with self.metrics_collector.stage('judge'):
+                eval_output = self.load_cached_evaluation_result(eval_file_path, len(input_set), input_set)
+                if retry_errors:
+                    eval_output = self.retry_error_evaluations(input_set, output_set, eval_output,
+                                                               eval_file_path, eval_log_file_path, only_exact)
+                self.eval_reg.set_eval_output(eval_output)
             if len(eval_output) == len(input_set):
                 self.eval_reg.display()
+                self.report_metrics(eval_log_file_path)
                 return
             write_option = 'a'
         # Initialize file writers for raw and formatted logs
@@ -335,57 +576,25 @@ class EvaluationHandler:
         for inp, out in zip(input_set[start_index:], output_set[start_index:]):
             requests.append((inp, out))
         # load cached evaluation result
-        for idx, inp_out_tuple in enumerate(tqdm(requests)):
-            # inp keys = ['temperature', 'tool_choice', 'messages', 'tools', 'acceptable_arguments', 'answer']
-            # out keys = ['content', 'role', 'function_call', 'tool_calls']
-            if sample is True and idx == 1:
-                break
-            inp, out = inp_out_tuple
-            # 'else case' is dialog
-            inp['type_of_output'] = 'call' if self.evaluation_type == 'singlecall' else inp['type_of_output']
-            # default
-            evaluate_response, input_prompt = {}, ''
-            fetch_flag = True
-            if inp['type_of_output'] == 'call':  # exact match
-                fetch_flag, evaluate_response, input_prompt = self.match(inp, out)
-            if only_exact:
-                fetch_flag = False
-            if fetch_flag:
-                evaluate_response, input_prompt = self.fetch(inp, out)
+        if not only_exact and requests:
+            self.warm_up()
+        with self.metrics_collector.stage('judge'):
+            # exact matches alone are not worth running concurrently
+            if self.autotuner is not None and not only_exact:
+                self.evaluate_autotuned(requests[:1] if sample is True else requests, eval_raw_fw, eval_tsv_fw)
             else:
-                if len(evaluate_response) == 0:
-                    evaluate_response = {
-                        "id": "exact-match",
-                        "choices": [{
-                            "finish_reason": "stop",
-                            "index": 0,
-                            "message": {
-                                "content": 'skip evaluation',
-                                "role": "assistant"
-                            },
-                            "function_call": None,
-                            "tool_calls": None,
-                        }],
-                        "exact": 'fail'
-                    }
-            # formatting
-            response_formatter = RESPONSE_FORMATTER_OBJ[self.evaluation_type](
-                request_model=inp,
-                response_model=out,
-                evaluate_prompt=input_prompt,
-                evaluate_response=evaluate_response
-            )
-            if self.eval_reg.get_eval_output_length() == 0:
-                title = response_formatter.get_tsv_title()
-                eval_tsv_fw.write(f"{title}\n")
-            # update eval_output
-            output_data = response_formatter.to_dict()
-            self.eval_reg.add_eval_output(output_data)
-            eval_raw_fw.write(f"{json.dumps(output_data, ensure_ascii=False)}\n")
-            eval_tsv_fw.write(f"{response_formatter.to_tsv().strip()}\n")
+                for idx, inp_out_tuple in enumerate(tqdm(requests)):
+                    # inp keys = ['temperature', 'tool_choice', 'messages', 'tools', 'acceptable_arguments', 'answer']
+                    # out keys = ['content', 'role', 'function_call', 'tool_calls']
+                    if sample is True and idx == 1:
+                        break
+                    inp, out = inp_out_tuple
+                    response_formatter = self.evaluate_request(inp, out, only_exact)
+                    self.save_evaluation(response_formatter, eval_raw_fw, eval_tsv_fw)
         # Final display of evaluation metrics
         self.eval_reg.display()
         eval_raw_fw.close()
         eval_tsv_fw.close()
+        self.report_metrics(eval_log_file_path)
         print(f"[[model evaluation file : {eval_log_file_path}]]")
         return
@@ -1,5 +1,12 @@
+import numpy as np
 from functools import wraps
 from src import formatter
+from src.statistics_utils import (
+    DEFAULT_CONFIDENCE,
+    bootstrap_pass_rate_intervals,
+    bootstrap_paired_difference,
+    mcnemar_test
+)
 
 
 def validate_params(required_keys):
@@ -15,6 +22,52 @@ def validate_params(required_keys):
     return decorator
 
 
+def get_pass_vector(eval_output):
+    """
+    Builds the pass/fail outcome of each evaluated request, indexed by request key.
+
+    Parameters:
+        eval_output (list): evaluation outputs (rows of *.eval.jsonl, full or slim)
+
+    Returns:
+        dict: {request key: 1 (pass) or 0 (fail)}, without the requests whose model call failed
+    """
+    pass_vector = {}
+    for data in eval_output:
+        is_pass = formatter.get_eval_key(data)
+        # a failed model call was not judged, the request is left out as if it was not evaluated
+        if is_pass == 'error':
+            continue
+        request_key = data['request_key'] if 'request_key' in data else formatter.get_request_key(data['model_request'])
+        pass_vector[request_key] = int(is_pass == 'pass')
+    return pass_vector
+
+
+def compare_eval_outputs(base_eval_output, target_eval_output):
+    """
+    Compares two evaluation runs on the requests both of them evaluated.
+
+    Parameters:
+        base_eval_output (list): evaluation outputs of the baseline run
+        target_eval_output (list): evaluation outputs of the compared run
+
+    Returns:
+        dict: paired sample size, pass rates, bootstrap difference interval (target - base) and McNemar test
+    """
+    base_vector = get_pass_vector(base_eval_output)
+    target_vector = get_pass_vector(target_eval_output)
+    keys = sorted(set(base_vector.keys()) & set(target_vector.keys()))
+    base = np.array([base_vector[key] for key in keys], dtype=np.int64)
+    target = np.array([target_vector[key] for key in keys], dtype=np.int64)
+    return {
+        'paired_count': len(keys),
+        'base_pass_rate': float(base.mean()) if len(keys) > 0 else float('nan'),
+        'target_pass_rate': float(target.mean()) if len(keys) > 0 else float('nan'),
+        'bootstrap': bootstrap_paired_difference(base, target),
+        'mcnemar': mcnemar_test(base, target),
+    }
+
+
 class AbstractEvaluationRegistor:
     """
     An abstract base class for evaluation registers, designed to handle and store evaluation results.
@@ -24,6 +77,9 @@ class AbstractEvaluationRegistor:
     def __init__(self):
         self.eval_dic = {}
         self.eval_output = []
+        # running counters, updated whenever an evaluation output is registered
+        self.pass_count = 0
+        self.case_count = 0
 
     def get_eval_output_length(self):
         """
@@ -42,6 +98,10 @@ class AbstractEvaluationRegistor:
             eval_output (list): A list of evaluation outputs to replace the existing list.
         """
         self.eval_output = eval_output
+        self.pass_count = 0
+        self.case_count = 0
+        for output in eval_output:
+            self.update_running_count(output)
 
     def add_eval_output(self, output):
         """
@@ -51,6 +111,45 @@ class AbstractEvaluationRegistor:
             output (any): An evaluation result to be added to the list.
         """
         self.eval_output.append(output)
+        self.update_running_count(output)
+
+    def update_running_count(self, output):
+        """
+        Updates the running pass/case counters with a single evaluation output.
+        Outputs whose verdict is neither pass nor fail are not counted, as in the reported pass rates.
+
+        Parameters:
+            output (dict): An evaluation result.
+        """
+        is_pass = formatter.get_eval_key(output)
+        if is_pass in ['pass', 'fail']:
+            self.case_count += 1
+            self.pass_count += int(is_pass == 'pass')
+
+    def get_running_pass_rate(self):
+        """
+        Returns the running pass rate and the number of counted cases.
+
+        Returns:
+            tuple: (pass rate, number of counted cases)
+        """
+        if self.case_count == 0:
+            return 0.0, 0
+        return self.pass_count / self.case_count, self.case_count
+
+    def get_error_count(self, eval_dic):
+        """
+        Returns the number of requests whose model call failed (error), not judged and left out of the pass counts and rates.
+
+        Parameters:
+            eval_dic (dict): {group: {is_pass: [serial_num, ..]}}
+        """
+        return sum(len(group.get('error', [])) for group in eval_dic.values())
+
+    def display_error_count(self, eval_dic):
+        error_cnt = self.get_error_count(eval_dic)
+        if error_cnt > 0:
+            print(f"  error : {error_cnt} (model call failed, not judged, --retry_errors re-runs them)")
 
     def add_eval_dic(self, **kwargs):
         """
@@ -72,6 +171,27 @@ class AbstractEvaluationRegistor:
         """
         raise NotImplementedError("Subclasses must implement this method.")
 
+    def display_confidence_intervals(self, eval_dic, groups):
+        """
+        Prints the bootstrap confidence interval of the pass rate for each group and for the total.
+
+        Parameters:
+            eval_dic (dict): {group: {is_pass: [serial_num, ..]}}
+            groups (list): groups to display, in display order.
+        """
+        groups = [group for group in groups if group in eval_dic]
+        pass_counts = [len(eval_dic[group].get('pass', [])) for group in groups]
+        total_counts = [pass_cnt + len(eval_dic[group].get('fail', [])) for pass_cnt, group in zip(pass_counts, groups)]
+        groups.append('total')
+        pass_counts.append(sum(pass_counts))
+        total_counts.append(sum(total_counts))
+        lower, upper = bootstrap_pass_rate_intervals(pass_counts, total_counts)
+        print(f"\n* pass rate ({DEFAULT_CONFIDENCE:.0%} bootstrap CI)")
+        for group, pass_cnt, case_tot_cnt, low, high in zip(groups, pass_counts, total_counts, lower, upper):
+            if case_tot_cnt == 0:
+                continue
+            print(f"  {group} : {pass_cnt/case_tot_cnt:.2f} [{low:.2f}, {high:.2f}]")
+
 
 class CommonEvaluationRegistor(AbstractEvaluationRegistor):
     def __init__(self):
@@ -103,7 +223,7 @@ class CommonEvaluationRegistor(AbstractEvaluationRegistor):
 
     def display(self):
         for data in self.eval_output:
-            is_pass = formatter.convert_eval_key(data['evaluate_response'])
+            is_pass = formatter.get_eval_key(data)
             self.add_eval_dic(type_of_output=data['model_request']['type_of_output'],
                               is_pass=is_pass, serial_num=data['model_request']['serial_num'])
             self.add_eval_dic_per_category(category=data['model_request']['category'],
@@ -120,6 +240,7 @@ class CommonEvaluationRegistor(AbstractEvaluationRegistor):
                 total_cnt += case_tot_cnt_per_cate
                 print(f"  {category} : {pass_cnt}/{case_tot_cnt_per_cate}")
         print(f"  total : {tot_pass_cnt_per_cate}/{total_cnt}")
+        self.display_error_count(self.eval_dic)
         total_cnt = 0
         tot_pass_cnt_per_cate = 0
         print("Pass Rate")
@@ -130,15 +251,18 @@ class CommonEvaluationRegistor(AbstractEvaluationRegistor):
                 tot_pass_cnt_per_cate += pass_cnt
                 case_tot_cnt_per_cate = pass_cnt + fail_cnt
                 total_cnt += case_tot_cnt_per_cate
-                print(f"  {category} : {pass_cnt/case_tot_cnt_per_cate:.2f}")
-        print(f"  total : {tot_pass_cnt_per_cate/total_cnt:.2f}")
+                # a category of errored requests only has no pass rate
+                if case_tot_cnt_per_cate > 0:
+                    print(f"  {category} : {pass_cnt/case_tot_cnt_per_cate:.2f}")
+        print(f"  total : {tot_pass_cnt_per_cate/total_cnt if total_cnt else 0.0:.2f}")
+        self.display_confidence_intervals(self.eval_dic, self.types_of_output)
+        self.display_confidence_intervals(self.eval_dic_per_category, categories)
         total_pass_count = 0
 
 
 class DialogEvaluationRegistor(AbstractEvaluationRegistor):
     def __init__(self):
         super().__init__()
-        self.max_size = 200
         self.types_of_output = ['call', 'completion', 'slot', 'relevance']
 
     @validate_params(['type_of_output', 'is_pass', 'serial_num'])
@@ -158,7 +282,7 @@ class DialogEvaluationRegistor(AbstractEvaluationRegistor):
             inp = data['model_request']
             serial_num = inp['serial_num']
             type_of_output = inp['type_of_output']
-            is_pass = formatter.convert_eval_key(data['evaluate_response'])
+            is_pass = formatter.get_eval_key(data)
             self.add_eval_dic(type_of_output=type_of_output,
                               is_pass=is_pass, serial_num=serial_num)
         tot_pass_cnt = 0
@@ -169,15 +293,20 @@ class DialogEvaluationRegistor(AbstractEvaluationRegistor):
                 tot_pass_cnt += pass_cnt
                 case_tot_cnt = pass_cnt + len(self.eval_dic[type_of_output].get('fail', []))
                 print(f"  {type_of_output} : {pass_cnt}/{case_tot_cnt}")
-        print(f"  total : {tot_pass_cnt}/{self.max_size}")
+        # sampled and early-stopped runs evaluate fewer than the 200 dialog turns, errored turns are not counted
+        case_cnt = len(self.eval_output) - self.get_error_count(self.eval_dic)
+        print(f"  total : {tot_pass_cnt}/{case_cnt}")
+        self.display_error_count(self.eval_dic)
         #
         print("\n* pass rate")
         for type_of_output in self.types_of_output:
             if type_of_output in self.eval_dic:
                 pass_cnt = len(self.eval_dic[type_of_output].get('pass', []))
                 case_tot_cnt = pass_cnt + len(self.eval_dic[type_of_output].get('fail', []))
-                print(f"  {type_of_output} : {pass_cnt/case_tot_cnt:.2f}")
-        print(f" avg(micro) : {tot_pass_cnt/self.max_size}")
+                if case_tot_cnt > 0:
+                    print(f"  {type_of_output} : {pass_cnt/case_tot_cnt:.2f}")
+        print(f" avg(micro) : {tot_pass_cnt/case_cnt if case_cnt else 0.0}")
+        self.display_confidence_intervals(self.eval_dic, self.types_of_output)
 
 
 class SingleCallEvaluationRegistor(AbstractEvaluationRegistor):
@@ -206,7 +335,7 @@ class SingleCallEvaluationRegistor(AbstractEvaluationRegistor):
             inp = data['model_request']
             tools_type = inp['tools_type']
             serial_num = inp['serial_num']
-            is_pass = formatter.convert_eval_key(data['evaluate_response'])
+            is_pass = formatter.get_eval_key(data)
             self.add_eval_dic(tools_type=tools_type,
                               is_pass=is_pass, serial_num=serial_num)
         tot_cnt = 0
@@ -224,3 +353,4 @@ class SingleCallEvaluationRegistor(AbstractEvaluationRegistor):
         print(f"[[TOTAL {tot_cnt}]]")
         for is_pass, serial_num_list in self.eval_dic.items():
             print(f"{is_pass}\t{len(serial_num_list)}")
+        self.display_confidence_intervals(self.eval_dic_of_tools_type, list(self.eval_dic_of_tools_type.keys()))
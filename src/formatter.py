@@ -1,7 +1,10 @@
 import json
-from typing import Optional, List, Dict
+from typing import Optional
 from pydantic import BaseModel, root_validator
 
+# key of the marker that tags the placeholder response of a failed model or judge call (see --retry_errors)
+ERROR_MARKER_KEY = 'error'
+
 
 def convert_eval_key(response):
     """
@@ -66,6 +69,97 @@ def convert_eval_key(response):
     return key
 
 
+def get_request_key(request):
+    """
+      A method builds the key that identifies a request within its evaluation set.
+      serial_num alone is not unique for singlecall (one row per tools_type) and common (one row per category).
+
+      Parameters:
+          dict: request json (model_request)
+      Returns:
+          str: request key
+    """
+    if 'tools_type' in request:
+        return f"{request['serial_num']}.{request['tools_type']}"
+    if 'category' in request:
+        return f"{request['category']}.{request['serial_num']}"
+    return str(request['serial_num'])
+
+
+def get_eval_key(eval_data):
+    """
+      A method reads the pass/fail verdict of an evaluation record, full or slim.
+      A record whose model call failed was not judged, its verdict is error.
+
+      Parameters:
+          dict: evaluation record (*.eval.jsonl row)
+      Returns:
+          str: pass, fail or error
+    """
+    if is_error_response(eval_data.get('model_response')):
+        return 'error'
+    if 'is_pass' in eval_data:
+        return eval_data['is_pass']
+    return convert_eval_key(eval_data['evaluate_response'])
+
+
+def mark_error_response(response, reason):
+    """
+      A method tags the placeholder response of a failed call with an explicit error marker,
+      so that it is not mistaken for an answer of the model and can be re-run (--retry_errors).
+
+      Parameters:
+          dict: placeholder response
+          str: error reason, e.g. "bedrock: ReadTimeoutError: ..."
+      Returns:
+          dict: the tagged response
+    """
+    response[ERROR_MARKER_KEY] = reason
+    return response
+
+
+def is_error_response(response):
+    return isinstance(response, dict) and bool(response.get(ERROR_MARKER_KEY))
+
+
+def strip_error_marker(response):
+    if not is_error_response(response):
+        return response
+    return {key: value for key, value in response.items() if key != ERROR_MARKER_KEY}
+
+
+def is_error_evaluation(eval_data):
+    """
+      A method checks whether the judge call of an evaluation record, full or slim, failed.
+      Full records keep the judge response, slim records only its error marker.
+    """
+    if ERROR_MARKER_KEY in eval_data:
+        return bool(eval_data[ERROR_MARKER_KEY])
+    return is_error_response(eval_data.get('evaluate_response'))
+
+
+def resolve_eval_output(eval_output, api_request_list):
+    """
+      A method attaches the model request to slim evaluation records, so that they can be used like full records.
+      The request is shared by reference, nothing is copied.
+
+      Parameters:
+          list: evaluation records (*.eval.jsonl rows)
+          list: api requests of the evaluation set
+      Returns:
+          list: evaluation records with model_request
+    """
+    request_dic = None
+    resolved_output = []
+    for data in eval_output:
+        if 'model_request' not in data:
+            if request_dic is None:
+                request_dic = {get_request_key(request): request for request in api_request_list}
+            data = dict(data, model_request=request_dic[data['request_key']])
+        resolved_output.append(data)
+    return resolved_output
+
+
 class RequestFormatter(BaseModel):
     serial_num: int
     messages: list
@@ -111,7 +205,7 @@ class RequestFormatter(BaseModel):
         return self
 
     def to_dict(self):
-        return self.dict()
+        return self.model_dump()
 
 
 class CommonRequestFormatter(RequestFormatter):
@@ -121,6 +215,7 @@ class CommonRequestFormatter(RequestFormatter):
 
 class DialogRequestFormatter(RequestFormatter):
     type_of_output: str
+    dialog_num: Optional[int] = None
 
 
 class SingleCallRequestFormatter(RequestFormatter):
@@ -129,23 +224,111 @@ class SingleCallRequestFormatter(RequestFormatter):
     tools_type: str
 
 
-class ResponseFormatter(BaseModel):
-    # UserWarning: Field "model_response" has conflict with protected namespace "model_".
-    request_model: Dict
-    response_model: Dict
-    evaluate_prompt: str
-    evaluate_response: Dict
+def get_evaluate_content(evaluate_response):
+    """
+      A method extracts the reasoning text from an evaluation response.
+
+      Parameters:
+          dict: API response json (OpenAI, Azure, Bedrock, etc.)
+      Returns:
+          str: reasoning text
+    """
+    # 다양한 API 응답 형식 처리
+    content = None
+
+    # OpenAI API 형식
+    if 'choices' in evaluate_response and len(evaluate_response['choices']) > 0:
+        if 'message' in evaluate_response['choices'][0] and 'content' in evaluate_response['choices'][0]['message']:
+            content = evaluate_response['choices'][0]['message']['content']
+
+    # Bedrock API 형식 (Claude)
+    elif 'completion' in evaluate_response:
+        content = evaluate_response['completion']
+
+    # Bedrock API 형식 (다른 모델)
+    elif 'results' in evaluate_response and len(evaluate_response['results']) > 0:
+        if 'outputText' in evaluate_response['results'][0]:
+            content = evaluate_response['results'][0]['outputText']
+
+    # 다른 API 형식
+    elif 'content' in evaluate_response:
+        content = evaluate_response['content']
+
+    # 응답에서 내용을 찾을 수 없는 경우
+    if content is None:
+        print("Warning: Could not find content in API response for reasoning")
+        print(f"Response structure: {evaluate_response.keys()}")
+        content = "No reasoning available"
+    return content
+
+
+class ResponseFormatter:
+    """
+    A lightweight record of a single evaluation result.
+
+    Requests are validated once by the RequestFormatter when the dataset is loaded,
+    so evaluation results only keep references to the already-validated data
+    and compute the report arguments once, on first use.
+    """
+    __slots__ = ('request_model', 'response_model', 'evaluate_prompt', 'evaluate_response', '_report_arguments')
     # report
-    tsv_keys: Optional[List[str]] = []
-    report_arguments: Optional[dict] = None
+    tsv_keys = ()
+
+    def __init__(self, request_model, response_model, evaluate_prompt, evaluate_response):
+        self.request_model = request_model
+        self.response_model = response_model
+        self.evaluate_prompt = evaluate_prompt
+        self.evaluate_response = evaluate_response
+        self._report_arguments = None
+
+    @property
+    def report_arguments(self):
+        if self._report_arguments is None:
+            self._report_arguments = self.get_report_arguments()
+        return self._report_arguments
+
+    def get_report_arguments(self, include_messages=True):
+        raise NotImplementedError("Subclasses must implement this method.")
+
+    def build_report_arguments(self, type_arguments, messages_key):
+        model_request = self.request_model
+        report_arguments = {
+            'serial_num': model_request['serial_num'],
+            'is_pass': convert_eval_key(self.evaluate_response),
+        }
+        report_arguments.update(type_arguments)
+        report_arguments['ground_truth'] = json.dumps(model_request['ground_truth'], ensure_ascii=False)
+        report_arguments['acceptable_arguments'] = json.dumps(model_request['acceptable_arguments'], ensure_ascii=False)
+        report_arguments['model_output'] = json.dumps(self.response_model, ensure_ascii=False)
+        report_arguments['reasoning'] = json.dumps({'reasoning': get_evaluate_content(self.evaluate_response)}, ensure_ascii=False)
+        if messages_key is not None:
+            report_arguments[messages_key] = json.dumps(model_request['messages'], ensure_ascii=False)
+        return report_arguments
 
     def to_dict(self):
-        convert_dict = self.dict()
-        convert_dict['model_request'] = convert_dict['request_model']
-        convert_dict['model_response'] = convert_dict['response_model']
-        del convert_dict['request_model']
-        del convert_dict['response_model']
-        return convert_dict
+        return {
+            'evaluate_prompt': self.evaluate_prompt,
+            'evaluate_response': self.evaluate_response,
+            'tsv_keys': list(self.tsv_keys),
+            'report_arguments': self.report_arguments,
+            'model_request': self.request_model,
+            'model_response': self.response_model,
+        }
+
+    def to_slim_dict(self):
+        """
+        Builds a reference-based evaluation record.
+        The request itself is not embedded, it is resolved from the request file by its key (see resolve_eval_output).
+        """
+        output_data = {
+            'request_key': get_request_key(self.request_model),
+            'is_pass': convert_eval_key(self.evaluate_response),
+            'reasoning': get_evaluate_content(self.evaluate_response),
+            'model_response': self.response_model,
+        }
+        if is_error_response(self.evaluate_response):
+            output_data[ERROR_MARKER_KEY] = self.evaluate_response[ERROR_MARKER_KEY]
+        return output_data
 
     def to_tsv(self):
         output_str = ''
@@ -161,181 +344,55 @@ class ResponseFormatter(BaseModel):
             output_str += f"{key}\t"
         return output_str
 
+    def get_slim_tsv_keys(self):
+        return [key for key in self.tsv_keys if key not in ('input_messages', 'query')]
+
+    def to_slim_tsv(self):
+        report_arguments = self._report_arguments
+        if report_arguments is None:
+            report_arguments = self.get_report_arguments(include_messages=False)
+        output_str = ''
+        for key in self.get_slim_tsv_keys():
+            output_str += f"{report_arguments[key]}\t"
+        return output_str
+
+    def get_slim_tsv_title(self):
+        output_str = '#'
+        for key in self.get_slim_tsv_keys():
+            output_str += f"{key}\t"
+        return output_str
+
 
 class CommonResponseFormatter(ResponseFormatter):
-    tsv_keys: Optional[List[str]] = ['serial_num', 'is_pass', 'category', 'type_of_output',
-                                     'ground_truth', 'acceptable_arguments',
-                                     'model_output', 'reasoning', 'input_messages']
+    __slots__ = ()
+    tsv_keys = ('serial_num', 'is_pass', 'category', 'type_of_output',
+                'ground_truth', 'acceptable_arguments',
+                'model_output', 'reasoning', 'input_messages')
 
-    @root_validator(pre=True)
-    def set_report_params(cls, values):
-        model_request = values.get('request_model', {})
-        model_response = values.get('response_model', {})
-        evaluate_response = values.get('evaluate_response', {})
-        serial_num = model_request['serial_num']
-        is_pass = convert_eval_key(evaluate_response)
-        category = model_request['category']
-        type_of_output = model_request['type_of_output']
-        ground_truth = json.dumps(model_request['ground_truth'], ensure_ascii=False)
-        acceptable_arguments = json.dumps(model_request['acceptable_arguments'], ensure_ascii=False)
-        model_output = json.dumps(model_response, ensure_ascii=False)
-        
-        # 다양한 API 응답 형식 처리
-        content = None
-        
-        # OpenAI API 형식
-        if 'choices' in evaluate_response and len(evaluate_response['choices']) > 0:
-            if 'message' in evaluate_response['choices'][0] and 'content' in evaluate_response['choices'][0]['message']:
-                content = evaluate_response['choices'][0]['message']['content']
-        
-        # Bedrock API 형식 (Claude)
-        elif 'completion' in evaluate_response:
-            content = evaluate_response['completion']
-        
-        # Bedrock API 형식 (다른 모델)
-        elif 'results' in evaluate_response and len(evaluate_response['results']) > 0:
-            if 'outputText' in evaluate_response['results'][0]:
-                content = evaluate_response['results'][0]['outputText']
-        
-        # 다른 API 형식
-        elif 'content' in evaluate_response:
-            content = evaluate_response['content']
-        
-        # 응답에서 내용을 찾을 수 없는 경우
-        if content is None:
-            print("Warning: Could not find content in API response for reasoning")
-            print(f"Response structure: {evaluate_response.keys()}")
-            content = "No reasoning available"
-        
-        reasoning = json.dumps({'reasoning': content}, ensure_ascii=False)
-        messages = json.dumps(model_request['messages'], ensure_ascii=False)
-        values['report_arguments'] = {
-            'serial_num': serial_num,
-            'is_pass': is_pass,
-            'category': category,
-            'type_of_output': type_of_output,
-            'ground_truth': ground_truth,
-            'acceptable_arguments': acceptable_arguments,
-            'model_output': model_output,
-            'reasoning': reasoning,
-            'messages': messages
-        }
-        return values
+    def get_report_arguments(self, include_messages=True):
+        return self.build_report_arguments({
+            'category': self.request_model['category'],
+            'type_of_output': self.request_model['type_of_output'],
+        }, 'messages' if include_messages else None)
 
 
 class SingleCallResponseFormatter(ResponseFormatter):
-    tsv_keys: Optional[List[str]] = ['serial_num', 'is_pass', 'tools_type',
-                                     'ground_truth', 'acceptable_arguments',
-                                     'model_output', 'reasoning', 'query']
+    __slots__ = ()
+    tsv_keys = ('serial_num', 'is_pass', 'tools_type',
+                'ground_truth', 'acceptable_arguments',
+                'model_output', 'reasoning', 'query')
 
-    @root_validator(pre=True)
-    def set_report_params(cls, values):
-        model_request = values.get('request_model', {})
-        model_response = values.get('response_model', {})
-        evaluate_response = values.get('evaluate_response', {})
-        serial_num = model_request['serial_num']
-        is_pass = convert_eval_key(evaluate_response)
-        tools_type = model_request['tools_type']
-        ground_truth = json.dumps(model_request['ground_truth'], ensure_ascii=False)
-        acceptable_arguments = json.dumps(model_request['acceptable_arguments'], ensure_ascii=False)
-        model_output = json.dumps(model_response, ensure_ascii=False)
-        
-        # 다양한 API 응답 형식 처리
-        content = None
-        
-        # OpenAI API 형식
-        if 'choices' in evaluate_response and len(evaluate_response['choices']) > 0:
-            if 'message' in evaluate_response['choices'][0] and 'content' in evaluate_response['choices'][0]['message']:
-                content = evaluate_response['choices'][0]['message']['content']
-        
-        # Bedrock API 형식 (Claude)
-        elif 'completion' in evaluate_response:
-            content = evaluate_response['completion']
-        
-        # Bedrock API 형식 (다른 모델)
-        elif 'results' in evaluate_response and len(evaluate_response['results']) > 0:
-            if 'outputText' in evaluate_response['results'][0]:
-                content = evaluate_response['results'][0]['outputText']
-        
-        # 다른 API 형식
-        elif 'content' in evaluate_response:
-            content = evaluate_response['content']
-        
-        # 응답에서 내용을 찾을 수 없는 경우
-        if content is None:
-            print("Warning: Could not find content in API response for reasoning")
-            print(f"Response structure: {evaluate_response.keys()}")
-            content = "No reasoning available"
-        
-        reasoning = json.dumps({'reasoning': content}, ensure_ascii=False)
-        messages = json.dumps(model_request['messages'], ensure_ascii=False)
-        values['report_arguments'] = {
-            'serial_num': serial_num,
-            'is_pass': is_pass,
-            'tools_type': tools_type,
-            'ground_truth': ground_truth,
-            'acceptable_arguments': acceptable_arguments,
-            'model_output': model_output,
-            'reasoning': reasoning,
-            'query': messages
-        }
-        return values
+    def get_report_arguments(self, include_messages=True):
+        return self.build_report_arguments({'tools_type': self.request_model['tools_type']},
+                                           'query' if include_messages else None)
 
 
 class DialogResponseFormatter(ResponseFormatter):
-    tsv_keys: Optional[List[str]] = ['serial_num', 'is_pass', 'type_of_output',
-                                     'ground_truth', 'acceptable_arguments',
-                                     'model_output', 'reasoning', 'query']
+    __slots__ = ()
+    tsv_keys = ('serial_num', 'is_pass', 'type_of_output',
+                'ground_truth', 'acceptable_arguments',
+                'model_output', 'reasoning', 'query')
 
-    @root_validator(pre=True)
-    def set_report_params(cls, values):
-        model_request = values.get('request_model', {})
-        model_response = values.get('response_model', {})
-        evaluate_response = values.get('evaluate_response', {})
-        serial_num = model_request['serial_num']
-        is_pass = convert_eval_key(evaluate_response)
-        type_of_output = model_request['type_of_output']
-        ground_truth = json.dumps(model_request['ground_truth'], ensure_ascii=False)
-        acceptable_arguments = json.dumps(model_request['acceptable_arguments'], ensure_ascii=False)
-        model_output = json.dumps(model_response, ensure_ascii=False)
-        
-        # 다양한 API 응답 형식 처리
-        content = None
-        
-        # OpenAI API 형식
-        if 'choices' in evaluate_response and len(evaluate_response['choices']) > 0:
-            if 'message' in evaluate_response['choices'][0] and 'content' in evaluate_response['choices'][0]['message']:
-                content = evaluate_response['choices'][0]['message']['content']
-        
-        # Bedrock API 형식 (Claude)
-        elif 'completion' in evaluate_response:
-            content = evaluate_response['completion']
-        
-        # Bedrock API 형식 (다른 모델)
-        elif 'results' in evaluate_response and len(evaluate_response['results']) > 0:
-            if 'outputText' in evaluate_response['results'][0]:
-                content = evaluate_response['results'][0]['outputText']
-        
-        # 다른 API 형식
-        elif 'content' in evaluate_response:
-            content = evaluate_response['content']
-        
-        # 응답에서 내용을 찾을 수 없는 경우
-        if content is None:
-            print("Warning: Could not find content in API response for reasoning")
-            print(f"Response structure: {evaluate_response.keys()}")
-            content = "No reasoning available"
-        
-        reasoning = json.dumps({'reasoning': content}, ensure_ascii=False)
-        messages = json.dumps(model_request['messages'], ensure_ascii=False)
-        values['report_arguments'] = {
-            'serial_num': serial_num,
-            'is_pass': is_pass,
-            'type_of_output': type_of_output,
-            'ground_truth': ground_truth,
-            'acceptable_arguments': acceptable_arguments,
-            'model_output': model_output,
-            'reasoning': reasoning,
-            'query': messages
-        }
-        return values
+    def get_report_arguments(self, include_messages=True):
+        return self.build_report_arguments({'type_of_output': self.request_model['type_of_output']},
+                                           'query' if include_messages else None)
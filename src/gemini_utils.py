@@ -11,6 +11,7 @@ from vertexai.generative_models import (
     Tool,
 )
 import google.api_core
+from src.metrics_collector import record_usage, record_stream_event
 
 
 def convert_messages_gemini(messages):
@@ -107,7 +108,36 @@ def convert_gemini_to_response(gemini_response):
     return response
 
 
-def call_gemini_model(gemini_model, gemini_temperature, gemini_system_instruction, gemini_tools, gemini_messages):
+def collect_gemini_stream(responses):
+    '''
+    stream=True 로 받은 응답 조각을 합쳐 to_dict() 형식의 응답으로 재구성합니다.
+    첫 토큰, function call 이름, 스트림 종료까지의 시간을 기록합니다 (--latency_bench). 시간은 요청 전에 record_stream_event('start') 로 시작합니다.
+    '''
+    parts, finish_reason, usage_metadata = [], None, None
+    for chunk in responses:
+        chunk = chunk.to_dict()
+        usage_metadata = chunk.get('usage_metadata') or usage_metadata
+        for candidate in chunk.get('candidates', [])[:1]:
+            finish_reason = candidate.get('finish_reason') or finish_reason
+            for part in candidate.get('content', {}).get('parts', []):
+                if 'function_call' in part:
+                    record_stream_event('first_token')
+                    record_stream_event('tool_call')
+                    parts.append(part)
+                elif part.get('text'):
+                    record_stream_event('first_token')
+                    if parts and 'text' in parts[-1]:
+                        parts[-1]['text'] += part['text']
+                    else:
+                        parts.append({'text': part['text']})
+    record_stream_event('end')
+    candidate = {'finish_reason': finish_reason}
+    if parts or finish_reason != 'SAFETY':
+        candidate['content'] = {'role': 'model', 'parts': parts}
+    return {'candidates': [candidate], 'usage_metadata': usage_metadata}
+
+
+def call_gemini_model(gemini_model, gemini_temperature, gemini_system_instruction, gemini_tools, gemini_messages, stream=False):
 
     gemini_model = GenerativeModel(
         model_name=gemini_model,
@@ -125,14 +155,28 @@ def call_gemini_model(gemini_model, gemini_temperature, gemini_system_instructio
     }
 
     try:
-        response = gemini_model.generate_content(gemini_messages, safety_settings=safety_config)
-        response = response.to_dict()
+        if stream:
+            record_stream_event('start')
+            response = collect_gemini_stream(gemini_model.generate_content(gemini_messages, safety_settings=safety_config, stream=True))
+        else:
+            response = gemini_model.generate_content(gemini_messages, safety_settings=safety_config)
+            response = response.to_dict()
     except google.api_core.exceptions.InternalServerError as e:
         print(f'{e}, {gemini_messages}')
         response = {"candidates": [{"finish_reason": "ERROR", "content": {"role": "model", "parts": [{"text": None}]}}]}
     return response
 
 
+def record_gemini_usage(response):
+    """
+    Records the token usage of a Gemini response (to_dict() of the response).
+    """
+    usage_metadata = response.get('usage_metadata') or {}
+    record_usage(prompt_tokens=usage_metadata.get('prompt_token_count'),
+                 completion_tokens=usage_metadata.get('candidates_token_count'),
+                 cached_tokens=usage_metadata.get('cached_content_token_count'))
+
+
 if __name__ == '__main__':
     vertexai.init(project='mm-agent-416400', location='asia-northeast3')
 
@@ -0,0 +1,191 @@
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+import numpy as np
+from src.metrics_collector import get_call_state, new_call_state, use_call_state, merge_call_state, record_hedge, USAGE_KEYS
+from src.sticky_routing import get_route_key, sticky_route
+"""
+This is a package that bounds the provider calls with a deadline (--call_timeout) and hedges the stragglers (--hedge):
+a call still running after the rolling p95 latency of its provider gets a duplicate, and the first answer wins.
+"""
+
+# the hedge delay is only trusted once enough calls have been timed
+HEDGE_MIN_SAMPLES = 20
+HEDGE_WINDOW = 200
+HEDGE_QUANTILE = 95
+HEDGE_MIN_DELAY = 0.5
+
+
+class CallDeadlineExceeded(TimeoutError):
+    pass
+
+
+class AttemptPool:
+    """
+    A bounded pool of daemon threads that run the attempts of the provider calls, started as they are needed.
+    Unlike ThreadPoolExecutor, whose workers are joined at exit, the process does not wait for an abandoned attempt to end.
+    """
+    def __init__(self, max_workers, name='provider-call'):
+        self.max_workers = max_workers
+        self.name = name
+        self.tasks = queue.SimpleQueue()
+        self.workers = 0
+        self.idle_workers = 0
+        self.lock = threading.Lock()
+
+    def submit(self, func):
+        future = Future()
+        with self.lock:
+            self.tasks.put((future, func))
+            if self.idle_workers < self.tasks.qsize() and self.workers < self.max_workers:
+                self.workers += 1
+                threading.Thread(target=self.run_worker, name=f'{self.name}-{self.workers}', daemon=True).start()
+        return future
+
+    def run_worker(self):
+        while True:
+            with self.lock:
+                self.idle_workers += 1
+            future, func = self.tasks.get()
+            with self.lock:
+                self.idle_workers -= 1
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func())
+            except BaseException as e:
+                future.set_exception(e)
+
+
+class HedgedCaller:
+    """
+    A class that wraps the predict method of an API executor.
+
+    Each attempt runs on a bounded pool of daemon threads, two per concurrent call (the call and its duplicate),
+    with the call state (retries, usage, stream timing) and the sticky route of the calling thread,
+    so that the MetricsCollector.call around it still records them.
+    A Python thread can not be interrupted: a call that misses its deadline or loses to its duplicate is abandoned,
+    and its result is dropped when its own request timeout (--request_timeout, boto3 read timeout) ends it.
+    Until then it holds its worker, and its slot in the client pools. Its retries so far are counted in the call,
+    and what it does after it is abandoned (retries, token usage of a late answer) in get_abandoned_report.
+    """
+    def __init__(self, func, call_timeout=None, hedge=False, max_concurrency=1, hedge_quantile=HEDGE_QUANTILE,
+                 min_samples=HEDGE_MIN_SAMPLES, window=HEDGE_WINDOW, min_delay=HEDGE_MIN_DELAY):
+        """
+        Initializes the HedgedCaller.
+
+        Parameters:
+            func (callable): The predict method of the API executor.
+            call_timeout (float, optional): Seconds before a call, retries and duplicate included, raises CallDeadlineExceeded.
+            hedge (bool): Whether to send a duplicate of the calls slower than the rolling latency quantile.
+            max_concurrency (int): The most calls made at once through the caller, the pool runs twice as many attempts.
+            hedge_quantile (float): The latency percentile after which a call is duplicated.
+            min_samples (int): The answered calls needed before the first duplicate.
+            window (int): The number of recent latencies the quantile is taken over.
+            min_delay (float): The shortest wait in seconds before a duplicate.
+        """
+        self.func = func
+        self.call_timeout = call_timeout
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.latencies = deque(maxlen=window)
+        self.lock = threading.Lock()
+        self.pool = AttemptPool(max_workers=2 * max(max_concurrency, 1))
+        self.abandoned = dict({'attempts': 0, 'finished': 0, 'errors': 0, 'retries': 0}, **{key: 0 for key in USAGE_KEYS})
+
+    def get_hedge_delay(self):
+        with self.lock:
+            if not self.hedge or len(self.latencies) < self.min_samples:
+                return None
+            return max(float(np.percentile(self.latencies, self.hedge_quantile)), self.min_delay)
+
+    def start_attempt(self, api_request, route_key):
+        attempt_state = new_call_state()
+
+        def run():
+            with use_call_state(attempt_state), sticky_route(route_key):
+                return self.func(api_request)
+        return self.pool.submit(run), attempt_state
+
+    def abandon_attempts(self, call_state, attempts):
+        """
+        Counts the attempts still running when the call returns or gives up: their retries so far go to the call,
+        what they do afterwards to the abandoned report once they end.
+        """
+        for future, attempt_state in attempts.items():
+            merge_call_state(call_state, attempt_state, answered=False)
+            retries = len(attempt_state['retry_errors'])
+            with self.lock:
+                self.abandoned['attempts'] += 1
+            future.add_done_callback(lambda future, attempt_state=attempt_state, retries=retries:
+                                     self.record_abandoned_attempt(future, attempt_state, retries))
+        if call_state is not None:
+            call_state['hedge']['abandoned'] += len(attempts)
+
+    def record_abandoned_attempt(self, future, attempt_state, retries):
+        with self.lock:
+            self.abandoned['finished'] += 1
+            self.abandoned['retries'] += len(attempt_state['retry_errors']) - retries
+            if future.exception() is not None:
+                self.abandoned['errors'] += 1
+                return
+            for key in USAGE_KEYS:
+                self.abandoned[key] += attempt_state['usage'][key]
+
+    def get_abandoned_report(self):
+        """
+        Returns:
+            dict: the attempts abandoned (past the deadline or beaten by their duplicate), how many have ended since,
+                  as errors or answers, and their retries and token usage after they were abandoned.
+        """
+        with self.lock:
+            return dict(self.abandoned)
+
+    def __call__(self, api_request):
+        if self.call_timeout is None and not self.hedge:
+            return self.func(api_request)
+        call_state = get_call_state()
+        started_at = time.perf_counter()
+        deadline = started_at + self.call_timeout if self.call_timeout else None
+        hedge_delay = self.get_hedge_delay()
+        primary, primary_state = self.start_attempt(api_request, get_route_key())
+        attempts = {primary: primary_state}
+        try:
+            return self.wait_attempts(api_request, call_state, started_at, deadline, hedge_delay, primary, attempts)
+        finally:
+            self.abandon_attempts(call_state, attempts)
+
+    def wait_attempts(self, api_request, call_state, started_at, deadline, hedge_delay, primary, attempts):
+        errors, hedged = [], False
+        while True:
+            now = time.perf_counter()
+            waits = []
+            if deadline is not None:
+                waits.append(deadline - now)
+            if hedge_delay is not None:
+                waits.append(started_at + hedge_delay - now)
+            done, _ = wait(list(attempts), timeout=max(min(waits), 0.0) if waits else None, return_when=FIRST_COMPLETED)
+            for future in done:
+                answered = future.exception() is None
+                merge_call_state(call_state, attempts.pop(future), answered)
+                if answered:
+                    with self.lock:
+                        self.latencies.append(time.perf_counter() - started_at)
+                    if hedged:
+                        record_hedge(won=future is not primary)
+                    return future.result()
+                errors.append(future.exception())
+            if not attempts:
+                raise errors[0]
+            now = time.perf_counter()
+            if deadline is not None and now >= deadline:
+                raise CallDeadlineExceeded(f"provider call exceeded --call_timeout {self.call_timeout}s")
+            if hedge_delay is not None and now >= started_at + hedge_delay:
+                # the duplicate is not pinned, so that a pool sends it to another replica / key / region
+                hedge, hedge_state = self.start_attempt(api_request, None)
+                attempts[hedge] = hedge_state
+                hedge_delay, hedged = None, True
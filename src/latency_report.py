@@ -0,0 +1,107 @@
+import json
+from src.formatter import get_eval_key, get_request_key
+from src.metrics_collector import STREAM_TIMING_KEYS, get_percentiles
+"""
+This is a package that reports the streaming latency of the model calls (--latency_bench) next to their pass/fail verdict.
+"""
+
+GROUP_KEYS = ('tools_type', 'type_of_output', 'is_pass')
+TIMING_LABELS = {'time_to_first_token': 'first token', 'time_to_tool_call': 'tool call', 'stream_time': 'total'}
+
+
+def get_latency_records(generation_metrics, eval_output):
+    """
+    Joins the stream timing of the model calls with the evaluation of their responses.
+
+    Parameters:
+        generation_metrics (list): request metrics of the generation stage (MetricsCollector.get_request_metrics).
+        eval_output (list): evaluation outputs with model_request (EvaluationRegistor.eval_output).
+
+    Returns:
+        list: one record per evaluated request whose model call was streamed in this run,
+              responses loaded from a previous run have no timing and are left out.
+    """
+    timing_dic = {m['request_key']: m for m in generation_metrics if m.get('stream_time') is not None}
+    records = []
+    for data in eval_output:
+        request = data['model_request']
+        request_key = data.get('request_key') or get_request_key(request)
+        request_metric = timing_dic.get(request_key)
+        if request_metric is None:
+            continue
+        record = {
+            'request_key': request_key,
+            'serial_num': request.get('serial_num'),
+            'tools_type': request.get('tools_type'),
+            'type_of_output': request.get('type_of_output'),
+            'is_pass': get_eval_key(data),
+            'latency': request_metric['latency'],
+        }
+        record.update({key: request_metric[key] for key in STREAM_TIMING_KEYS})
+        records.append(record)
+    return records
+
+
+def summarize_group(records):
+    # errored responses were not judged, they are counted apart and left out of the pass rate
+    judged = [r for r in records if r['is_pass'] != 'error']
+    summary = {
+        'requests': len(records),
+        'errors': len(records) - len(judged),
+        'pass_rate': sum(1 for r in judged if r['is_pass'] == 'pass') / len(judged) if judged else None,
+        'tool_calls': sum(1 for r in records if r['time_to_tool_call'] is not None),
+    }
+    for key in STREAM_TIMING_KEYS:
+        summary[key] = get_percentiles([r[key] for r in records if r[key] is not None])
+    return summary
+
+
+def summarize_latency(records):
+    """
+    Aggregates the stream timing percentiles (seconds) of all requests, and per tools_type, output type and verdict.
+    The time to the tool call only covers the responses that called a tool, the pass rate only the judged responses.
+    """
+    summary = {'overall': summarize_group(records)}
+    for group_key in GROUP_KEYS:
+        groups = {}
+        for record in records:
+            if record[group_key] is not None:
+                groups.setdefault(str(record[group_key]), []).append(record)
+        summary[f'by_{group_key}'] = {name: summarize_group(group) for name, group in sorted(groups.items())}
+    return summary
+
+
+def format_timing(percentiles):
+    if percentiles['p50'] is None:
+        return 'n/a'
+    return f"p50 {percentiles['p50']:.2f}s p95 {percentiles['p95']:.2f}s p99 {percentiles['p99']:.2f}s"
+
+
+def display_latency(summary):
+    print("\n[[latency bench]]")
+    rows = [('all', summary['overall'])]
+    for group_key in GROUP_KEYS:
+        rows.extend((f"{group_key} {name}", group) for name, group in summary[f'by_{group_key}'].items())
+    for name, group in rows:
+        timings = ', '.join(f"{TIMING_LABELS[key]} {format_timing(group[key])}" for key in STREAM_TIMING_KEYS)
+        pass_rate = 'n/a' if group['pass_rate'] is None else f"{group['pass_rate']:.3f}"
+        print(f"* {name} : {group['requests']} requests, {group['errors']} errors, pass rate {pass_rate}, "
+              f"{group['tool_calls']} tool calls, {timings}")
+
+
+def report_latency(generation_metrics, eval_output, latency_file_path):
+    """
+    Prints the latency bench report and writes it with the per-request timings (*.latency.json).
+
+    Returns:
+        dict: The summary, or None if no model call of the run was streamed.
+    """
+    records = get_latency_records(generation_metrics, eval_output)
+    if len(records) == 0:
+        return None
+    summary = summarize_latency(records)
+    display_latency(summary)
+    with open(latency_file_path, 'w', encoding='utf-8') as ff:
+        ff.write(json.dumps({'summary': summary, 'requests': records}, ensure_ascii=False, indent=2))
+    print(f"[[latency report : {latency_file_path}]]")
+    return summary
@@ -0,0 +1,459 @@
+import os
+import json
+import time
+import threading
+import numpy as np
+from contextlib import contextmanager
+from src.trace_recorder import trace_span
+from src.formatter import get_request_key
+"""
+This is a package that collects stage wall times and per-request provider metrics of an evaluation run.
+"""
+
+CUR_PATH = os.path.dirname(os.path.abspath(__file__))
+REPO_PATH = '/'.join(CUR_PATH.split('/')[:-1])
+DEFAULT_PRICE_TABLE_PATH = f'{REPO_PATH}/config/price_table.cfg'
+USAGE_KEYS = ('prompt_tokens', 'completion_tokens', 'cached_tokens', 'cache_write_tokens')
+STREAM_TIMING_KEYS = ('time_to_first_token', 'time_to_tool_call', 'stream_time')
+CALL_STATE_KEYS = ('retry_errors', 'usage', 'stream', 'hedge')
+
+# per-thread state of the provider call in progress, filled in by the API executors through record_retry
+_call_state = threading.local()
+
+
+def record_retry(error=None):
+    """
+    Records a retried provider call. The API executors call this from their retry loops,
+    and the retry is attributed to the MetricsCollector.call running in the same thread.
+
+    Parameters:
+        error (Exception, optional): The error that caused the retry.
+    """
+    retry_errors = getattr(_call_state, 'retry_errors', None)
+    if retry_errors is not None:
+        retry_errors.append(type(error).__name__ if error is not None else 'unknown')
+
+
+def record_usage(prompt_tokens=0, completion_tokens=0, cached_tokens=0, provider_latency=None, cache_write_tokens=0):
+    """
+    Records the token usage of a provider response, normalized across providers.
+    prompt_tokens includes cached_tokens and cache_write_tokens. Usage of several responses within one call is accumulated.
+
+    Parameters:
+        prompt_tokens (int): Input tokens, including cached tokens and cache write tokens.
+        completion_tokens (int): Output tokens.
+        cached_tokens (int): Input tokens read from the provider's prompt cache.
+        provider_latency (float, optional): Latency reported by the provider (seconds).
+        cache_write_tokens (int): Input tokens written to the provider's prompt cache (Bedrock cachePoint).
+    """
+    usage = getattr(_call_state, 'usage', None)
+    if usage is None:
+        return
+    usage['prompt_tokens'] += prompt_tokens or 0
+    usage['completion_tokens'] += completion_tokens or 0
+    usage['cached_tokens'] += cached_tokens or 0
+    usage['cache_write_tokens'] += cache_write_tokens or 0
+    if provider_latency is not None:
+        usage['provider_latency'] = (usage['provider_latency'] or 0.0) + provider_latency
+
+
+def get_call_usage():
+    """
+    Returns a copy of the token usage recorded so far by the provider call in progress in this thread, or None outside of a call.
+    """
+    usage = getattr(_call_state, 'usage', None)
+    return dict(usage) if usage is not None else None
+
+
+def record_stream_event(event):
+    """
+    Records the timing of a streaming provider call (--latency_bench), relative to the start of its last attempt.
+    The API executors call this while they read the stream, and the timing is attributed to the MetricsCollector.call
+    running in the same thread.
+
+    Parameters:
+        event (str): start (a new attempt, clears the previous timing), first_token (first content or tool call delta),
+                     tool_call (the tool call name is known) or end (the stream is read). Only the first of each is kept.
+    """
+    stream = getattr(_call_state, 'stream', None)
+    if stream is None:
+        return
+    now = time.perf_counter()
+    if event == 'start':
+        stream.update({key: None for key in STREAM_TIMING_KEYS}, started_at=now)
+        return
+    if stream['started_at'] is None:
+        return
+    key = {'first_token': 'time_to_first_token', 'tool_call': 'time_to_tool_call', 'end': 'stream_time'}[event]
+    if stream[key] is None:
+        stream[key] = now - stream['started_at']
+
+
+def record_stream_timing(time_to_first_token=None, time_to_tool_call=None, stream_time=None):
+    """
+    Records the timing of a streaming provider call as a whole, e.g. when it is replayed from a cassette.
+    """
+    stream = getattr(_call_state, 'stream', None)
+    if stream is not None:
+        stream.update(time_to_first_token=time_to_first_token, time_to_tool_call=time_to_tool_call, stream_time=stream_time)
+
+
+def get_call_stream_timing():
+    """
+    Returns the stream timing recorded so far by the provider call in progress in this thread,
+    or None outside of a call and for calls that did not stream.
+    """
+    stream = getattr(_call_state, 'stream', None)
+    if stream is None or stream['stream_time'] is None:
+        return None
+    return {key: stream[key] for key in STREAM_TIMING_KEYS}
+
+
+def record_hedge(won):
+    """
+    Records that a duplicate of the provider call was sent (--hedge), and whether the duplicate answered first.
+    """
+    hedge = getattr(_call_state, 'hedge', None)
+    if hedge is not None:
+        hedge.update(hedged=True, hedge_won=won)
+
+
+def new_call_state():
+    return {
+        'retry_errors': [],
+        'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'cached_tokens': 0, 'cache_write_tokens': 0, 'provider_latency': None},
+        'stream': dict({key: None for key in STREAM_TIMING_KEYS}, started_at=None),
+        'hedge': {'hedged': False, 'hedge_won': False, 'abandoned': 0},
+    }
+
+
+def get_call_state():
+    """
+    Returns the state of the provider call in progress in this thread, or None outside of a call.
+    """
+    if getattr(_call_state, 'usage', None) is None:
+        return None
+    return {key: getattr(_call_state, key) for key in CALL_STATE_KEYS}
+
+
+@contextmanager
+def use_call_state(state):
+    """
+    Attributes what the API executors record in this thread within the block to the given call state,
+    e.g. an attempt of a call run in another thread (src.hedging).
+
+    Parameters:
+        state (dict): A call state (new_call_state, get_call_state), None to record nothing.
+    """
+    previous_state = {key: getattr(_call_state, key, None) for key in CALL_STATE_KEYS}
+    for key in CALL_STATE_KEYS:
+        setattr(_call_state, key, state[key] if state is not None else None)
+    try:
+        yield
+    finally:
+        for key, value in previous_state.items():
+            setattr(_call_state, key, value)
+
+
+def merge_call_state(state, attempt_state, answered):
+    """
+    Adds an attempt of a call to the call state: its retries, and if it answered, its token usage and stream timing.
+    """
+    if state is None:
+        return
+    state['retry_errors'].extend(attempt_state['retry_errors'])
+    if not answered:
+        return
+    usage = attempt_state['usage']
+    for key in USAGE_KEYS:
+        state['usage'][key] += usage[key]
+    if usage['provider_latency'] is not None:
+        state['usage']['provider_latency'] = (state['usage']['provider_latency'] or 0.0) + usage['provider_latency']
+    state['stream'].update(attempt_state['stream'])
+
+
+def provider_wait(func, api_request):
+    # a named frame around every provider call, so that profilers tag network wait (see stage_profiler)
+    return func(api_request)
+
+
+def get_model_id(executor):
+    # bedrock executors share the model name 'bedrock', the model is identified by its bedrock model id
+    return getattr(executor, 'bedrock_model_id', None) or executor.model
+
+
+def load_price_table(price_table_path=DEFAULT_PRICE_TABLE_PATH):
+    if not price_table_path or not os.path.isfile(price_table_path):
+        return {}
+    with open(price_table_path, 'r', encoding='utf-8') as ff:
+        return json.loads(ff.read()).get('prices', {})
+
+
+def get_price(price_table, model):
+    """
+    Finds the price of a model. The longest price table key contained in the model id wins,
+    so 'gpt-4o-mini' is not priced as 'gpt-4o' and region prefixed bedrock ids still match.
+    """
+    if not model:
+        return None
+    matches = [key for key in price_table if key in model]
+    if not matches:
+        return None
+    return price_table[max(matches, key=len)]
+
+
+def get_percentiles(values):
+    if len(values) == 0:
+        return {'p50': None, 'p95': None, 'p99': None, 'mean': None, 'max': None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'p50': float(p50), 'p95': float(p95), 'p99': float(p99),
+            'mean': float(np.mean(values)), 'max': float(np.max(values))}
+
+
+class MetricsCollector:
+    """
+    A class that records where the time of a run goes: the wall time of each stage
+    (payload creation, generation, judging) and, for each provider call, its latency,
+    retries, error class and the time it waited in the queue before being sent.
+    """
+    def __init__(self, price_table_path=DEFAULT_PRICE_TABLE_PATH, stage_profiler=None):
+        self.price_table = load_price_table(price_table_path)
+        self.stage_profiler = stage_profiler
+        self.origin = time.perf_counter()
+        self.lock = threading.Lock()
+        self.stage_times = {}
+        self.request_metrics = []
+        self.autotune = {}
+        self.hedged_callers = {}
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Measures the wall time of a stage, and profiles it if a stage profiler is set.
+        Repeated measurements of the same stage are accumulated.
+
+        Parameters:
+            name (str): The stage name (payload, generation, judge).
+        """
+        start = time.perf_counter()
+        try:
+            if self.stage_profiler is None:
+                yield
+            else:
+                with self.stage_profiler.profile(name):
+                    yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                stage_time = self.stage_times.setdefault(name, {'wall_time': 0.0, 'count': 0})
+                stage_time['wall_time'] += elapsed
+                stage_time['count'] += 1
+
+    def call(self, stage, provider, func, api_request, queued_at=None, tag_request=None, model=None):
+        """
+        Calls a provider and records its metrics.
+
+        Parameters:
+            stage (str): The stage of the call (generation, judge).
+            provider (str): The provider (API executor) name.
+            func (callable): The provider call, e.g. executor.predict.
+            api_request (dict): The request passed to func.
+            queued_at (float, optional): time.perf_counter() when the request was queued.
+            tag_request (dict, optional): The request whose serial_num, tools_type and type_of_output are recorded. Defaults to api_request.
+            model (str, optional): The model id, used to price the token usage.
+
+        Returns:
+            The result of func(api_request).
+        """
+        tag_request = tag_request if tag_request is not None else api_request
+        started_at = time.perf_counter()
+        for key, value in new_call_state().items():
+            setattr(_call_state, key, value)
+        error_class = None
+        try:
+            with trace_span(stage, 'provider', provider=provider,
+                            serial_num=tag_request.get('serial_num'), tools_type=tag_request.get('tools_type')):
+                return provider_wait(func, api_request)
+        except BaseException as e:
+            error_class = type(e).__name__
+            raise
+        finally:
+            ended_at = time.perf_counter()
+            retry_errors = _call_state.retry_errors
+            usage = _call_state.usage
+            stream = _call_state.stream
+            hedge = _call_state.hedge
+            for key in CALL_STATE_KEYS:
+                setattr(_call_state, key, None)
+            request_metric = {
+                'stage': stage,
+                'provider': provider,
+                'model': model,
+                'serial_num': tag_request.get('serial_num'),
+                'request_key': get_request_key(tag_request) if 'serial_num' in tag_request else None,
+                'tools_type': tag_request.get('tools_type'),
+                'type_of_output': tag_request.get('type_of_output'),
+                'start': started_at - self.origin,
+                'latency': ended_at - started_at,
+                'queue_wait': started_at - queued_at if queued_at is not None else 0.0,
+                'retries': len(retry_errors),
+                'retry_errors': retry_errors,
+                'error_class': error_class,
+            }
+            request_metric.update(usage)
+            request_metric.update({key: stream[key] for key in STREAM_TIMING_KEYS})
+            request_metric.update(hedge)
+            with self.lock:
+                self.request_metrics.append(request_metric)
+
+    def get_request_metrics(self, stage=None):
+        with self.lock:
+            return [m for m in self.request_metrics if stage is None or m['stage'] == stage]
+
+    def add_hedged_caller(self, stage, provider, hedged_caller):
+        """
+        Reports the attempts a HedgedCaller of a stage abandoned (--call_timeout, --hedge), read when the summary is made,
+        so that the attempts that end after their call are counted too.
+        """
+        with self.lock:
+            self.hedged_callers[f"{stage}/{provider}"] = hedged_caller
+
+    def record_autotune(self, stage, provider, report):
+        """
+        Records the concurrency the autotuner of a stage settled on (--autotune).
+
+        Parameters:
+            stage (str): The stage (generation, judge).
+            provider (str): The provider (API executor) name.
+            report (dict): ConcurrencyAutotuner.get_report().
+        """
+        with self.lock:
+            self.autotune[f"{stage}/{provider}"] = report
+
+    def summary(self):
+        """
+        Aggregates the recorded metrics per stage and provider.
+
+        Returns:
+            dict: stage wall times and, per provider, latency / queue wait percentiles (seconds),
+                  requests per second, retry rate, error counts, hedge rate (--hedge), the attempts abandoned
+                  past their deadline or beaten by their duplicate, and the concurrency settled on (--autotune).
+        """
+        with self.lock:
+            request_metrics = list(self.request_metrics)
+            stage_times = {name: dict(stage_time) for name, stage_time in self.stage_times.items()}
+            autotune = dict(self.autotune)
+            hedged_callers = dict(self.hedged_callers)
+        groups = {}
+        for request_metric in request_metrics:
+            groups.setdefault(f"{request_metric['stage']}/{request_metric['provider']}", []).append(request_metric)
+        providers = {}
+        for key, group in groups.items():
+            span = max(m['start'] + m['latency'] for m in group) - min(m['start'] for m in group)
+            retries = sum(m['retries'] for m in group)
+            error_classes = {}
+            for m in group:
+                for error in m['retry_errors'] + ([m['error_class']] if m['error_class'] else []):
+                    error_classes[error] = error_classes.get(error, 0) + 1
+            providers[key] = {
+                'requests': len(group),
+                'errors': sum(1 for m in group if m['error_class']),
+                'retries': retries,
+                'retry_rate': retries / len(group),
+                'requests_per_second': len(group) / span if span > 0 else None,
+                'latency': get_percentiles([m['latency'] for m in group]),
+                'queue_wait': get_percentiles([m['queue_wait'] for m in group]),
+                'error_classes': error_classes,
+                'hedges': sum(1 for m in group if m['hedged']),
+                'hedge_wins': sum(1 for m in group if m['hedge_won']),
+            }
+            providers[key]['hedge_rate'] = providers[key]['hedges'] / len(group)
+        usage = {
+            'by_provider': {key: self.get_usage_totals(group) for key, group in groups.items()},
+            'by_tools_type': self.get_grouped_usage(request_metrics, 'tools_type'),
+            'by_type_of_output': self.get_grouped_usage(request_metrics, 'type_of_output'),
+        }
+        abandoned = {key: hedged_caller.get_abandoned_report() for key, hedged_caller in hedged_callers.items()}
+        return {'stages': stage_times, 'providers': providers, 'usage': usage, 'autotune': autotune, 'abandoned': abandoned}
+
+    def get_cost(self, request_metric):
+        price = get_price(self.price_table, request_metric['model'])
+        if price is None:
+            return None
+        cached_tokens = request_metric['cached_tokens']
+        cache_write_tokens = request_metric['cache_write_tokens']
+        uncached_tokens = request_metric['prompt_tokens'] - cached_tokens - cache_write_tokens
+        return (uncached_tokens * price['input']
+                + cached_tokens * price.get('cached_input', price['input'])
+                + cache_write_tokens * price.get('cache_write_input', price['input'])
+                + request_metric['completion_tokens'] * price['output']) / 1e6
+
+    def get_usage_totals(self, request_metrics):
+        """
+        Sums the token usage of provider calls.
+
+        Returns:
+            dict: token totals, prefix cache hit rate (cached share of the prompt tokens), output tokens per second
+                  of provider latency and estimated cost (USD, None if unpriced).
+        """
+        totals = {key: sum(m[key] for m in request_metrics) for key in USAGE_KEYS}
+        latency = sum(m['latency'] for m in request_metrics)
+        totals['calls'] = len(request_metrics)
+        totals['cache_hit_rate'] = totals['cached_tokens'] / totals['prompt_tokens'] if totals['prompt_tokens'] > 0 else None
+        totals['completion_tokens_per_second'] = totals['completion_tokens'] / latency if latency > 0 else None
+        costs = [self.get_cost(m) for m in request_metrics]
+        totals['estimated_cost'] = sum(costs) if costs and None not in costs else None
+        return totals
+
+    def get_grouped_usage(self, request_metrics, group_key):
+        grouped = {}
+        for request_metric in request_metrics:
+            if request_metric[group_key] is None:
+                continue
+            grouped.setdefault(request_metric['stage'], {}).setdefault(str(request_metric[group_key]), []).append(request_metric)
+        return {stage: {key: self.get_usage_totals(group) for key, group in groups.items()}
+                for stage, groups in grouped.items()}
+
+    def save(self, metrics_file_path):
+        output = self.summary()
+        with self.lock:
+            output['requests'] = list(self.request_metrics)
+        with open(metrics_file_path, 'w', encoding='utf-8') as ff:
+            ff.write(json.dumps(output, ensure_ascii=False, indent=2))
+
+    def display(self):
+        summary = self.summary()
+        print("\n[[metrics]]")
+        for name, stage_time in summary['stages'].items():
+            print(f"* stage {name} : {stage_time['wall_time']:.2f}s")
+        for key, provider in summary['providers'].items():
+            latency = provider['latency']
+            rps = provider['requests_per_second'] or 0.0
+            print(f"* {key} : {provider['requests']} requests, {rps:.2f} req/s, "
+                  f"latency p50 {latency['p50']:.2f}s p95 {latency['p95']:.2f}s p99 {latency['p99']:.2f}s, "
+                  f"queue wait p95 {provider['queue_wait']['p95']:.2f}s, "
+                  f"retry rate {provider['retry_rate']:.3f}, errors {provider['errors']}"
+                  + (f", hedge rate {provider['hedge_rate']:.3f} ({provider['hedge_wins']} won)" if provider['hedges'] else ''))
+        for key, usage in summary['usage']['by_provider'].items():
+            tokens_per_second = usage['completion_tokens_per_second'] or 0.0
+            cost = f"${usage['estimated_cost']:.4f}" if usage['estimated_cost'] is not None else 'unpriced'
+            # a server that does not report cached tokens can not be told from a cold cache, so no hit rate without any
+            cached = f"cached {usage['cached_tokens']}"
+            if usage['cached_tokens'] > 0:
+                cached += f", cache hit rate {usage['cache_hit_rate']:.3f}"
+            if usage['cache_write_tokens'] > 0:
+                cached += f", cache write {usage['cache_write_tokens']}"
+            print(f"* usage {key} : prompt {usage['prompt_tokens']} ({cached}), "
+                  f"completion {usage['completion_tokens']} tokens, {tokens_per_second:.1f} tokens/s, cost {cost}")
+        for key, report in summary['abandoned'].items():
+            if report['attempts'] == 0:
+                continue
+            print(f"* abandoned {key} : {report['attempts']} attempts, {report['finished']} ended since "
+                  f"({report['errors']} errors, {report['retries']} retries), "
+                  f"prompt {report['prompt_tokens']} / completion {report['completion_tokens']} tokens of late answers")
+        for key, report in summary['autotune'].items():
+            base_latency = f"{report['base_latency']:.2f}s" if report['base_latency'] is not None else 'n/a'
+            print(f"* autotune {key} : settled at concurrency {report['settled_concurrency']} "
+                  f"(range {report['min_concurrency']}-{report['max_concurrency']} of {report['concurrency_ceiling']}, "
+                  f"{report['batches']} batches, back-offs on errors {report['backoffs']['errors']} / latency {report['backoffs']['latency']}, "
+                  f"base latency {base_latency})")
@@ -1,6 +1,98 @@
+import re
+import json
+import math
 import time
+import threading
+import urllib.error
+import urllib.request
+import httpx
 import openai
+from urllib.parse import urlparse
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
+from src.metrics_collector import record_retry, record_usage, record_stream_event
+from src.trace_recorder import trace_span
+from src.sticky_routing import StickyRoutes
+
+
+# shared HTTP connection pool of the OpenAI compatible clients, set up by configure_http_pool before the clients are created
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_REQUEST_TIMEOUT = 600.0
+CONNECT_TIMEOUT = 10.0
+KEEPALIVE_EXPIRY = 120.0
+WARM_UP_TIMEOUT = 10.0
+_http_pool = {'max_connections': DEFAULT_MAX_CONNECTIONS, 'http2': False, 'request_timeout': DEFAULT_REQUEST_TIMEOUT, 'client': None}
+_http_pool_lock = threading.Lock()
+
+
+def configure_http_pool(max_connections=None, http2=False, request_timeout=None):
+    """
+    Sets up the HTTP connection pool shared by every OpenAI compatible client of the process (model and judge calls).
+    Clients created before keep the previous pool.
+
+    Parameters:
+        max_connections (int, optional): Connections of the pool, all kept alive between calls. Match it to the concurrency of the run.
+        http2 (bool): Negotiates HTTP/2 with the servers that support it (requires the h2 package).
+        request_timeout (float, optional): Seconds before a call times out (default 600, connecting times out after 10).
+    """
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            raise Exception("--http2 requires the h2 package (pip install 'httpx[http2]')")
+    with _http_pool_lock:
+        _http_pool['max_connections'] = max_connections or DEFAULT_MAX_CONNECTIONS
+        _http_pool['http2'] = http2
+        _http_pool['request_timeout'] = request_timeout or DEFAULT_REQUEST_TIMEOUT
+        _http_pool['client'] = None
+
+
+def get_request_timeout():
+    return httpx.Timeout(_http_pool['request_timeout'], connect=CONNECT_TIMEOUT)
+
+
+def get_http_client():
+    """
+    Returns the shared HTTP client of the OpenAI compatible clients, created on first use with the settings of configure_http_pool.
+    """
+    with _http_pool_lock:
+        if _http_pool['client'] is None:
+            limits = httpx.Limits(max_connections=_http_pool['max_connections'],
+                                  max_keepalive_connections=_http_pool['max_connections'],
+                                  keepalive_expiry=KEEPALIVE_EXPIRY)
+            _http_pool['client'] = openai.DefaultHttpxClient(limits=limits, timeout=get_request_timeout(), http2=_http_pool['http2'])
+        return _http_pool['client']
+
+
+def create_openai_client(azure=False, **kwargs):
+    """
+    Creates an OpenAI (or Azure OpenAI) client on the shared HTTP connection pool, with an explicit request timeout.
+    """
+    client_cls = openai.AzureOpenAI if azure else openai.OpenAI
+    return client_cls(http_client=get_http_client(), timeout=get_request_timeout(), **kwargs)
+
+
+def warm_up_clients(clients, connections):
+    """
+    Opens and keeps alive the connections of the clients before the calls are timed, so that the first batch
+    does not pay for connection setup (TCP, TLS). Each client lists the models of its server, connections calls at once.
+    Failures are ignored: an error response still leaves its connection open.
+
+    Parameters:
+        clients (list): The OpenAI compatible clients.
+        connections (int): The connections to open, spread over the clients.
+    """
+    if not clients or connections < 1:
+        return
+
+    def list_models(client):
+        try:
+            client.with_options(max_retries=0, timeout=WARM_UP_TIMEOUT).models.list()
+        except Exception:
+            pass
+    per_client = max(1, math.ceil(connections / len(clients)))
+    with ThreadPoolExecutor(max_workers=per_client * len(clients)) as pool:
+        list(pool.map(list_models, [client for client in clients for _ in range(per_client)]))
 
 
 def retry_on_limit(func, retries=5, wait=120):
@@ -11,6 +103,530 @@ def retry_on_limit(func, retries=5, wait=120):
                 return func(*args, **kwargs)
             except openai.RateLimitError as error:
                 print(str(error))
-                time.sleep(wait)
+                record_retry(error)
+                with trace_span('retry_sleep', 'retry', attempt=i, wait=wait):
+                    time.sleep(wait)
         raise openai.RateLimitError
     return wrapper
+
+
+def record_openai_usage(response):
+    """
+    Records the token usage of an OpenAI compatible chat completion (model_dump() of the response).
+    """
+    usage = response.get('usage') or {}
+    prompt_tokens_details = usage.get('prompt_tokens_details') or {}
+    record_usage(prompt_tokens=usage.get('prompt_tokens'),
+                 completion_tokens=usage.get('completion_tokens'),
+                 cached_tokens=prompt_tokens_details.get('cached_tokens'))
+
+
+def collect_openai_stream(stream):
+    """
+    Reads a streamed chat completion (stream=True) and rebuilds the response of a non-streaming call (model_dump() shape),
+    recording the time to the first token, to the tool call name and to the end of the stream (--latency_bench).
+    The timing starts at record_stream_event('start'), before the request is sent.
+
+    Parameters:
+        stream (Stream): The chunks of the chat completion.
+
+    Returns:
+        dict: The chat completion.
+    """
+    response = {'id': None, 'object': 'chat.completion', 'model': None, 'usage': None}
+    content_parts, tool_calls, finish_reason = [], {}, None
+    for chunk in stream:
+        response['id'] = response['id'] or chunk.id
+        response['model'] = response['model'] or chunk.model
+        if chunk.usage is not None:
+            response['usage'] = chunk.usage.model_dump()
+        for choice in chunk.choices:
+            delta = choice.delta
+            if delta.content:
+                record_stream_event('first_token')
+                content_parts.append(delta.content)
+            for tool_call in delta.tool_calls or []:
+                record_stream_event('first_token')
+                entry = tool_calls.setdefault(tool_call.index, {'id': None, 'type': 'function', 'function': {'name': '', 'arguments': ''}})
+                entry['id'] = entry['id'] or tool_call.id
+                if tool_call.function is not None and tool_call.function.name:
+                    record_stream_event('tool_call')
+                    entry['function']['name'] += tool_call.function.name
+                if tool_call.function is not None and tool_call.function.arguments:
+                    entry['function']['arguments'] += tool_call.function.arguments
+            finish_reason = choice.finish_reason or finish_reason
+    record_stream_event('end')
+    response['choices'] = [{
+        'index': 0,
+        'finish_reason': finish_reason,
+        'message': {
+            'role': 'assistant',
+            'content': ''.join(content_parts) if content_parts else None,
+            'function_call': None,
+            'tool_calls': [tool_calls[index] for index in sorted(tool_calls)] or None,
+        },
+    }]
+    return response
+
+
+def create_chat_completion(chat_completion, stream=False, **kwargs):
+    """
+    Calls a chat completion function and returns the response as a dict (model_dump() shape).
+
+    Parameters:
+        chat_completion (callable): e.g. client.chat.completions.create or OpenaiClientPool.create.
+        stream (bool): If True, the completion is streamed and rebuilt by collect_openai_stream (--latency_bench).
+        kwargs: The arguments of the chat completion.
+    """
+    if stream:
+        # the timing starts before the request is sent, the first token includes the time to the response headers
+        record_stream_event('start')
+        return collect_openai_stream(chat_completion(stream=True, stream_options={'include_usage': True}, **kwargs))
+    return chat_completion(**kwargs).model_dump()
+
+
+def release_after_stream(stream, release):
+    """
+    Iterates a streamed chat completion and calls release once it is read to the end, fails or is closed,
+    so that a pool member counts as in flight while its stream is still being read.
+
+    Parameters:
+        stream (Stream): The chunks of the chat completion.
+        release (callable): Releases the pool member of the call.
+    """
+    try:
+        yield from stream
+    finally:
+        release()
+
+
+# a member whose rate limit headers do not say when the window resets (azure) is taken out of rotation for this long
+DEFAULT_RESET_SECONDS = 10.0
+# character based token estimate of a request, used to skip members whose remaining tokens can not take it
+CHARS_PER_TOKEN = 4
+RESET_DURATION_PATTERN = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+
+
+def parse_reset_duration(value):
+    """
+    Parses the x-ratelimit-reset-* header of OpenAI ("1s", "6m0s", "20ms") into seconds.
+
+    Returns:
+        float: The seconds, or None if the header is missing or unreadable.
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {'ms': 0.001, 's': 1.0, 'm': 60.0, 'h': 3600.0}
+    matches = RESET_DURATION_PATTERN.findall(value)
+    if not matches:
+        return None
+    return sum(float(amount) * units[unit] for amount, unit in matches)
+
+
+def get_retry_after(headers):
+    """
+    Reads the wait of a 429 response (retry-after-ms, retry-after) in seconds, None if the response has none.
+    """
+    if headers is None:
+        return None
+    for key, scale in (('retry-after-ms', 0.001), ('retry-after', 1.0)):
+        try:
+            return float(headers.get(key)) * scale
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def get_header_int(headers, key):
+    try:
+        return int(float(headers.get(key)))
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_request_tokens(kwargs):
+    text = json.dumps(kwargs.get('messages', []), ensure_ascii=False) + json.dumps(kwargs.get('tools') or [], ensure_ascii=False)
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+class OpenaiPoolMember:
+    """
+    A member of the client pool (one key, or one azure endpoint / key / deployment) and its last known rate limit state.
+    """
+    def __init__(self, name, client, model=None):
+        self.name = name
+        self.client = client
+        self.model = model
+        self.remaining_requests = None
+        self.limit_requests = None
+        self.remaining_tokens = None
+        self.limit_tokens = None
+        self.saturated_until = 0.0
+        self.in_flight = 0
+        self.reserved_tokens = 0
+        self.requests = 0
+        self.rate_limits = 0
+        self.saturations = 0
+
+    def get_headroom(self):
+        # share of the requests / tokens left in the current window, the in flight requests are not in the headers yet
+        headroom = 1.0
+        if self.remaining_requests is not None and self.limit_requests:
+            headroom = min(headroom, (self.remaining_requests - self.in_flight) / self.limit_requests)
+        if self.remaining_tokens is not None and self.limit_tokens:
+            headroom = min(headroom, (self.remaining_tokens - self.reserved_tokens) / self.limit_tokens)
+        return headroom
+
+    def can_take(self, tokens):
+        return self.remaining_tokens is None or self.remaining_tokens - self.reserved_tokens >= tokens
+
+
+class OpenaiClientPool:
+    """
+    A pool of OpenAI / Azure OpenAI clients over several keys, endpoints and deployments, each with its own quota.
+
+    Every request goes to the member with the most requests and tokens left in its rate limit window,
+    read from the x-ratelimit-remaining-requests / x-ratelimit-remaining-tokens headers of its last response.
+    A member that is out of requests or tokens, or that answers 429, is taken out of rotation until its window resets
+    (x-ratelimit-reset-*, retry-after) and its requests fail over to the other members.
+    """
+    def __init__(self, api_keys, api_bases=None, models=None, api_version=None, max_rate_limits=5):
+        """
+        Initializes the OpenaiClientPool.
+
+        Parameters:
+            api_keys (list): The API keys. One key is shared by every endpoint.
+            api_bases (list, optional): The azure endpoints. None for OpenAI.
+            models (list, optional): The azure deployments, one for all endpoints or one per endpoint.
+                                     None if the model is given per request (OpenAI).
+            api_version (str, optional): The azure API version.
+            max_rate_limits (int): The number of 429 responses per member after which a request gives up.
+        """
+        is_azure = api_bases is not None
+        n_members = max(len(api_keys), len(api_bases or []), len(models or []))
+        api_keys = self.broadcast(api_keys, n_members, 'api keys')
+        api_bases = self.broadcast(api_bases or [None], n_members, 'endpoints')
+        models = self.broadcast(models or [None], n_members, 'deployments')
+        # with several members a 429 fails over right away instead of being retried by the client
+        max_retries = 0 if n_members > 1 else openai.DEFAULT_MAX_RETRIES
+        self.members = []
+        for api_key, api_base, model in zip(api_keys, api_bases, models):
+            if is_azure:
+                client = create_openai_client(azure=True, azure_endpoint=api_base, api_key=api_key, api_version=api_version, max_retries=max_retries)
+                name = f"{urlparse(api_base).netloc or api_base}/{model}" if api_base else str(model)
+            else:
+                client = create_openai_client(api_key=api_key, max_retries=max_retries)
+                name = f"key ...{str(api_key)[-4:]}"
+            self.members.append(OpenaiPoolMember(name, client, model))
+        self.max_rate_limits = max_rate_limits
+        self.lock = threading.Lock()
+        self.next_index = 0
+        self.sticky_routes = StickyRoutes()
+
+    @staticmethod
+    def broadcast(values, n_members, name):
+        if len(values) == 1:
+            return values * n_members
+        if len(values) != n_members:
+            raise Exception(f"openai pool {name} ({len(values)}) must be one or one per member ({n_members})")
+        return values
+
+    def acquire(self, tokens=0):
+        """
+        Selects the member with the most headroom, or the member pinned to the session of the call (sticky_route) if it is available.
+        If every member is saturated, waits for the first window to reset.
+
+        Parameters:
+            tokens (int): The estimated tokens of the request, members that have fewer tokens left are skipped if possible.
+
+        Returns:
+            OpenaiPoolMember: The selected member.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                # members are scanned from a rotating start, so that ties (no headers yet) are spread round robin
+                members = self.members[self.next_index:] + self.members[:self.next_index]
+                available = [member for member in members if member.saturated_until <= now]
+                if available:
+                    candidates = [member for member in available if member.can_take(tokens)] or available
+                    member = self.sticky_routes.get(candidates) or max(candidates, key=lambda m: (round(m.get_headroom(), 2), -m.in_flight))
+                    self.sticky_routes.pin(member)
+                    member.in_flight += 1
+                    member.reserved_tokens += tokens
+                    member.requests += 1
+                    self.next_index = (self.members.index(member) + 1) % len(self.members)
+                    return member
+                wait = min(member.saturated_until for member in self.members) - now
+            with trace_span('pool_wait', 'retry', wait=wait):
+                time.sleep(max(wait, 0.0))
+
+    def release(self, member, tokens=0, headers=None, rate_limited=False):
+        """
+        Applies the result of a request to the state of its member.
+
+        Parameters:
+            member (OpenaiPoolMember): The member returned by acquire.
+            tokens (int): The estimated tokens passed to acquire.
+            headers (Mapping, optional): The response headers.
+            rate_limited (bool): Whether the response was a 429.
+        """
+        with self.lock:
+            member.in_flight -= 1
+            member.reserved_tokens -= tokens
+            reset = None
+            if headers is not None:
+                reset = self.update_rate_limits(member, headers)
+            if rate_limited:
+                member.rate_limits += 1
+                reset = get_retry_after(headers) or reset or DEFAULT_RESET_SECONDS
+            if reset is not None:
+                member.saturations += 1
+                member.saturated_until = max(member.saturated_until, time.monotonic() + reset)
+
+    def update_rate_limits(self, member, headers):
+        """
+        Reads the rate limit headers of a response.
+
+        Returns:
+            float: The seconds until the member can take requests again if it is saturated, None otherwise.
+        """
+        reset = None
+        for kind in ('requests', 'tokens'):
+            remaining = get_header_int(headers, f'x-ratelimit-remaining-{kind}')
+            if remaining is None:
+                continue
+            # azure does not always send the limit, the largest remaining value seen stands in for it
+            limit = get_header_int(headers, f'x-ratelimit-limit-{kind}') or max(getattr(member, f'limit_{kind}') or 0, remaining)
+            setattr(member, f'remaining_{kind}', remaining)
+            setattr(member, f'limit_{kind}', limit)
+            if remaining <= 0:
+                kind_reset = parse_reset_duration(headers.get(f'x-ratelimit-reset-{kind}')) or DEFAULT_RESET_SECONDS
+                reset = max(reset or 0.0, kind_reset)
+        return reset
+
+    def create(self, **kwargs):
+        """
+        Creates a chat completion on the member with the most headroom, failing over to the other members on 429.
+        The model of an azure member (its deployment) replaces the model argument.
+
+        Returns:
+            ChatCompletion: The parsed response.
+        """
+        tokens = estimate_request_tokens(kwargs)
+        rate_limit_cnt = 0
+        while True:
+            member = self.acquire(tokens)
+            if member.model is not None:
+                kwargs['model'] = member.model
+            try:
+                raw_response = member.client.chat.completions.with_raw_response.create(**kwargs)
+            except openai.RateLimitError as error:
+                self.release(member, tokens, error.response.headers, rate_limited=True)
+                rate_limit_cnt += 1
+                print(f".. rate limited on {member.name}, failover .. {rate_limit_cnt}")
+                if rate_limit_cnt >= self.max_rate_limits * len(self.members):
+                    raise
+                record_retry(error)
+                continue
+            except Exception:
+                self.release(member, tokens)
+                raise
+            if kwargs.get('stream'):
+                # the member stays in flight until collect_openai_stream has read the last chunk
+                return release_after_stream(raw_response.parse(), lambda: self.release(member, tokens, raw_response.headers))
+            self.release(member, tokens, raw_response.headers)
+            return raw_response.parse()
+
+    def warm_up(self, connections):
+        warm_up_clients([member.client for member in self.members], connections)
+
+    def get_status(self):
+        with self.lock:
+            return [{'member': member.name, 'requests': member.requests, 'rate_limits': member.rate_limits,
+                     'saturations': member.saturations, 'remaining_requests': member.remaining_requests,
+                     'remaining_tokens': member.remaining_tokens, 'in_flight': member.in_flight} for member in self.members]
+
+
+# status codes of a replica that is down or restarting, the request fails over to another replica
+REPLICA_DOWN_STATUS_CODES = (502, 503, 504)
+
+
+def check_replica_health(base_url, api_key=None, timeout=2.0):
+    """
+    Checks an OpenAI compatible server (vLLM, TGI, ..): GET /health at the server root, or GET {base_url}/models if it has none.
+
+    Parameters:
+        base_url (str): The base URL of the API (e.g. http://host:8000/v1).
+        api_key (str, optional): Sent as a bearer token.
+        timeout (float): Seconds to wait for the server.
+
+    Returns:
+        bool: True if the server answers.
+    """
+    api_url = base_url.rstrip('/')
+    server_url = api_url[:-len('/v1')] if api_url.endswith('/v1') else api_url
+    headers = {'Authorization': f'Bearer {api_key}'} if api_key else {}
+    for url in (f'{server_url}/health', f'{api_url}/models'):
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=timeout) as response:
+                return response.status < 500
+        except urllib.error.HTTPError as error:
+            if error.code == 404:
+                continue
+            return error.code < 500
+        except (urllib.error.URLError, OSError):
+            return False
+    return True
+
+
+def is_replica_down_error(error):
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code in REPLICA_DOWN_STATUS_CODES
+
+
+class ReplicaMember:
+    """
+    A replica of the replica pool and its load.
+    """
+    def __init__(self, base_url, client):
+        self.base_url = base_url
+        self.client = client
+        self.healthy = True
+        self.in_flight = 0
+        self.outstanding_tokens = 0
+        self.requests = 0
+        self.failures = 0
+
+
+class OpenaiReplicaPool:
+    """
+    A pool of replicas of one OpenAI compatible model server (e.g. vLLM behind several base URLs).
+
+    Every request goes to the healthy replica with the fewest requests in flight, then the fewest estimated tokens in flight,
+    so that long requests do not pile up on one replica as with round robin.
+    A replica that refuses connections or answers 502/503/504 is dropped at once and the request fails over to another one.
+    A background thread checks every replica (/health, else /models) every health_interval seconds,
+    dropping the dead replicas and bringing back the recovered ones.
+    """
+    def __init__(self, base_urls, api_key=None, health_interval=10.0, health_timeout=2.0, unavailable_timeout=60.0):
+        """
+        Initializes the OpenaiReplicaPool.
+
+        Parameters:
+            base_urls (list): The base URLs of the replicas.
+            api_key (str, optional): The API key of the replicas.
+            health_interval (float): Seconds between two health checks of the replicas (0 disables the background checks).
+            health_timeout (float): Seconds to wait for a health check.
+            unavailable_timeout (float): Seconds a request waits for a replica to come back when every replica is down.
+        """
+        # with several replicas a dead replica fails over right away instead of being retried by the client
+        max_retries = 0 if len(base_urls) > 1 else openai.DEFAULT_MAX_RETRIES
+        self.members = [ReplicaMember(base_url, create_openai_client(base_url=base_url, api_key=api_key, max_retries=max_retries))
+                        for base_url in base_urls]
+        self.api_key = api_key
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.unavailable_timeout = unavailable_timeout
+        self.lock = threading.Lock()
+        self.sticky_routes = StickyRoutes()
+        self.stop_event = threading.Event()
+        if len(self.members) > 1 and health_interval > 0:
+            threading.Thread(target=self.run_health_checks, name='replica-health', daemon=True).start()
+
+    def run_health_checks(self):
+        while not self.stop_event.wait(self.health_interval):
+            self.check_health()
+
+    def check_health(self):
+        for member in self.members:
+            healthy = check_replica_health(member.base_url, self.api_key, self.health_timeout)
+            with self.lock:
+                if healthy != member.healthy:
+                    print(f".. replica {member.base_url} is {'back' if healthy else 'down'}")
+                member.healthy = healthy
+
+    def stop(self):
+        self.stop_event.set()
+
+    def acquire(self, tokens=0):
+        """
+        Selects the healthy replica with the least outstanding requests, or the replica pinned to the session of the call
+        (sticky_route) if it is healthy.
+        If every replica is down, checks them again until one is back or unavailable_timeout is over.
+
+        Parameters:
+            tokens (int): The estimated tokens of the request.
+
+        Returns:
+            ReplicaMember: The selected replica.
+        """
+        deadline = time.monotonic() + self.unavailable_timeout
+        while True:
+            with self.lock:
+                available = [member for member in self.members if member.healthy]
+                if available:
+                    member = self.sticky_routes.get(available) or min(available, key=lambda m: (m.in_flight, m.outstanding_tokens, m.requests))
+                    self.sticky_routes.pin(member)
+                    member.in_flight += 1
+                    member.outstanding_tokens += tokens
+                    member.requests += 1
+                    return member
+            if time.monotonic() >= deadline:
+                raise Exception(f"no healthy replica: {[member.base_url for member in self.members]}")
+            with trace_span('pool_wait', 'retry', wait=self.health_timeout):
+                self.check_health()
+                if not any(member.healthy for member in self.members):
+                    time.sleep(min(self.health_interval or 1.0, max(deadline - time.monotonic(), 0.0)))
+
+    def release(self, member, tokens=0, failed=False):
+        with self.lock:
+            member.in_flight -= 1
+            member.outstanding_tokens -= tokens
+            if failed:
+                member.failures += 1
+                if member.healthy:
+                    print(f".. replica {member.base_url} is down")
+                member.healthy = False
+
+    def create(self, **kwargs):
+        """
+        Creates a chat completion on the replica with the least outstanding requests,
+        failing over to the other replicas if it is down.
+
+        Returns:
+            ChatCompletion: The response.
+        """
+        tokens = estimate_request_tokens(kwargs)
+        attempts = 0
+        while True:
+            member = self.acquire(tokens)
+            try:
+                response = member.client.chat.completions.create(**kwargs)
+            except Exception as error:
+                down = is_replica_down_error(error)
+                self.release(member, tokens, failed=down and len(self.members) > 1)
+                attempts += 1
+                if not down or attempts >= len(self.members):
+                    raise
+                record_retry(error)
+                continue
+            if kwargs.get('stream'):
+                return release_after_stream(response, lambda: self.release(member, tokens))
+            self.release(member, tokens)
+            return response
+
+    def warm_up(self, connections):
+        with self.lock:
+            clients = [member.client for member in self.members if member.healthy]
+        warm_up_clients(clients, connections)
+
+    def get_status(self):
+        with self.lock:
+            return [{'base_url': member.base_url, 'healthy': member.healthy, 'requests': member.requests,
+                     'failures': member.failures, 'in_flight': member.in_flight} for member in self.members]
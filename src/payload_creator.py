@@ -1,5 +1,7 @@
 import os
+import copy
 import json
+import hashlib
 from functools import wraps
 from typing import Any, Callable
 from tqdm import tqdm
@@ -10,6 +12,10 @@ from src.formatter import (
     SingleCallRequestFormatter,
 )
 
+CUR_PATH = os.path.dirname(os.path.abspath(__file__))
+# the compiled dataset depends on the normalization code as well as on the data
+CODE_VERSION_FILES = (f'{CUR_PATH}/payload_creator.py', f'{CUR_PATH}/formatter.py')
+
 
 def validate_params(kwargs):
     expected_types = {
@@ -17,7 +23,9 @@ def validate_params(kwargs):
         'input_file_path': str,
         'system_prompt_file_path': str,
         'reset': bool,
-        'tools_type': str
+        'tools_type': str,
+        'compiled_dir': str,
+        'save_request_file': bool
     }
     tools_type_list = ['all', 'exact', '4_close', '4_random', '8_close', '8_random']
     for key, expected_type in expected_types.items():
@@ -60,9 +68,45 @@ class AbstractPayloadCreator:
         if system_prompt_file_path:
             self.system_prompt = self.get_prompt_text(system_prompt_file_path)
 
+    @type_check(validate_params)
     def create_payload(self, **kwargs):
         """
-        Abstract method to create a payload for an API request. Must be implemented by subclasses.
+        Creates the API request payloads for an evaluation set.
+        The normalized payloads are stored in a compiled artifact tagged with a content hash of the source file,
+        the system prompt, the payload options and the code version, and are reused whenever the hash matches.
+
+        Parameters:
+            input_file_path (str): Path to the evaluation set (data/FunctionChat-*.jsonl).
+            request_file_path (str): Path where the requests jsonl file is written.
+            reset (bool): Whether to reset the model outputs. A compiled artifact with a matching hash is still reused.
+            tools_type (str, optional): The tools type to filter (singlecall only).
+            compiled_dir (str, optional): Directory of the compiled artifacts. Defaults to the directory of the request file.
+            save_request_file (bool, optional): Whether to write the requests jsonl file. Defaults to True.
+
+        Returns:
+            list: A list of API request payloads.
+        """
+        compile_hash = self.get_compile_hash(kwargs['input_file_path'], kwargs.get('tools_type'))
+        compiled_file_path = self.get_compiled_file_path(kwargs['request_file_path'], compile_hash, kwargs.get('compiled_dir'))
+        api_request_list = self.load_compiled_payload(compiled_file_path, compile_hash)
+        if api_request_list is None:
+            test_set = utils.load_to_jsonl(kwargs['input_file_path'])
+            # update input file max_size
+            self.max_size = len(test_set)
+            api_request_list = self.compile_payload(test_set, **kwargs)
+            self.save_compiled_payload(api_request_list, compiled_file_path, compile_hash)
+        elif utils.is_exist_file(kwargs['request_file_path']):
+            return api_request_list
+        if kwargs.get('save_request_file', True) is False:
+            return api_request_list
+        # write requests jsonl file
+        utils.save_to_jsonl(api_request_list, kwargs['request_file_path'])
+        print(f"[[model request file : {kwargs['request_file_path']}]]")
+        return api_request_list
+
+    def compile_payload(self, test_set, **kwargs):
+        """
+        Abstract method to normalize an evaluation set into API request payloads. Must be implemented by subclasses.
 
         Raises:
             NotImplementedError: Indicates that the method needs to be implemented by the subclass.
@@ -85,44 +129,83 @@ class AbstractPayloadCreator:
                 prompt = ff.read().strip()
         return prompt
 
-    def load_cached_payload(self, request_file_path):
+    def get_compile_hash(self, input_file_path, tools_type=None):
         """
-        Loads cached payload list from a specified file if it exists and meets the required size.
+        Computes the content hash of everything the compiled payloads depend on.
 
         Parameters:
-            request_file_path (str): Path to the file containing cached payloads.
+            input_file_path (str): Path to the evaluation set.
+            tools_type (str, optional): The tools type to filter (singlecall only).
 
         Returns:
-            list: A list of cached payloads if they exist; otherwise, an empty list.
+            str: sha256 hex digest.
         """
-        if utils.is_exist_file(request_file_path):
-            api_request_list = utils.load_to_jsonl(request_file_path)
-            if len(api_request_list) == self.max_size:
-                print(f"[[already existed request jsonl file]] ..{len(api_request_list)}\npath : {request_file_path}")
-                print(f"[[already existed request jsonl file]] ..{len(api_request_list)}")
-                return api_request_list
-            print("[[recreate requests jsonl list]]")
-        else:
-            print("[[create requests jsonl list]]")
-        return []
+        sha = hashlib.sha256()
+        for file_path in (input_file_path, *CODE_VERSION_FILES):
+            with open(file_path, 'rb') as ff:
+                sha.update(hashlib.sha256(ff.read()).digest())
+        options = {
+            'class': type(self).__name__,
+            'system_prompt': self.system_prompt,
+            'temperature': self.temperature,
+            'tools_type': tools_type,
+        }
+        sha.update(json.dumps(options, ensure_ascii=False, sort_keys=True).encode('utf-8'))
+        return sha.hexdigest()
+
+    def get_compiled_file_path(self, request_file_path, compile_hash, compiled_dir=None):
+        prefix = request_file_path.rsplit('.jsonl', 1)[0]
+        if compiled_dir:
+            prefix = f"{compiled_dir}/{os.path.basename(prefix)}"
+        return f"{prefix}.{compile_hash[:16]}.compiled.jsonl"
+
+    def load_compiled_payload(self, compiled_file_path, compile_hash):
+        """
+        Loads the compiled payloads if an artifact with the same content hash exists.
+        The artifact is plain jsonl: a header line with the content hash, then one payload per line.
+
+        Parameters:
+            compiled_file_path (str): Path to the compiled artifact.
+            compile_hash (str): The expected content hash.
+
+        Returns:
+            list: The compiled payloads, or None if there is no valid artifact.
+        """
+        if not utils.is_exist_file(compiled_file_path):
+            print("[[compile requests]]")
+            return None
+        try:
+            with open(compiled_file_path, 'r', encoding='utf-8') as ff:
+                header = json.loads(ff.readline())
+                if header.get('compile_hash') != compile_hash:
+                    print(f"[[recompile requests]] .. hash mismatch {compiled_file_path}")
+                    return None
+                api_request_list = [json.loads(line) for line in ff]
+        except Exception as e:
+            print(f"[[recompile requests]] .. failed to load {compiled_file_path} ({e})")
+            return None
+        if len(api_request_list) != header.get('size'):
+            print(f"[[recompile requests]] .. truncated {compiled_file_path}")
+            return None
+        print(f"[[already compiled requests]] ..{len(api_request_list)}\npath : {compiled_file_path}")
+        return api_request_list
+
+    def save_compiled_payload(self, api_request_list, compiled_file_path, compile_hash):
+        # write to a temporary file first, so concurrent runs never read a partial artifact
+        tmp_file_path = f"{compiled_file_path}.{os.getpid()}.tmp"
+        with open(tmp_file_path, 'w', encoding='utf-8') as ff:
+            ff.write(f"{json.dumps({'compile_hash': compile_hash, 'size': len(api_request_list)})}\n")
+            for api_request in api_request_list:
+                ff.write(f"{json.dumps(api_request, ensure_ascii=False)}\n")
+        os.replace(tmp_file_path, compiled_file_path)
 
 
 class CommonPayloadCreator(AbstractPayloadCreator):
     def __init__(self, temperature):
         super().__init__(temperature, 0, None)
 
-    @type_check(validate_params)
-    def create_payload(self, **kwargs):
-        test_set = utils.load_to_jsonl(kwargs['input_file_path'])
-        self.max_size = len(test_set)
+    def compile_payload(self, test_set, **kwargs):
         api_request_list = []
-        if kwargs['reset'] is False:
-            api_request_list = self.load_cached_payload(kwargs['request_file_path'])
-            if len(api_request_list) == self.max_size:
-                return api_request_list
-        else:
-            print("[[reset!! create requests jsonl file]]")
-        # 2. create requests json list
         for idx, test_input in enumerate(tqdm(test_set)):
             # test_input keys = ['serial_num', 'category', 'input_message', 'input_tools', 'type_of_output', 'ground_truth', 'acceptable_arguments']
             serial_num = test_input['serial_num']
@@ -142,11 +225,6 @@ class CommonPayloadCreator(AbstractPayloadCreator):
             arguments['temperature'] = self.temperature
             arguments['tool_choice'] = 'auto'
             api_request_list.append(CommonRequestFormatter(**arguments).to_dict())
-        # 3. write requests jsonl file
-        fi = open(kwargs['request_file_path'], 'w')
-        for api_request in api_request_list:
-            fi.write(f"{json.dumps(api_request, ensure_ascii=False)}\n")
-        fi.close()
         return api_request_list
 
 
@@ -154,21 +232,8 @@ class DialogPayloadCreator(AbstractPayloadCreator):
     def __init__(self, temperature, system_prompt_file_path):
         super().__init__(temperature, 200, system_prompt_file_path)
 
-    @type_check(validate_params)
-    def create_payload(self, **kwargs):
-        test_set = utils.load_to_jsonl(kwargs['input_file_path'])
-        # update input file max_size
-        self.max_size = len(test_set)
-        # kwargs keys = ['input_file_path', 'request_file_path', 'reset']
-        # 1. check to cached file
+    def compile_payload(self, test_set, **kwargs):
         api_request_list = []
-        if kwargs['reset'] is False:
-            api_request_list = self.load_cached_payload(kwargs['request_file_path'])
-            if len(api_request_list) == self.max_size:
-                return api_request_list
-        else:
-            print("[[reset!! create requests jsonl file]]")
-        # 2. create requests json list
         for idx, test_input in enumerate(tqdm(test_set)):
             # test_input keys = ['dialog_num', 'tools_count', 'tools', 'turns']
             tools = test_input['tools']
@@ -180,12 +245,9 @@ class DialogPayloadCreator(AbstractPayloadCreator):
                 arguments['messages'] = messages
                 arguments['temperature'] = self.temperature
                 arguments['tool_choice'] = 'auto'
+                # the turns of a dialog share their prefix, --dialog_sticky schedules them together
+                arguments['dialog_num'] = test_input.get('dialog_num')
                 api_request_list.append(DialogRequestFormatter(**arguments).to_dict())
-        # 3. write requests jsonl file
-        fi = open(kwargs['request_file_path'], 'w')
-        for api_request in api_request_list:
-            fi.write(f"{json.dumps(api_request, ensure_ascii=False)}\n")
-        fi.close()
         return api_request_list
 
 
@@ -193,21 +255,9 @@ class SingleCallPayloadCreator(AbstractPayloadCreator):
     def __init__(self, temperature, system_prompt_file_path):
         super().__init__(temperature, 500, system_prompt_file_path)
 
-    @type_check(validate_params)
-    def create_payload(self, **kwargs):
+    def compile_payload(self, test_set, **kwargs):
         # kwargs keys = ['input_file_path', 'request_file_path', 'reset', 'tools_type']
-        test_set = utils.load_to_jsonl(kwargs['input_file_path'])
-        # update input file max_size
-        self.max_size = len(test_set)
-        # 1. check to cached file
         api_request_list = []
-        if kwargs['reset'] is False:
-            api_request_list = self.load_cached_payload(kwargs['request_file_path'])
-            if len(api_request_list) == self.max_size:
-                return api_request_list
-        else:
-            print("[[reset!! create requests jsonl file]]")
-        # 2. create requests json list
         for idx, test_input in enumerate(tqdm(test_set)):
             # test_input keys = ['function_num', 'function_name', 'function_info', 'query',
             #                    'ground_truth', 'acceptable_arguments', 'tools']
@@ -218,25 +268,27 @@ class SingleCallPayloadCreator(AbstractPayloadCreator):
                 if tools_type == 'all' or t['type'] == tools_type:
                     tools_list.append((t['content'], t['type']))
             for q_idx, query in enumerate(test_input['query']):
+                if not tools_list:
+                    continue
                 messages = [{'role': 'system', 'content': self.system_prompt}, {'role': 'user', 'content': query['content']}]
+                # validate (and repair ground_truth) once per query; the tools_type rows only differ in tools
+                tools, t_type = tools_list[0]
+                arguments = {
+                    'serial_num': query['serial_num'],
+                    'messages': messages,
+                    'temperature': self.temperature,
+                    'tool_choice': 'auto',
+                    'tools': tools,
+                    'tools_type': t_type,
+                    'acceptable_arguments': test_input['acceptable_arguments'][q_idx]['content'],
+                    'ground_truth': test_input['ground_truth'][q_idx]['content'],
+                }
+                validated_request = SingleCallRequestFormatter(**arguments).to_dict()
                 for tools, t_type in tools_list:
-                    arguments = {
-                        'serial_num': query['serial_num'],
-                        'messages': messages,
-                        'temperature': self.temperature,
-                        'tool_choice': 'auto',
-                        'tools': tools,
-                        'tools_type': t_type,
-                        'acceptable_arguments': test_input['acceptable_arguments'][q_idx]['content'],
-                        'ground_truth': test_input['ground_truth'][q_idx]['content'],
-                    }
-                    api_request_list.append(SingleCallRequestFormatter(**arguments).to_dict())
-        # 3. write requests jsonl file
-        fi = open(kwargs['request_file_path'], 'w')
-        for api_request in api_request_list:
-            fi.write(f"{json.dumps(api_request, ensure_ascii=False)}\n")
-        fi.close()
-        print(f"[[model request file : {kwargs['request_file_path']}]]")
+                    # every row owns its objects, as a row loaded from the compiled artifact does
+                    api_request = copy.deepcopy(validated_request)
+                    api_request.update(tools=copy.deepcopy(tools), tools_type=t_type)
+                    api_request_list.append(api_request)
         return api_request_list
 
 
@@ -1,8 +1,29 @@
+import os
 import json
+import time
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 from src import utils
 from src.api_executor import APIExecutorFactory
+from src.metrics_collector import MetricsCollector, get_model_id
+from src.trace_recorder import trace_span
+from src.sticky_routing import sticky_route
+from src.hedging import HedgedCaller, CallDeadlineExceeded
+from src.formatter import mark_error_response, is_error_response
+from src.autotuner import get_autotuner
+
+
+def get_model_concurrency(batch_size, use_async=False, dialog_sticky=False, autotune=False):
+    """
+    Returns the most model calls in flight at once: the autotuned ceiling (--autotune),
+    batch_size with --use_async or --dialog_sticky, else 1.
+    """
+    if autotune:
+        return get_autotuner(autotune, batch_size).max_concurrency
+    if batch_size > 1 and (use_async or dialog_sticky):
+        return batch_size
+    return 1
 
 
 class ResponseHandler:
@@ -10,7 +31,9 @@ class ResponseHandler:
     A class responsible for managing API responses, including loading cached responses.
     """
     def __init__(self, model, api_key, base_url, model_path, gcloud_project_id, gcloud_location, 
-                aws_secret_key=None, aws_region=None, bedrock_model_id=None, batch_size=1, use_async=False):
+                aws_secret_key=None, aws_region=None, bedrock_model_id=None, batch_size=1, use_async=False,
+                metrics_collector=None, cassette=None, latency_bench=False, dialog_sticky=False, bedrock_prompt_cache=False,
+                call_timeout=None, hedge=False, autotune=False):
         """
         Initializes the ResponseHandler with a specific API executor based on the model configuration.
 
@@ -26,7 +49,21 @@ class ResponseHandler:
             bedrock_model_id (str, optional): Bedrock 모델 ID
             batch_size (int, optional): 배치 처리 크기
             use_async (bool, optional): 비동기 처리 여부
+            metrics_collector (MetricsCollector, optional): Collector of the generation metrics, shared with the other stages of the run.
+            cassette (Cassette, optional): Records or replays the model calls (--record, --replay).
+            latency_bench (bool, optional): Streams the model calls to time the first token and the tool call (--latency_bench).
+            dialog_sticky (bool, optional): Runs the turns of a dialog back to back on the same pool member, dialogs in parallel (--dialog_sticky).
+            bedrock_prompt_cache (bool, optional): Bedrock cachePoint 를 시스템 프롬프트와 도구 목록 뒤에 추가할지 여부 (--bedrock_prompt_cache)
+            call_timeout (float, optional): Seconds before a model call, retries included, fails (--call_timeout).
+            hedge (bool, optional): Sends a duplicate of the model calls slower than their rolling p95 latency (--hedge).
+            autotune (bool, optional): Tunes the concurrency of the model calls from their latency and errors, batch_size being its ceiling (--autotune).
         """
+        self.batch_size = batch_size
+        self.use_async = use_async
+        self.dialog_sticky = dialog_sticky
+        self.autotuner = get_autotuner(autotune, batch_size)
+        # the concurrent model calls run on their own threads, the default executor of asyncio is capped at min(32, cpus + 4)
+        self.call_pool = ThreadPoolExecutor(max_workers=self.get_concurrency(), thread_name_prefix='model-call')
         self.executor = APIExecutorFactory().get_model_api(
             model_name=model, 
             api_key=api_key,
@@ -36,10 +73,39 @@ class ResponseHandler:
             gcloud_location=gcloud_location,
             aws_secret_key=aws_secret_key,
             aws_region=aws_region,
-            bedrock_model_id=bedrock_model_id
+            bedrock_model_id=bedrock_model_id,
+            bedrock_prompt_cache=bedrock_prompt_cache
         )
-        self.batch_size = batch_size
-        self.use_async = use_async
+        self.metrics_collector = metrics_collector if metrics_collector is not None else MetricsCollector()
+        self.provider = type(self.executor).__name__
+        self.model_id = get_model_id(self.executor)
+        if latency_bench:
+            if not hasattr(self.executor, 'predict_stream'):
+                raise Exception(f"--latency_bench is not supported by {self.provider} (streaming: openai, azure, bedrock, gemini)")
+            self.executor.predict = self.executor.predict_stream
+        if call_timeout is not None or hedge:
+            self.executor.predict = HedgedCaller(self.executor.predict, call_timeout=call_timeout, hedge=hedge,
+                                                 max_concurrency=self.get_concurrency())
+            self.metrics_collector.add_hedged_caller('generation', self.provider, self.executor.predict)
+        # replayed calls open no connection
+        self.warm_up_connections = None
+        if cassette is None or cassette.mode == 'record':
+            self.warm_up_connections = getattr(self.executor, 'warm_up', None)
+        if cassette is not None:
+            self.executor = cassette.wrap(self.executor, 'generation')
+
+    def get_concurrency(self):
+        return get_model_concurrency(self.batch_size, self.use_async, self.dialog_sticky, self.autotuner is not None)
+
+    def warm_up(self):
+        """
+        Opens the connections of the concurrent model calls before the generation stage is timed (OpenAI compatible executors).
+        """
+        if self.warm_up_connections is None:
+            return
+        with trace_span('warm_up', 'io', connections=self.get_concurrency()):
+            self.warm_up_connections(self.get_concurrency())
+        self.warm_up_connections = None
 
     def load_cached_response(self, predict_file_path, max_size):
         """
@@ -62,6 +128,31 @@ class ResponseHandler:
                 return outputs
         return []
 
+    def predict(self, api_request, queued_at=None):
+        """
+        Calls the model API for a single request and records its latency, retries and queue wait.
+
+        Parameters:
+            api_request (dict): API 요청 데이터
+            queued_at (float, optional): time.perf_counter() when the request was queued.
+
+        Returns:
+            dict: API 응답 데이터
+        """
+        try:
+            return self.metrics_collector.call('generation', self.provider, self.executor.predict, api_request, queued_at,
+                                               model=self.model_id)
+        except CallDeadlineExceeded as e:
+            # saved as an errored response instead of stopping the run, --retry_errors re-runs it
+            return mark_error_response({'role': 'assistant', 'content': None, 'tool_calls': None}, f"deadline: {e}")
+
+    def flush(self, fp):
+        """
+        Flushes the response file, so that completed responses survive a crash and can be resumed.
+        """
+        with trace_span('flush', 'io', path=fp.name):
+            fp.flush()
+
     async def predict_async(self, api_request):
         """
         비동기적으로 API 요청을 처리합니다.
@@ -73,7 +164,7 @@ class ResponseHandler:
             dict: API 응답 데이터
         """
         loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, self.executor.predict, api_request)
+        return await loop.run_in_executor(self.call_pool, self.predict, api_request, time.perf_counter())
     
     async def process_batch_async(self, batch_requests, fp):
         """
@@ -107,14 +198,191 @@ class ResponseHandler:
             list: 응답 결과 목록
         """
         batch_results = []
+        queued_at = time.perf_counter()
         for request in batch_requests:
-            result = self.executor.predict(request)
+            result = self.predict(request, queued_at)
             batch_results.append(result)
             fp.write(f'{json.dumps(result, ensure_ascii=False)}\n')
             
         return batch_results
 
-    def fetch_and_save(self, api_request_list, predict_file_path, reset, sample, debug):
+    def predict_dialog(self, dialog_requests, queued_at=None):
+        """
+        Calls the model API for the turns of a dialog one after another, pinned to the same pool member,
+        so that each turn can reuse the prefix cached by the previous one.
+
+        Parameters:
+            dialog_requests (list): The requests of the turns, in order.
+            queued_at (float, optional): time.perf_counter() when the dialog was queued.
+
+        Returns:
+            list: The responses of the turns.
+        """
+        with sticky_route(f"dialog-{dialog_requests[0].get('dialog_num')}"):
+            return [self.predict(request, queued_at if idx == 0 else None) for idx, request in enumerate(dialog_requests)]
+
+    async def process_dialog_batch_async(self, batch_dialogs, fp):
+        """
+        Runs a batch of dialogs concurrently, each dialog turn by turn, and writes the responses in request order.
+
+        Parameters:
+            batch_dialogs (list): The dialogs of the batch, each a list of requests.
+            fp (file): 결과를 저장할 파일 객체
+
+        Returns:
+            list: 응답 결과 목록
+        """
+        loop = asyncio.get_event_loop()
+        queued_at = time.perf_counter()
+        tasks = [loop.run_in_executor(self.call_pool, self.predict_dialog, dialog_requests, queued_at) for dialog_requests in batch_dialogs]
+        dialog_results = await asyncio.gather(*tasks)
+        batch_results = [result for results in dialog_results for result in results]
+        for result in batch_results:
+            fp.write(f'{json.dumps(result, ensure_ascii=False)}\n')
+        return batch_results
+
+    def fetch_dialogs(self, api_request_list, fp):
+        """
+        Fetches responses dialog by dialog (--dialog_sticky): batch_size dialogs run in parallel,
+        the turns of each dialog back to back on the same pool member.
+
+        Parameters:
+            api_request_list (list): List of API requests to process, the turns of a dialog next to each other.
+            fp (file): File object to write the responses to.
+
+        Returns:
+            list: Responses in request order.
+        """
+        dialogs = []
+        for api_request in api_request_list:
+            if dialogs and api_request.get('dialog_num') is not None and dialogs[-1][-1].get('dialog_num') == api_request['dialog_num']:
+                dialogs[-1].append(api_request)
+            else:
+                dialogs.append([api_request])
+        if self.autotuner is not None:
+            print(f" ** dialog sticky : {len(dialogs)} dialogs, autotuned parallelism")
+            return self.fetch_autotuned(dialogs, self.process_dialog_batch_async, fp)
+        batches = [dialogs[i:i+self.batch_size] for i in range(0, len(dialogs), self.batch_size)]
+        print(f" ** dialog sticky : {len(dialogs)} dialogs, {self.batch_size} in parallel")
+        outputs = []
+        loop = asyncio.get_event_loop()
+        for batch in tqdm(batches):
+            with trace_span('batch', 'batch', size=len(batch), dialogs=True):
+                batch_results = loop.run_until_complete(self.process_dialog_batch_async(batch, fp))
+            self.flush(fp)
+            outputs.extend(batch_results)
+        return outputs
+
+    def fetch_autotuned(self, units, process_batch_async, fp):
+        """
+        Fetches responses in batches sized by the autotuner (--autotune): after each batch, the concurrency of the next one
+        is raised or lowered from the latency, throughput and errors of the model calls of the batch.
+
+        Parameters:
+            units (list): The requests, or the dialogs (--dialog_sticky), to process.
+            process_batch_async (callable): process_batch_async or process_dialog_batch_async.
+            fp (file): File object to write the responses to.
+
+        Returns:
+            list: Responses in request order.
+        """
+        outputs = []
+        loop = asyncio.get_event_loop()
+        index = 0
+        with tqdm(total=len(units)) as progress:
+            while index < len(units):
+                batch = units[index:index + self.autotuner.get_concurrency()]
+                measured = len(self.metrics_collector.get_request_metrics('generation'))
+                started_at = time.perf_counter()
+                with trace_span('batch', 'batch', size=len(batch), autotune=True):
+                    batch_results = loop.run_until_complete(process_batch_async(batch, fp))
+                wall_time = time.perf_counter() - started_at
+                self.flush(fp)
+                self.autotuner.update(self.metrics_collector.get_request_metrics('generation')[measured:], wall_time)
+                self.metrics_collector.record_autotune('generation', self.provider, self.autotuner.get_report())
+                outputs.extend(batch_results)
+                index += len(batch)
+                progress.update(len(batch))
+        return outputs
+
+    def fetch(self, api_request_list, fp):
+        """
+        Fetches responses for the given requests in batches and appends them to an open response file.
+
+        Parameters:
+            api_request_list (list): List of API requests to process.
+            fp (file): File object to write the responses to.
+
+        Returns:
+            list: Responses in request order.
+        """
+        if self.dialog_sticky:
+            return self.fetch_dialogs(api_request_list, fp)
+        if self.autotuner is not None:
+            return self.fetch_autotuned(api_request_list, self.process_batch_async, fp)
+        outputs = []
+        # 배치 처리
+        if self.batch_size > 1:
+            # 배치 단위로 분할
+            batches = [api_request_list[i:i+self.batch_size] 
+                      for i in range(0, len(api_request_list), self.batch_size)]
+            
+            # 비동기 처리
+            if self.use_async:
+                loop = asyncio.get_event_loop()
+                for batch in tqdm(batches):
+                    with trace_span('batch', 'batch', size=len(batch), use_async=True):
+                        batch_results = loop.run_until_complete(self.process_batch_async(batch, fp))
+                    self.flush(fp)
+                    outputs.extend(batch_results)
+            # 동기 처리
+            else:
+                for batch in tqdm(batches):
+                    with trace_span('batch', 'batch', size=len(batch), use_async=False):
+                        batch_results = self.process_batch(batch, fp)
+                    self.flush(fp)
+                    outputs.extend(batch_results)
+        # 단일 처리 (기존 방식)
+        else:
+            for api_request in tqdm(api_request_list):
+                response_output = self.predict(api_request)
+                outputs.append(response_output)
+                fp.write(f'{json.dumps(response_output, ensure_ascii=False)}\n')
+                self.flush(fp)
+        return outputs
+
+    def retry_error_responses(self, api_request_list, outputs, predict_file_path):
+        """
+        Re-runs the requests whose cached response is tagged as an error (--retry_errors) and rewrites the response file.
+
+        Parameters:
+            api_request_list (list): List of API requests, in the order of the responses.
+            outputs (list): The cached responses, possibly fewer than the requests.
+            predict_file_path (str): File path of the responses.
+
+        Returns:
+            list: The responses, the errored ones replaced by their new response.
+        """
+        error_indices = [idx for idx, output in enumerate(outputs) if is_error_response(output)]
+        if len(error_indices) == 0:
+            return outputs
+        print(f" ** retry errors : {len(error_indices)} errored responses")
+        retry_file_path = f'{predict_file_path}.retry'
+        self.warm_up()
+        with open(retry_file_path, 'w') as fp, self.metrics_collector.stage('generation'):
+            retried_outputs = self.fetch([api_request_list[idx] for idx in error_indices], fp)
+        outputs = list(outputs)
+        for idx, output in zip(error_indices, retried_outputs):
+            outputs[idx] = output
+        # the response file is replaced at once, a crash leaves the previous one
+        tmp_file_path = f'{predict_file_path}.tmp'
+        with trace_span('flush', 'io', path=predict_file_path):
+            utils.save_to_jsonl(outputs, tmp_file_path)
+            os.replace(tmp_file_path, predict_file_path)
+        utils.delete_file(retry_file_path)
+        return outputs
+
+    def fetch_and_save(self, api_request_list, predict_file_path, reset, sample, debug, retry_errors=False):
         """
         Fetches responses from the API and saves them. If responses are partially cached, it continues from where it left off.
 
@@ -124,6 +392,7 @@ class ResponseHandler:
             reset (bool): If True, it overwrite existing cached responses; if False, append to them.
             sample (bool): If True, it executes only a single input to fetch the response. (e.g., for quick testing).
             debug (bool): If True, it print detailed debug information.
+            retry_errors (bool): If True, the cached responses tagged as an error are re-run first.
 
         Returns:
             list: A list of all responses fetched and saved.
@@ -132,14 +401,20 @@ class ResponseHandler:
         # 1. check continuos
         if reset is False:
             outputs = self.load_cached_response(predict_file_path, len(api_request_list))
+            if retry_errors:
+                outputs = self.retry_error_responses(api_request_list, outputs, predict_file_path)
             if len(outputs) == len(api_request_list):
+                self.report_error_responses(outputs)
                 return outputs
         write_option = 'a' if reset is False else 'w'
         start_index = len(outputs)
         
         # 2. fetch
         print(f" ** start index : {start_index} ..(reset is {reset})")
-        print(f" ** batch size : {self.batch_size}, async mode : {self.use_async}")
+        if self.autotuner is not None:
+            print(f" ** autotune : concurrency 1 to {self.autotuner.max_concurrency}")
+        else:
+            print(f" ** batch size : {self.batch_size}, async mode : {self.use_async}")
         
         # 샘플 모드인 경우 한 개만 처리
         if sample:
@@ -147,30 +422,15 @@ class ResponseHandler:
         else:
             api_request_list = api_request_list[start_index:]
         
-        with open(predict_file_path, write_option) as fp:
-            # 배치 처리
-            if self.batch_size > 1:
-                # 배치 단위로 분할
-                batches = [api_request_list[i:i+self.batch_size] 
-                          for i in range(0, len(api_request_list), self.batch_size)]
-                
-                # 비동기 처리
-                if self.use_async:
-                    loop = asyncio.get_event_loop()
-                    for batch in tqdm(batches):
-                        batch_results = loop.run_until_complete(self.process_batch_async(batch, fp))
-                        outputs.extend(batch_results)
-                # 동기 처리
-                else:
-                    for batch in tqdm(batches):
-                        batch_results = self.process_batch(batch, fp)
-                        outputs.extend(batch_results)
-            # 단일 처리 (기존 방식)
-            else:
-                for api_request in tqdm(api_request_list):
-                    response_output = self.executor.predict(api_request)
-                    outputs.append(response_output)
-                    fp.write(f'{json.dumps(response_output, ensure_ascii=False)}\n')
+        self.warm_up()
+        with open(predict_file_path, write_option) as fp, self.metrics_collector.stage('generation'):
+            outputs.extend(self.fetch(api_request_list, fp))
         
         print(f"[[model response file : {predict_file_path}]]")
+        self.report_error_responses(outputs)
         return outputs
+
+    def report_error_responses(self, outputs):
+        error_count = sum(1 for output in outputs if is_error_response(output))
+        if error_count > 0:
+            print(f" ** errored responses : {error_count}/{len(outputs)} (re-run them with --retry_errors)")
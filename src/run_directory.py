@@ -0,0 +1,160 @@
+import os
+import json
+import fcntl
+import socket
+import hashlib
+from datetime import datetime
+"""
+This is a package that manages per-configuration run directories, so that parallel runs never share output files.
+"""
+
+# secrets and options that do not change the results are not part of the run configuration
+RUN_CONFIG_EXCLUDED_KEYS = (
+    'api_key', 'aws_secret_key', 'judge_api_key', 'judge_aws_secret_key',
+    'reset', 'debug', 'batch_size', 'use_async', 'eval_format', 'trace', 'profile',
+    'record', 'replay_latency_scale', 'plan', 'dialog_sticky', 'bedrock_prompt_cache',
+    'http2', 'request_timeout', 'call_timeout', 'hedge', 'autotune', 'retry_errors',
+)
+# file options are identified by their content, not by their path
+RUN_CONFIG_FILE_KEYS = ('input_path', 'system_prompt_path')
+
+
+def get_file_hash(file_path):
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as ff:
+        for chunk in iter(lambda: ff.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def get_run_config(evaluation_type, params):
+    """
+    Builds the effective run configuration from the command options.
+
+    Parameters:
+        evaluation_type (str): The type of evaluation (common, dialog, singlecall).
+        params (dict): The command options (click context params).
+
+    Returns:
+        dict: The run configuration, without secrets.
+    """
+    config = {'evaluation_type': evaluation_type}
+    for key, value in sorted(params.items()):
+        if key in RUN_CONFIG_EXCLUDED_KEYS:
+            continue
+        config[key] = value
+        if key in RUN_CONFIG_FILE_KEYS and value and os.path.isfile(value):
+            config[f'{key}_sha256'] = get_file_hash(value)
+    return config
+
+
+def get_config_hash(config):
+    hash_config = {key: value for key, value in config.items() if key not in RUN_CONFIG_FILE_KEYS}
+    return hashlib.sha256(json.dumps(hash_config, ensure_ascii=False, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class RunDirectory:
+    """
+    A class that holds the artifacts of one run configuration in its own directory.
+
+    The directory name ends with a hash of the effective configuration, so runs with the same configuration
+    resume each other while runs with a different model id, temperature, system prompt or judge never share files.
+    A run holds an exclusive lock on the directory while it is active and records its state in manifest.json.
+    """
+    def __init__(self, output_path, run_name, config):
+        """
+        Initializes the RunDirectory.
+
+        Parameters:
+            output_path (str): Parent directory of the run directories.
+            run_name (str): Human readable prefix of the run directory and its files.
+            config (dict): The effective run configuration (see get_run_config).
+        """
+        self.run_name = run_name
+        self.config = config
+        self.config_hash = get_config_hash(config)
+        self.path = f"{output_path}/{run_name}.{self.config_hash[:12]}"
+        self.lock_file_path = f"{self.path}/run.lock"
+        self.manifest_file_path = f"{self.path}/manifest.json"
+        self.lock_fd = None
+
+    def get_file_path(self, file_name):
+        return f"{self.path}/{file_name}"
+
+    def acquire(self):
+        """
+        Takes the run lock. The lock is a flock on run.lock, so it is released by the OS
+        if the process dies and a stale lock file never blocks the next run.
+
+        Raises:
+            Exception: If another process is running the same configuration.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        fd = os.open(self.lock_file_path, os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            owner = os.read(fd, 1024).decode('utf-8', errors='replace').strip()
+            os.close(fd)
+            raise Exception(f"run directory is locked by another process ({owner}): {self.path}")
+        os.ftruncate(fd, 0)
+        os.write(fd, json.dumps({'pid': os.getpid(), 'host': socket.gethostname()}).encode('utf-8'))
+        self.lock_fd = fd
+
+    def release(self):
+        if self.lock_fd is None:
+            return
+        os.ftruncate(self.lock_fd, 0)
+        fcntl.flock(self.lock_fd, fcntl.LOCK_UN)
+        os.close(self.lock_fd)
+        self.lock_fd = None
+
+    def load_manifest(self):
+        if not os.path.isfile(self.manifest_file_path):
+            return {}
+        with open(self.manifest_file_path, 'r', encoding='utf-8') as ff:
+            return json.loads(ff.read())
+
+    def write_manifest(self, status):
+        """
+        Writes manifest.json atomically.
+
+        Parameters:
+            status (str): running, finished, failed or interrupted.
+        """
+        now = datetime.now().isoformat(timespec='seconds')
+        manifest = self.load_manifest()
+        manifest.update({
+            'run_name': self.run_name,
+            'config_hash': self.config_hash,
+            'config': self.config,
+            'status': status,
+            'pid': os.getpid(),
+            'host': socket.gethostname(),
+            'updated_at': now,
+            'files': sorted(name for name in os.listdir(self.path) if name not in ('run.lock', 'manifest.json')),
+        })
+        manifest.setdefault('created_at', now)
+        tmp_file_path = f"{self.manifest_file_path}.{os.getpid()}.tmp"
+        with open(tmp_file_path, 'w', encoding='utf-8') as ff:
+            ff.write(json.dumps(manifest, ensure_ascii=False, indent=2, default=str))
+        os.replace(tmp_file_path, self.manifest_file_path)
+
+    def __enter__(self):
+        self.acquire()
+        self.write_manifest('running')
+        print(f"[[run directory : {self.path}]]")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            status = 'finished'
+        elif issubclass(exc_type, KeyboardInterrupt):
+            status = 'interrupted'
+        else:
+            status = 'failed'
+        try:
+            self.write_manifest(status)
+        finally:
+            self.release()
+        return False
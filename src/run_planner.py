@@ -0,0 +1,208 @@
+import os
+import glob
+import json
+import math
+from src.formatter import get_eval_key, get_request_key
+"""
+This is a package that estimates the provider calls, input tokens and wall time of a run before it is started (--plan).
+"""
+
+CUR_PATH = os.path.dirname(os.path.abspath(__file__))
+REPO_PATH = '/'.join(CUR_PATH.split('/')[:-1])
+# character based token heuristic, close enough for mixed korean / english / json payloads to size a run
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def get_type_of_output(eval_type, api_request):
+    # singlecall requests are always calls (see EvaluationHandler.evaluate_request)
+    return 'call' if eval_type == 'singlecall' else api_request['type_of_output']
+
+
+def count_lines(file_path):
+    if not os.path.isfile(file_path):
+        return 0
+    with open(file_path, 'r', encoding='utf-8') as ff:
+        return sum(1 for line in ff if line.strip())
+
+
+def get_rubric_chars():
+    rubric_chars = {}
+    for output_type in ['call', 'completion', 'relevance', 'slot']:
+        rubric_file_path = f'{REPO_PATH}/data/rubric_{output_type}.txt'
+        if os.path.isfile(rubric_file_path):
+            with open(rubric_file_path, 'r', encoding='utf-8') as ff:
+                rubric_chars[output_type] = len(ff.read().strip())
+    return rubric_chars
+
+
+def find_prior_file(run_directory, file_suffix, model):
+    """
+    Finds the file of a prior run: the run directory itself first, then the latest run of the same model
+    on the same evaluation set, then the latest run of any model on it.
+
+    Parameters:
+        run_directory (RunDirectory): The run directory of the planned run.
+        file_suffix (str): The file suffix (eval.jsonl, metrics.json).
+        model (str): The model of the planned run.
+
+    Returns:
+        str: The file path, or None if no prior run has the file.
+    """
+    file_path = run_directory.get_file_path(f'{run_directory.run_name}.{file_suffix}')
+    if os.path.isfile(file_path):
+        return file_path
+    output_path = os.path.dirname(run_directory.path)
+    test_prefix = run_directory.run_name.split('.')[0]
+    for pattern in (f'{test_prefix}.{model}.*', f'{test_prefix}.*'):
+        file_paths = glob.glob(f'{output_path}/{pattern}/*.{file_suffix}')
+        if file_paths:
+            return max(file_paths, key=os.path.getmtime)
+    return None
+
+
+def get_exact_pass_rate(eval_file_path, eval_type, api_request_list):
+    """
+    Computes the share of call requests that a prior run passed by exact match, so that they needed no judge call.
+
+    Returns:
+        tuple: (exact pass rate, number of call records), (None, 0) if the file holds no call records.
+    """
+    request_dic = {get_request_key(request): request for request in api_request_list}
+    call_count, exact_pass_count = 0, 0
+    with open(eval_file_path, 'r', encoding='utf-8') as ff:
+        for line in ff:
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            request = data.get('model_request') or request_dic.get(data.get('request_key'))
+            if request is None or get_type_of_output(eval_type, request) != 'call':
+                continue
+            call_count += 1
+            if 'evaluate_response' in data:
+                is_exact = data['evaluate_response'].get('id') == 'exact-match'
+            else:
+                is_exact = str(data.get('reasoning', '')).startswith('exact-eval')
+            exact_pass_count += int(is_exact and get_eval_key(data) == 'pass')
+    if call_count == 0:
+        return None, 0
+    return exact_pass_count / call_count, call_count
+
+
+def get_prior_latency(metrics_file_path, stage):
+    with open(metrics_file_path, 'r', encoding='utf-8') as ff:
+        providers = json.loads(ff.read()).get('providers', {})
+    for key, provider in providers.items():
+        if key.startswith(f'{stage}/') and provider['latency']['mean'] is not None:
+            return provider['latency']
+    return None
+
+
+def plan_run(eval_type, api_request_list, run_directory, predict_file_path, eval_file_path,
+             model, batch_size, use_async, only_exact):
+    """
+    Estimates the cost of a run without calling any provider and prints the plan.
+
+    Parameters:
+        eval_type (str): The type of evaluation (common, dialog, singlecall).
+        api_request_list (list): The (sampled) requests of the run.
+        run_directory (RunDirectory): The run directory of the run, used for resuming counts and prior runs.
+        predict_file_path (str): The model output file of the run.
+        eval_file_path (str): The evaluation file of the run.
+        model (str): The model name.
+        batch_size (int): The batch size of the model calls.
+        use_async (bool): Whether the batches are sent concurrently.
+        only_exact (bool): If True, the judge model is never called.
+
+    Returns:
+        dict: The plan.
+    """
+    n_requests = len(api_request_list)
+    cached_outputs = min(count_lines(predict_file_path), n_requests)
+    cached_evaluations = min(count_lines(eval_file_path), n_requests)
+    pending_generation = api_request_list[cached_outputs:]
+    pending_evaluation = api_request_list[cached_evaluations:]
+
+    # judge calls : every non-call request, and the call requests that do not pass by exact match
+    exact_pass_rate, exact_sample_size, prior_eval_file_path = None, 0, find_prior_file(run_directory, 'eval.jsonl', model)
+    if prior_eval_file_path is not None:
+        exact_pass_rate, exact_sample_size = get_exact_pass_rate(prior_eval_file_path, eval_type, api_request_list)
+    call_requests = [request for request in pending_evaluation if get_type_of_output(eval_type, request) == 'call']
+    non_call_requests = [request for request in pending_evaluation if get_type_of_output(eval_type, request) != 'call']
+    if only_exact:
+        judge_calls = 0.0
+    else:
+        judge_calls = len(non_call_requests) + len(call_requests) * (1 - (exact_pass_rate or 0.0))
+
+    # input tokens : messages + tools of the model calls, rubric + request of the judge calls
+    generation_chars = [len(json.dumps(request['messages'], ensure_ascii=False)) + len(json.dumps(request.get('tools', []), ensure_ascii=False))
+                        for request in pending_generation]
+    rubric_chars = get_rubric_chars()
+    judge_chars = [rubric_chars.get(get_type_of_output(eval_type, request), 0)
+                   + len(json.dumps(request['messages'], ensure_ascii=False)) + len(json.dumps(request.get('tools', []), ensure_ascii=False))
+                   + 2 * len(json.dumps(request.get('ground_truth'), ensure_ascii=False))  # ground truth and a response of its size
+                   for request in pending_evaluation]
+    judge_share = judge_calls / len(pending_evaluation) if pending_evaluation else 0.0
+    generation_tokens = sum(math.ceil(chars / CHARS_PER_TOKEN) for chars in generation_chars)
+    judge_tokens = sum(math.ceil(chars / CHARS_PER_TOKEN) for chars in judge_chars) * judge_share
+
+    # wall time : batches of model calls (concurrent with --use_async) and sequential judge calls
+    prior_metrics_file_path = find_prior_file(run_directory, 'metrics.json', model)
+    generation_latency, judge_latency = None, None
+    if prior_metrics_file_path is not None:
+        generation_latency = get_prior_latency(prior_metrics_file_path, 'generation')
+        judge_latency = get_prior_latency(prior_metrics_file_path, 'judge')
+    generation_time, judge_time = None, None
+    if generation_latency is not None:
+        if use_async:
+            # a batch waits for its slowest call
+            generation_time = math.ceil(len(pending_generation) / batch_size) * (generation_latency['p95'] or generation_latency['mean'])
+        else:
+            generation_time = len(pending_generation) * generation_latency['mean']
+    if judge_latency is not None:
+        judge_time = judge_calls * judge_latency['mean']
+
+    plan = {
+        'requests': n_requests,
+        'model_calls': len(pending_generation),
+        'cached_model_outputs': cached_outputs,
+        'judge_calls': judge_calls,
+        'cached_evaluations': cached_evaluations,
+        'exact_pass_rate': exact_pass_rate,
+        'exact_pass_rate_source': prior_eval_file_path if exact_pass_rate is not None else None,
+        'model_input_tokens': generation_tokens,
+        'judge_input_tokens': judge_tokens,
+        'generation_wall_time': generation_time,
+        'judge_wall_time': judge_time,
+        'latency_source': prior_metrics_file_path,
+    }
+    display_plan(plan, exact_sample_size, batch_size, use_async)
+    return plan
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return 'unknown (no prior run metrics)'
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}h {minutes:02d}m {seconds:02d}s'
+
+
+def display_plan(plan, exact_sample_size, batch_size, use_async):
+    print("\n[[plan]]")
+    print(f"* requests : {plan['requests']}")
+    print(f"* model calls : {plan['model_calls']} ({plan['cached_model_outputs']} cached)")
+    if plan['exact_pass_rate'] is not None:
+        exact_source = f"exact-match pass rate {plan['exact_pass_rate']:.2f} over {exact_sample_size} calls of {plan['exact_pass_rate_source']}"
+    else:
+        exact_source = 'no prior run, upper bound'
+    print(f"* judge calls : {plan['judge_calls']:.0f} ({plan['cached_evaluations']} cached, {exact_source})")
+    print(f"* input tokens (~{CHARS_PER_TOKEN} chars/token) : model {plan['model_input_tokens']:,.0f}, judge {plan['judge_input_tokens']:,.0f}")
+    concurrency = f"batches of {batch_size}, async" if use_async else "sequential"
+    print(f"* generation wall time ({concurrency}) : {format_duration(plan['generation_wall_time'])}")
+    print(f"* judge wall time (sequential) : {format_duration(plan['judge_wall_time'])}")
+    if plan['latency_source'] is not None:
+        print(f"  latency of {plan['latency_source']}")
@@ -0,0 +1,120 @@
+import zlib
+import numpy as np
+"""
+This is a package that collects utilities to order and sample evaluation requests by stratum.
+"""
+
+DEFAULT_SAMPLING_SEED = 42
+
+STRATUM_KEY = {
+    'common': 'category',
+    'dialog': 'type_of_output',
+    'singlecall': 'tools_type',
+}
+
+
+def get_strata(api_request_list, evaluation_type):
+    """
+    Groups request indices by the stratum of the evaluation type.
+
+    Parameters:
+        api_request_list (list): List of API requests.
+        evaluation_type (str): common, dialog or singlecall.
+
+    Returns:
+        dict: {stratum: [request index, ..]} in request order.
+    """
+    stratum_key = STRATUM_KEY[evaluation_type]
+    strata = {}
+    for idx, api_request in enumerate(api_request_list):
+        strata.setdefault(api_request.get(stratum_key), []).append(idx)
+    return strata
+
+
+def stratified_order(api_request_list, evaluation_type, seed=DEFAULT_SAMPLING_SEED):
+    """
+    Returns a shuffled order of request indices in which every stratum is spread evenly,
+    so that any prefix of the order is approximately stratified.
+
+    Each stratum is shuffled on its own and its i-th item is placed at the relative position
+    (i + jitter) / stratum size; all items are then merged by relative position.
+
+    Parameters:
+        api_request_list (list): List of API requests.
+        evaluation_type (str): common, dialog or singlecall.
+        seed (int): Random seed. The order only depends on the requests and the seed.
+
+    Returns:
+        list: request indices in evaluation order.
+    """
+    rng = np.random.default_rng(seed)
+    positions, indices = [], []
+    for stratum, stratum_indices in sorted(get_strata(api_request_list, evaluation_type).items(), key=lambda x: str(x[0])):
+        shuffled = rng.permutation(stratum_indices)
+        positions.append((np.arange(len(shuffled)) + rng.random(len(shuffled))) / len(shuffled))
+        indices.append(shuffled)
+    if not indices:
+        return []
+    positions = np.concatenate(positions)
+    indices = np.concatenate(indices)
+    return [int(idx) for idx in indices[np.argsort(positions, kind='stable')]]
+
+
+def stratified_sample(api_request_list, evaluation_type, sample_n=None, sample_frac=None, seed=DEFAULT_SAMPLING_SEED):
+    """
+    Selects a stratified random subset of the requests.
+
+    Sample sizes are allocated to strata proportionally (largest remainder, at least one per stratum when possible),
+    and every stratum is shuffled with a seed derived from the seed and the stratum name only.
+    The sample therefore depends on the request set alone, not on the evaluated model,
+    and a smaller sample is mostly contained in a larger one.
+
+    Parameters:
+        api_request_list (list): List of API requests.
+        evaluation_type (str): common, dialog or singlecall.
+        sample_n (int, optional): Number of requests to sample.
+        sample_frac (float, optional): Fraction of requests to sample. Ignored if sample_n is given.
+        seed (int): Random seed.
+
+    Returns:
+        list: sampled request indices in request order.
+    """
+    total = len(api_request_list)
+    if sample_n is not None:
+        target = int(sample_n)
+        if target < 1:
+            raise ValueError(f"sample_n must be at least 1, but got {sample_n}.")
+    elif sample_frac is not None:
+        if not 0 < sample_frac <= 1:
+            raise ValueError(f"sample_frac must be in (0, 1], but got {sample_frac}.")
+        # a fraction too small for the set still samples one request
+        target = max(1, int(round(total * sample_frac)))
+    else:
+        return list(range(total))
+    target = max(0, min(target, total))
+    strata = sorted(get_strata(api_request_list, evaluation_type).items(), key=lambda x: str(x[0]))
+    sizes = np.array([len(stratum_indices) for _, stratum_indices in strata])
+    quotas = target * sizes / max(total, 1)
+    allocation = np.floor(quotas).astype(int)
+    if target >= len(strata):
+        allocation = np.maximum(allocation, 1)
+    # hand out the remaining samples by largest remainder
+    while allocation.sum() < target:
+        for idx in np.argsort(-(quotas - np.floor(quotas)), kind='stable'):
+            if allocation.sum() >= target:
+                break
+            if allocation[idx] < sizes[idx]:
+                allocation[idx] += 1
+    # trim over-allocation caused by the one-per-stratum floor, largest strata first,
+    # one sample per stratum and pass until the target is met
+    while allocation.sum() > target:
+        for idx in np.argsort(-allocation, kind='stable'):
+            if allocation.sum() <= target:
+                break
+            if allocation[idx] > 1:
+                allocation[idx] -= 1
+    sampled = []
+    for (stratum, stratum_indices), size in zip(strata, allocation):
+        rng = np.random.default_rng([seed, zlib.crc32(str(stratum).encode('utf-8'))])
+        sampled.extend(int(idx) for idx in rng.permutation(stratum_indices)[:size])
+    return sorted(sampled)
@@ -0,0 +1,116 @@
+from src.sampling_utils import stratified_order
+from src.statistics_utils import DEFAULT_CONFIDENCE, wilson_interval
+from src.trace_recorder import trace_span
+
+
+class SequentialEvaluationHandler:
+    """
+    A class that interleaves response generation and evaluation over a shuffled, stratified request order,
+    and stops both as soon as the overall pass rate is known precisely enough.
+
+    The confidence interval is re-checked after every step, so the reported interval is a screening
+    signal rather than a fixed-sample guarantee.
+    """
+    def __init__(self, evaluation_type, response_handler, evaluation_handler,
+                 target_ci_width=None, reject_below=None, step_size=20, min_size=30, confidence=DEFAULT_CONFIDENCE):
+        """
+        Initializes the SequentialEvaluationHandler.
+
+        Parameters:
+            evaluation_type (str): The type of evaluation (common, dialog, singlecall), which determines the strata.
+            response_handler (ResponseHandler): Handler used to fetch model responses.
+            evaluation_handler (EvaluationHandler): Handler used to evaluate model responses.
+            target_ci_width (float, optional): Stop once the confidence interval of the pass rate is narrower than this.
+            reject_below (float, optional): Stop once the upper bound of the pass rate is below this threshold.
+            step_size (int): Number of requests generated and evaluated between two stopping checks.
+            min_size (int): Minimum number of evaluated requests before stopping is considered.
+            confidence (float): Confidence level of the interval.
+        """
+        self.evaluation_type = evaluation_type
+        self.response_handler = response_handler
+        self.evaluation_handler = evaluation_handler
+        self.target_ci_width = target_ci_width
+        self.reject_below = reject_below
+        self.step_size = max(step_size, 1)
+        self.min_size = min_size
+        self.confidence = confidence
+
+    def get_stop_reason(self):
+        """
+        Checks the stopping rules against the running counters of the evaluation registor.
+
+        Returns:
+            str: The reason to stop, or None to continue.
+        """
+        eval_reg = self.evaluation_handler.eval_reg
+        if eval_reg.case_count < self.min_size:
+            return None
+        lower, upper = wilson_interval(eval_reg.pass_count, eval_reg.case_count, self.confidence)
+        if self.reject_below is not None and upper < self.reject_below:
+            return f"rejected (upper bound {upper:.3f} < {self.reject_below})"
+        if self.target_ci_width is not None and upper - lower <= self.target_ci_width:
+            return f"target ci width reached ({upper - lower:.3f} <= {self.target_ci_width})"
+        return None
+
+    def evaluate(self, api_request_list, predict_file_path, eval_file_path, eval_log_file_path, reset, debug=False, only_exact=False,
+                 retry_errors=False):
+        """
+        Generates and evaluates requests step by step until a stopping rule fires or the requests run out.
+        Responses and evaluations are written in evaluation order, so a stopped run can be resumed.
+
+        Parameters:
+            api_request_list (list): List of API requests.
+            predict_file_path (str): File path where model responses are stored.
+            eval_file_path (str): File path where raw evaluation results are stored.
+            eval_log_file_path (str): File path where formatted evaluation logs are stored.
+            reset (bool): Whether to reset (overwrite) the existing responses and evaluation results.
+            debug (bool): If True, print detailed debug information.
+            only_exact (bool): If True, only exact match is evaluated.
+            retry_errors (bool): If True, the errored responses and judge calls of the resumed steps are re-run first.
+        """
+        ordered_requests = [api_request_list[idx] for idx in stratified_order(api_request_list, self.evaluation_type)]
+        outputs, eval_output = [], []
+        if reset is False:
+            outputs = self.response_handler.load_cached_response(predict_file_path, len(ordered_requests))
+            eval_output = self.evaluation_handler.load_cached_evaluation_result(eval_file_path, len(ordered_requests), ordered_requests)
+            if retry_errors:
+                outputs = self.response_handler.retry_error_responses(ordered_requests, outputs, predict_file_path)
+                with self.evaluation_handler.metrics_collector.stage('judge'):
+                    eval_output = self.evaluation_handler.retry_error_evaluations(ordered_requests, outputs, eval_output,
+                                                                                  eval_file_path, eval_log_file_path, only_exact)
+        eval_reg = self.evaluation_handler.eval_reg
+        eval_reg.set_eval_output(eval_output)
+        write_option = 'a' if reset is False else 'w'
+        stop_reason = self.get_stop_reason()
+        with open(predict_file_path, write_option) as fp, \
+                open(eval_file_path, write_option) as eval_raw_fw, \
+                open(eval_log_file_path, write_option) as eval_tsv_fw:
+            while stop_reason is None and eval_reg.get_eval_output_length() < len(ordered_requests):
+                start_index = eval_reg.get_eval_output_length()
+                end_index = min(start_index + self.step_size, len(ordered_requests))
+                if len(outputs) < end_index:
+                    self.response_handler.warm_up()
+                    with self.response_handler.metrics_collector.stage('generation'):
+                        outputs.extend(self.response_handler.fetch(ordered_requests[len(outputs):end_index], fp))
+                if not only_exact:
+                    self.evaluation_handler.warm_up()
+                with self.evaluation_handler.metrics_collector.stage('judge'):
+                    for inp, out in zip(ordered_requests[start_index:end_index], outputs[start_index:end_index]):
+                        response_formatter = self.evaluation_handler.evaluate_request(inp, out, only_exact)
+                        self.evaluation_handler.save_evaluation(response_formatter, eval_raw_fw, eval_tsv_fw)
+                with trace_span('flush', 'io', path=eval_raw_fw.name):
+                    eval_raw_fw.flush()
+                    eval_tsv_fw.flush()
+                stop_reason = self.get_stop_reason()
+                if debug:
+                    pass_rate, case_count = eval_reg.get_running_pass_rate()
+                    lower, upper = wilson_interval(eval_reg.pass_count, case_count, self.confidence)
+                    print(f" ** sequential : {case_count}/{len(ordered_requests)} pass rate {pass_rate:.3f} [{lower:.3f}, {upper:.3f}]")
+        eval_reg.display()
+        pass_rate, case_count = eval_reg.get_running_pass_rate()
+        lower, upper = wilson_interval(eval_reg.pass_count, case_count, self.confidence)
+        print(f"\n[[sequential evaluation : {eval_reg.get_eval_output_length()}/{len(ordered_requests)} requests]]")
+        print(f"* pass rate : {pass_rate:.3f} [{lower:.3f}, {upper:.3f}] ({self.confidence:.0%} wilson CI)")
+        print(f"* stop reason : {stop_reason if stop_reason else 'all requests evaluated'}")
+        self.evaluation_handler.report_metrics(eval_log_file_path)
+        print(f"[[model evaluation file : {eval_log_file_path}]]")
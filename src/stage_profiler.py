@@ -0,0 +1,134 @@
+import io
+import pstats
+import cProfile
+from contextlib import contextmanager
+"""
+This is a package that profiles the CPU time of the evaluation stages (payload, generation, judge).
+"""
+
+PROFILER_TYPES = ('cprofile', 'pyinstrument')
+# MetricsCollector.call runs every provider call through this frame, so network wait is tagged in the reports
+NETWORK_WAIT_FUNCTION = 'provider_wait'
+
+
+class StageProfiler:
+    """
+    A class that keeps one profiler per stage and writes one report per stage into the run directory.
+
+    Stages are entered through MetricsCollector.stage, repeated entries of a stage are accumulated
+    and a stage entered while another one is being profiled is attributed to the outer stage.
+    Only the main thread is profiled: with --use_async the provider calls run in worker threads,
+    and the main thread only shows the event loop waiting for them.
+    """
+    def __init__(self, profiler_type, output_path, run_name):
+        """
+        Initializes the StageProfiler.
+
+        Parameters:
+            profiler_type (str): cprofile or pyinstrument.
+            output_path (str): Directory of the reports (the run directory).
+            run_name (str): Prefix of the report files.
+        """
+        if profiler_type not in PROFILER_TYPES:
+            raise Exception(f"Unsupported profiler type: {profiler_type}")
+        if profiler_type == 'pyinstrument':
+            try:
+                import pyinstrument  # noqa: F401
+            except ImportError:
+                raise Exception("--profile pyinstrument requires the pyinstrument package (pip install pyinstrument)")
+        self.profiler_type = profiler_type
+        self.output_path = output_path
+        self.run_name = run_name
+        self.profilers = {}
+        self.active_stage = None
+
+    def get_profiler(self, stage):
+        if stage not in self.profilers:
+            if self.profiler_type == 'cprofile':
+                self.profilers[stage] = cProfile.Profile()
+            else:
+                from pyinstrument import Profiler
+                self.profilers[stage] = Profiler()
+        return self.profilers[stage]
+
+    @contextmanager
+    def profile(self, stage):
+        """
+        Profiles a stage.
+
+        Parameters:
+            stage (str): The stage name (payload, generation, judge).
+        """
+        if self.active_stage is not None:
+            yield
+            return
+        profiler = self.get_profiler(stage)
+        self.active_stage = stage
+        if self.profiler_type == 'cprofile':
+            profiler.enable()
+        else:
+            profiler.start()
+        try:
+            yield
+        finally:
+            if self.profiler_type == 'cprofile':
+                profiler.disable()
+            else:
+                profiler.stop()
+            self.active_stage = None
+
+    def get_report_file_path(self, stage, extension):
+        return f"{self.output_path}/{self.run_name}.profile.{stage}.{extension}"
+
+    def save_cprofile_report(self, stage, profiler):
+        profiler.dump_stats(self.get_report_file_path(stage, 'prof'))
+        stream = io.StringIO()
+        stats = pstats.Stats(profiler, stream=stream)
+        # (file, line, function) -> (primitive calls, calls, total time, cumulative time, callers)
+        network_wait = sum(stat[3] for key, stat in stats.stats.items() if key[2] == NETWORK_WAIT_FUNCTION)
+        stream.write(f"stage {stage} : {stats.total_tt:.3f}s profiled, "
+                     f"network wait ({NETWORK_WAIT_FUNCTION}) {network_wait:.3f}s, "
+                     f"cpu {stats.total_tt - network_wait:.3f}s\n\n")
+        stats.sort_stats('cumulative').print_stats(50)
+        stats.sort_stats('tottime').print_stats(50)
+        report_file_path = self.get_report_file_path(stage, 'txt')
+        with open(report_file_path, 'w', encoding='utf-8') as ff:
+            ff.write(stream.getvalue())
+        return report_file_path
+
+    def save_pyinstrument_report(self, stage, profiler):
+        report_file_path = self.get_report_file_path(stage, 'html')
+        with open(report_file_path, 'w', encoding='utf-8') as ff:
+            ff.write(profiler.output_html())
+        return report_file_path
+
+    def save(self):
+        for stage, profiler in self.profilers.items():
+            if self.profiler_type == 'cprofile':
+                report_file_path = self.save_cprofile_report(stage, profiler)
+            else:
+                report_file_path = self.save_pyinstrument_report(stage, profiler)
+            print(f"[[profile report : {report_file_path}]]")
+
+
+@contextmanager
+def profiling(profiler_type, output_path, run_name):
+    """
+    Creates a StageProfiler for the duration of the block and writes its reports at the end, even if the run fails.
+
+    Parameters:
+        profiler_type (str): cprofile or pyinstrument. Profiling is disabled if None.
+        output_path (str): Directory of the reports (the run directory).
+        run_name (str): Prefix of the report files.
+
+    Yields:
+        StageProfiler or None
+    """
+    if profiler_type is None:
+        yield None
+        return
+    stage_profiler = StageProfiler(profiler_type, output_path, run_name)
+    try:
+        yield stage_profiler
+    finally:
+        stage_profiler.save()
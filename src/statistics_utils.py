@@ -0,0 +1,133 @@
+import math
+import numpy as np
+from statistics import NormalDist
+"""
+This is a package that collects statistical utilities for evaluation reports.
+"""
+
+DEFAULT_N_RESAMPLES = 10000
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_SEED = 42
+
+
+def bootstrap_pass_rate_intervals(pass_counts, total_counts, n_resamples=DEFAULT_N_RESAMPLES,
+                                  confidence=DEFAULT_CONFIDENCE, seed=DEFAULT_SEED):
+    """
+    Computes percentile bootstrap confidence intervals of pass rates for several groups at once.
+
+    Resampling a pass/fail vector of size n with replacement is equivalent to drawing the number
+    of passes from Binomial(n, pass_rate), so every resample of every group is drawn in one array
+    operation instead of materializing (n_resamples x n) index matrices.
+
+    Parameters:
+        pass_counts (list): Number of passed cases per group.
+        total_counts (list): Number of evaluated cases per group.
+        n_resamples (int): Number of bootstrap resamples.
+        confidence (float): Confidence level of the interval.
+        seed (int): Random seed for reproducible intervals.
+
+    Returns:
+        tuple: (lower bounds, upper bounds) as numpy arrays. Groups without cases get nan.
+    """
+    pass_counts = np.asarray(pass_counts, dtype=np.int64)
+    total_counts = np.asarray(total_counts, dtype=np.int64)
+    safe_totals = np.maximum(total_counts, 1)
+    rates = pass_counts / safe_totals
+    rng = np.random.default_rng(seed)
+    resampled = rng.binomial(safe_totals[:, None], rates[:, None], size=(len(rates), n_resamples)) / safe_totals[:, None]
+    alpha = (1.0 - confidence) / 2
+    lower, upper = np.quantile(resampled, [alpha, 1.0 - alpha], axis=1)
+    lower[total_counts == 0] = np.nan
+    upper[total_counts == 0] = np.nan
+    return lower, upper
+
+
+def wilson_interval(pass_count, total_count, confidence=DEFAULT_CONFIDENCE):
+    """
+    Computes the Wilson score interval of a pass rate. It is cheap enough to be checked after every evaluated request.
+
+    Parameters:
+        pass_count (int): Number of passed cases.
+        total_count (int): Number of evaluated cases.
+        confidence (float): Confidence level of the interval.
+
+    Returns:
+        tuple: (lower bound, upper bound). (0.0, 1.0) if nothing was evaluated.
+    """
+    if total_count == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(1.0 - (1.0 - confidence) / 2)
+    rate = pass_count / total_count
+    denominator = 1 + z ** 2 / total_count
+    center = (rate + z ** 2 / (2 * total_count)) / denominator
+    margin = z * math.sqrt(rate * (1 - rate) / total_count + z ** 2 / (4 * total_count ** 2)) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def bootstrap_paired_difference(pass_vector_a, pass_vector_b, n_resamples=DEFAULT_N_RESAMPLES,
+                                confidence=DEFAULT_CONFIDENCE, seed=DEFAULT_SEED):
+    """
+    Computes a paired bootstrap confidence interval of the pass-rate difference (b - a).
+
+    The paired resample only depends on the four joint outcome counts, so it is drawn from a
+    multinomial distribution over (both pass, only a, only b, both fail) in one array operation.
+
+    Parameters:
+        pass_vector_a (array-like): 0/1 outcomes of the baseline run, aligned with pass_vector_b.
+        pass_vector_b (array-like): 0/1 outcomes of the compared run.
+        n_resamples (int): Number of bootstrap resamples.
+        confidence (float): Confidence level of the interval.
+        seed (int): Random seed for reproducible intervals.
+
+    Returns:
+        dict: difference, lower and upper bound of the pass-rate difference.
+    """
+    a = np.asarray(pass_vector_a, dtype=bool)
+    b = np.asarray(pass_vector_b, dtype=bool)
+    if a.shape != b.shape:
+        raise ValueError(f"pass vectors must be aligned, but got {a.shape} and {b.shape}.")
+    size = a.size
+    if size == 0:
+        return {'difference': math.nan, 'lower': math.nan, 'upper': math.nan}
+    cell_counts = np.array([np.sum(a & b), np.sum(a & ~b), np.sum(~a & b), np.sum(~a & ~b)])
+    rng = np.random.default_rng(seed)
+    resampled = rng.multinomial(size, cell_counts / size, size=n_resamples)
+    differences = (resampled[:, 2] - resampled[:, 1]) / size
+    alpha = (1.0 - confidence) / 2
+    lower, upper = np.quantile(differences, [alpha, 1.0 - alpha])
+    return {
+        'difference': float((cell_counts[2] - cell_counts[1]) / size),
+        'lower': float(lower),
+        'upper': float(upper),
+    }
+
+
+def mcnemar_test(pass_vector_a, pass_vector_b, exact_threshold=25):
+    """
+    Runs McNemar's test on two aligned pass/fail vectors.
+
+    An exact two-sided binomial test is used when the number of discordant pairs is small,
+    otherwise the chi-square statistic with continuity correction.
+
+    Parameters:
+        pass_vector_a (array-like): 0/1 outcomes of the baseline run.
+        pass_vector_b (array-like): 0/1 outcomes of the compared run.
+        exact_threshold (int): Discordant pair count below which the exact test is used.
+
+    Returns:
+        dict: discordant counts, test statistic, p-value and the test method.
+    """
+    a = np.asarray(pass_vector_a, dtype=bool)
+    b = np.asarray(pass_vector_b, dtype=bool)
+    only_a = int(np.sum(a & ~b))
+    only_b = int(np.sum(~a & b))
+    discordant = only_a + only_b
+    if discordant == 0:
+        return {'only_a': 0, 'only_b': 0, 'statistic': 0.0, 'p_value': 1.0, 'method': 'exact'}
+    if discordant < exact_threshold:
+        tail = sum(math.comb(discordant, k) for k in range(min(only_a, only_b) + 1)) / 2 ** discordant
+        return {'only_a': only_a, 'only_b': only_b, 'statistic': float(min(only_a, only_b)),
+                'p_value': min(1.0, 2 * tail), 'method': 'exact'}
+    statistic = (abs(only_a - only_b) - 1) ** 2 / discordant
+    return {'only_a': only_a, 'only_b': only_b, 'statistic': statistic,
+            'p_value': math.erfc(math.sqrt(statistic / 2)), 'method': 'chi2'}
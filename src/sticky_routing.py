@@ -0,0 +1,62 @@
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+"""
+This is a package that pins the provider calls of one session (the turns of a dialog) to the same member of a client pool,
+so that the prefix cache of a replica, a deployment or a region can reuse the prefix the calls share.
+"""
+
+# per-thread route key of the session in progress, set by the ResponseHandler around the turns of a dialog
+_route_state = threading.local()
+
+
+@contextmanager
+def sticky_route(route_key):
+    """
+    Routes the provider calls made in this thread within the block to the pool member of route_key.
+
+    Parameters:
+        route_key (str): The session key, e.g. dialog-12.
+    """
+    previous_route_key = getattr(_route_state, 'route_key', None)
+    _route_state.route_key = route_key
+    try:
+        yield
+    finally:
+        _route_state.route_key = previous_route_key
+
+
+def get_route_key():
+    return getattr(_route_state, 'route_key', None)
+
+
+class StickyRoutes:
+    """
+    A class that remembers the pool member of each route key. Pools use it under their own lock:
+    the pinned member is kept as long as it is available, otherwise the pool selects another one and it is pinned instead.
+    """
+    def __init__(self, max_routes=10000):
+        self.routes = OrderedDict()
+        self.max_routes = max_routes
+
+    def get(self, available):
+        """
+        Returns the member pinned to the route key of this thread if it is available, None otherwise.
+
+        Parameters:
+            available (list): The members the pool can select now.
+        """
+        route_key = get_route_key()
+        if route_key is None:
+            return None
+        member = self.routes.get(route_key)
+        return member if member is not None and member in available else None
+
+    def pin(self, member):
+        route_key = get_route_key()
+        if route_key is None:
+            return
+        self.routes[route_key] = member
+        self.routes.move_to_end(route_key)
+        if len(self.routes) > self.max_routes:
+            self.routes.popitem(last=False)
@@ -0,0 +1,90 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+"""
+This is a package that records Chrome trace events (chrome://tracing, https://ui.perfetto.dev) of an evaluation run.
+"""
+
+# the active recorder, None unless --trace is given
+_trace_recorder = None
+
+
+class TraceRecorder:
+    """
+    A class that collects complete ('X') trace events, one per span, with the thread it ran on,
+    so that overlapping provider calls, retry sleeps and idle time between batches become visible.
+    """
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.lock = threading.Lock()
+        self.events = []
+        self.thread_ids = set()
+
+    def add_span(self, name, category, start, end, args):
+        thread = threading.current_thread()
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': (start - self.origin) * 1e6,
+            'dur': (end - start) * 1e6,
+            'pid': os.getpid(),
+            'tid': thread.ident,
+            'args': args,
+        }
+        with self.lock:
+            if thread.ident not in self.thread_ids:
+                self.thread_ids.add(thread.ident)
+                self.events.append({'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': thread.ident,
+                                    'args': {'name': thread.name}})
+            self.events.append(event)
+
+    def save(self, trace_file_path):
+        with self.lock:
+            events = list(self.events)
+        with open(trace_file_path, 'w', encoding='utf-8') as ff:
+            ff.write(json.dumps({'traceEvents': events, 'displayTimeUnit': 'ms'}, ensure_ascii=False, default=str))
+
+
+@contextmanager
+def trace_span(name, category, **args):
+    """
+    Records a span if tracing is enabled, otherwise does nothing.
+
+    Parameters:
+        name (str): The span name.
+        category (str): The span category (provider, retry, io, batch).
+        args: Tags of the span, e.g. serial_num and tools_type.
+    """
+    trace_recorder = _trace_recorder
+    if trace_recorder is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace_recorder.add_span(name, category, start, time.perf_counter(), args)
+
+
+@contextmanager
+def tracing(trace_file_path):
+    """
+    Enables tracing for the duration of the block and writes the trace file at the end, even if the run fails.
+
+    Parameters:
+        trace_file_path (str): Trace file path (*.json). Tracing is disabled if None.
+    """
+    global _trace_recorder
+    if trace_file_path is None:
+        yield
+        return
+    _trace_recorder = TraceRecorder()
+    try:
+        yield
+    finally:
+        trace_recorder, _trace_recorder = _trace_recorder, None
+        trace_recorder.save(trace_file_path)
+        print(f"[[trace file : {trace_file_path}]]")
@@ -0,0 +1,39 @@
+import sys
+import types
+import importlib.util
+
+# the provider SDKs are imported at module level by src.api_executor and src.gemini_utils,
+# the tests never call them: empty modules stand in for the ones that are not installed
+PROVIDER_MODULES = {
+    'mistralai': {},
+    'mistralai.client': {'MistralClient': object},
+    'mistralai.exceptions': {'MistralAPIException': Exception},
+    'vertexai': {},
+    'vertexai.generative_models': {name: object for name in ['Content', 'FunctionDeclaration', 'GenerativeModel', 'Part', 'Tool']},
+    'google': {},
+    'google.api_core': {},
+    'qwen_agent': {},
+    'qwen_agent.llm': {},
+}
+
+
+def is_installed(name):
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+for module_name, attributes in PROVIDER_MODULES.items():
+    if module_name in sys.modules or is_installed(module_name):
+        continue
+    module = types.ModuleType(module_name)
+    module.__dict__.update(attributes)
+    sys.modules[module_name] = module
+    parent_name, _, child_name = module_name.rpartition('.')
+    if parent_name in sys.modules:
+        setattr(sys.modules[parent_name], child_name, module)
+
+# openai >= 3 ships its http client as httpx2, src.openai_utils only uses the httpx names it shares
+if not is_installed('httpx') and is_installed('httpx2'):
+    sys.modules['httpx'] = importlib.import_module('httpx2')
@@ -0,0 +1,72 @@
+from src.autotuner import ConcurrencyAutotuner, get_autotuner
+
+
+def batch(latency, calls, retries=0, error_class=None):
+    return [{'latency': latency, 'retries': retries, 'error_class': error_class} for _ in range(calls)]
+
+
+def run_batch(autotuner, latency, retries=0, error_class=None):
+    calls = autotuner.get_concurrency()
+    return autotuner.update(batch(latency, calls, retries, error_class), wall_time=latency)
+
+
+def test_slow_start_doubles_up_to_the_ceiling():
+    autotuner = ConcurrencyAutotuner(max_concurrency=16)
+    assert [run_batch(autotuner, 1.0) for _ in range(5)] == [2, 4, 8, 16, 16]
+    assert autotuner.get_report()['backoffs'] == {'errors': 0, 'latency': 0}
+
+
+def test_errors_halve_the_concurrency_and_end_slow_start():
+    autotuner = ConcurrencyAutotuner(max_concurrency=32, initial_concurrency=16)
+    assert run_batch(autotuner, 1.0, retries=1) == 8
+    assert run_batch(autotuner, 1.0, error_class='RateLimitError') == 4
+    assert not autotuner.slow_start
+    # the first clean batch after a back-off holds (its throughput is below that of the larger batch before),
+    # the next one adds one call instead of doubling
+    assert run_batch(autotuner, 1.0) == 4
+    assert run_batch(autotuner, 1.0) == 5
+    assert autotuner.get_report()['backoffs']['errors'] == 2
+
+
+def test_errors_do_not_go_below_the_minimum():
+    autotuner = ConcurrencyAutotuner(max_concurrency=8, min_concurrency=2, initial_concurrency=2)
+    assert run_batch(autotuner, 1.0, retries=3) == 2
+
+
+def test_latency_inflation_lowers_the_concurrency_by_one():
+    autotuner = ConcurrencyAutotuner(max_concurrency=32, initial_concurrency=8)
+    run_batch(autotuner, 1.0)
+    # 16 calls at twice the base latency: 8 calls queued at the provider, above VEGAS_BETA
+    assert run_batch(autotuner, 2.0) == 15
+    assert autotuner.history[-1]['decision'] == 'latency'
+    assert not autotuner.slow_start
+
+
+def test_moderate_latency_inflation_holds():
+    autotuner = ConcurrencyAutotuner(max_concurrency=32, initial_concurrency=4)
+    autotuner.slow_start = False
+    run_batch(autotuner, 1.0)
+    # 5 calls at 1.5x the base latency: 1.67 calls queued, between VEGAS_ALPHA and VEGAS_BETA
+    assert run_batch(autotuner, 1.5) == 5
+    assert autotuner.history[-1]['decision'] == 'hold'
+
+
+def test_throughput_drop_holds():
+    autotuner = ConcurrencyAutotuner(max_concurrency=32, initial_concurrency=4)
+    autotuner.slow_start = False
+    autotuner.update(batch(1.0, 4), wall_time=1.0)
+    # flat latency but half the throughput of the previous batch
+    assert autotuner.update(batch(1.0, 5), wall_time=2.5) == 5
+    assert autotuner.history[-1]['decision'] == 'hold'
+
+
+def test_empty_batch_keeps_the_concurrency():
+    autotuner = ConcurrencyAutotuner(initial_concurrency=4)
+    assert autotuner.update([], wall_time=1.0) == 4
+    assert autotuner.history == []
+
+
+def test_get_autotuner_uses_batch_size_as_the_ceiling():
+    assert get_autotuner(False, 8) is None
+    assert get_autotuner(True, 8).max_concurrency == 8
+    assert get_autotuner(True, 1).max_concurrency == 32
@@ -0,0 +1,181 @@
+import time
+
+import pytest
+from botocore.exceptions import ClientError
+
+from src.api_executor import BedrockModelAPI
+from src.bedrock_utils import (CACHE_POINT, BedrockClientPool, call_bedrock_model, convert_openai_to_bedrock_messages,
+                               convert_openai_to_bedrock_system, convert_openai_to_bedrock_tools, split_option_list)
+from src.metrics_collector import MetricsCollector
+
+
+def bedrock_answer(text):
+    return {'output': {'message': {'role': 'assistant', 'content': [{'text': text}]}}, 'stopReason': 'end_turn',
+            'usage': {'inputTokens': 10, 'outputTokens': 2}, 'metrics': {'latencyMs': 100}}
+
+
+def throttling_error():
+    return ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'}}, 'Converse')
+
+
+class FakeBedrockClient:
+    def __init__(self, region_name, throttled=False):
+        self.region_name = region_name
+        self.throttled = throttled
+        self.requests = []
+
+    def converse(self, **request_params):
+        self.requests.append(request_params)
+        if self.throttled:
+            raise throttling_error()
+        return bedrock_answer(f'answer from {self.region_name}')
+
+
+def region_pool(region_names=('us-east-1', 'us-west-2'), **kwargs):
+    pool = BedrockClientPool(list(region_names), ['anthropic.claude-3-5-sonnet'], aws_access_key_id='key', aws_secret_access_key='secret', **kwargs)
+    for member in pool.members:
+        member.client = FakeBedrockClient(member.region_name)
+    return pool
+
+
+def test_split_option_list():
+    assert split_option_list('us-east-1, us-west-2,') == ['us-east-1', 'us-west-2']
+    assert split_option_list(None) == [None]
+    assert split_option_list('') == [None]
+
+
+def test_model_ids_are_one_or_one_per_region():
+    pool = BedrockClientPool(['us-east-1', 'us-west-2'], ['model-a', 'model-b'])
+    assert [member.model_id for member in pool.members] == ['model-a', 'model-b']
+    with pytest.raises(Exception, match='one per region'):
+        BedrockClientPool(['us-east-1', 'us-west-2', 'eu-west-1'], ['model-a', 'model-b'])
+
+
+def test_acquire_spreads_requests_over_the_least_busy_regions():
+    pool = region_pool()
+    first, second = pool.acquire(), pool.acquire()
+    assert {first.region_name, second.region_name} == {'us-east-1', 'us-west-2'}
+    pool.release(first)
+    assert pool.acquire() is first
+
+
+def test_throttled_region_cools_down_with_a_doubling_cooldown():
+    pool = region_pool(base_cooldown=10.0, max_cooldown=25.0)
+    east = pool.members[0]
+    for expected_cooldown in (10.0, 20.0, 25.0):
+        east.in_flight += 1
+        pool.release(east, throttled=True)
+        assert east.cooldown_until - time.monotonic() == pytest.approx(expected_cooldown, abs=0.5)
+    # the other region serves while the throttled one cools down
+    assert all(pool.acquire().region_name == 'us-west-2' for _ in range(3))
+    assert pool.get_status()[0]['throttles'] == 3
+
+
+def test_recently_throttled_region_is_avoided_after_its_cooldown():
+    pool = region_pool(base_cooldown=0.0)
+    east, west = pool.members
+    east.in_flight += 1
+    pool.release(east, throttled=True)
+    west.in_flight = 2
+    # throttle score first, in-flight requests second
+    assert pool.acquire() is west
+    pool.release(east)
+    assert east.consecutive_throttles == 0
+
+
+def test_acquire_waits_for_the_first_region_out_of_its_cooldown():
+    pool = region_pool(region_names=('us-east-1',), base_cooldown=0.2)
+    member = pool.acquire()
+    pool.release(member, throttled=True)
+    started_at = time.monotonic()
+    assert pool.acquire() is member
+    assert time.monotonic() - started_at >= 0.15
+
+
+def bedrock_executor(throttled_regions, prompt_cache=False):
+    executor = BedrockModelAPI('bedrock', 'key', 'secret', 'us-east-1,us-west-2', 'anthropic.claude-3-5-sonnet', prompt_cache=prompt_cache)
+    for member in executor.client_pool.members:
+        member.client = FakeBedrockClient(member.region_name, throttled=member.region_name in throttled_regions)
+    return executor
+
+
+def test_throttled_call_fails_over_to_another_region():
+    executor = bedrock_executor({'us-east-1'})
+    east = executor.client_pool.members[0]
+    # east is picked first: it has the fewest requests
+    metrics_collector = MetricsCollector()
+    for _ in range(2):
+        response = metrics_collector.call('generation', 'bedrock', executor.predict,
+                                          {'serial_num': 1, 'messages': [{'role': 'user', 'content': '안녕'}], 'temperature': 0.1})
+        assert response['content'] == 'answer from us-west-2'
+    request_metrics = metrics_collector.get_request_metrics('generation')
+    assert request_metrics[0]['retry_errors'] == ['ClientError']
+    # the second call does not try the region in cooldown
+    assert request_metrics[1]['retries'] == 0
+    assert len(east.client.requests) == 1
+    assert all(member.in_flight == 0 for member in executor.client_pool.members)
+
+
+def test_throttled_everywhere_gives_up():
+    executor = bedrock_executor({'us-east-1', 'us-west-2'})
+    executor.client_pool.base_cooldown = 0.0
+    with pytest.raises(ClientError):
+        executor.predict({'messages': [{'role': 'user', 'content': '안녕'}], 'temperature': 0.1})
+    assert sum(len(member.client.requests) for member in executor.client_pool.members) == 6
+
+
+MESSAGES = [{'role': 'system', 'content': '당신은 도움을 주는 어시스턴트입니다.'}, {'role': 'user', 'content': '오늘 날씨 알려줘'}]
+TOOLS = [{'type': 'function', 'function': {'name': 'getWeather', 'description': '날씨 조회',
+                                           'parameters': {'type': 'object', 'properties': {'city': {'type': 'string'}}}}}]
+
+
+def test_system_prompt_is_a_system_block_with_an_optional_cache_point():
+    system_text = {'text': '당신은 도움을 주는 어시스턴트입니다.'}
+    assert convert_openai_to_bedrock_system(MESSAGES) == [system_text]
+    assert convert_openai_to_bedrock_system(MESSAGES, cache_point=True) == [system_text, CACHE_POINT]
+    # no cachePoint without a prefix to cache
+    assert convert_openai_to_bedrock_system(MESSAGES[1:], cache_point=True) == []
+    assert [message['role'] for message in convert_openai_to_bedrock_messages(MESSAGES)] == ['user']
+
+
+def test_tools_end_with_an_optional_cache_point():
+    assert convert_openai_to_bedrock_tools(TOOLS)['tools'][-1]['toolSpec']['name'] == 'getWeather'
+    bedrock_tools = convert_openai_to_bedrock_tools(TOOLS, cache_point=True)['tools']
+    assert len(bedrock_tools) == 2
+    assert bedrock_tools[-1] == CACHE_POINT
+    assert convert_openai_to_bedrock_tools([], cache_point=True) == {'tools': []}
+
+
+@pytest.mark.parametrize('prompt_cache', [False, True])
+def test_call_puts_the_cache_points_after_the_system_prompt_and_the_tools(prompt_cache):
+    bedrock_client = FakeBedrockClient('us-east-1')
+    response = call_bedrock_model(bedrock_client, 'anthropic.claude-3-5-sonnet', MESSAGES, tools=TOOLS, prompt_cache=prompt_cache)
+    assert response['content'] == 'answer from us-east-1'
+    request_params, = bedrock_client.requests
+    assert request_params['modelId'] == 'anthropic.claude-3-5-sonnet'
+    assert request_params['system'][0] == {'text': '당신은 도움을 주는 어시스턴트입니다.'}
+    assert [message['role'] for message in request_params['messages']] == ['user']
+    assert (request_params['system'][-1] == CACHE_POINT) is prompt_cache
+    assert (request_params['toolConfig']['tools'][-1] == CACHE_POINT) is prompt_cache
+
+
+class CachingBedrockClient(FakeBedrockClient):
+    def converse(self, **request_params):
+        response = super().converse(**request_params)
+        response['usage'] = {'inputTokens': 10, 'outputTokens': 2, 'cacheReadInputTokens': 300, 'cacheWriteInputTokens': 50}
+        return response
+
+
+def test_cache_read_and_write_tokens_are_recorded_as_prompt_tokens():
+    executor = bedrock_executor(set(), prompt_cache=True)
+    for member in executor.client_pool.members:
+        member.client = CachingBedrockClient(member.region_name)
+    metrics_collector = MetricsCollector()
+    metrics_collector.call('generation', 'bedrock', executor.predict, {'serial_num': 1, 'messages': MESSAGES, 'tools': TOOLS, 'temperature': 0.1})
+    request_metric, = metrics_collector.get_request_metrics('generation')
+    assert request_metric['prompt_tokens'] == 360
+    assert request_metric['cached_tokens'] == 300
+    assert request_metric['cache_write_tokens'] == 50
+    assert request_metric['completion_tokens'] == 2
+    request_params, = [request for member in executor.client_pool.members for request in member.client.requests]
+    assert request_params['system'][-1] == CACHE_POINT
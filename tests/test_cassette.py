@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+from src.cassette import Cassette, get_cassette, get_cassette_key
+from src.metrics_collector import MetricsCollector, record_usage
+
+
+class FakeExecutor:
+    model = 'fake-model'
+
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, api_request):
+        self.calls += 1
+        record_usage(prompt_tokens=10 * self.calls, completion_tokens=self.calls)
+        return {'role': 'assistant', 'content': f"answer {self.calls}", 'tool_calls': None}
+
+
+def request(content, **kwargs):
+    return dict({'serial_num': 1, 'tools_type': 'exact', 'messages': [{'role': 'user', 'content': content}],
+                 'tools': [], 'temperature': 0.1}, **kwargs)
+
+
+def call(metrics_collector, executor, api_request):
+    return metrics_collector.call('generation', 'fake', executor.predict, api_request)
+
+
+def record(cassette_file_path, api_requests):
+    executor = Cassette(str(cassette_file_path), 'record').wrap(FakeExecutor(), 'generation')
+    return [call(MetricsCollector(), executor, api_request) for api_request in api_requests]
+
+
+def test_record_then_replay_round_trip(tmp_path):
+    cassette_file_path = tmp_path / 'run.cassette.jsonl'
+    api_requests = [request('a'), request('b')]
+    recorded = record(cassette_file_path, api_requests)
+    assert len(cassette_file_path.read_text().splitlines()) == 2
+
+    fake_executor = FakeExecutor()
+    executor = Cassette(str(cassette_file_path), 'replay').wrap(fake_executor, 'generation')
+    metrics_collector = MetricsCollector()
+    assert [call(metrics_collector, executor, api_request) for api_request in reversed(api_requests)] == recorded[::-1]
+    assert fake_executor.calls == 0
+    # the recorded usage is replayed with the response
+    assert [m['prompt_tokens'] for m in metrics_collector.get_request_metrics('generation')] == [20, 10]
+
+
+def test_repeated_requests_replay_in_order_then_reuse_the_last_recording(tmp_path):
+    cassette_file_path = tmp_path / 'run.cassette.jsonl'
+    record(cassette_file_path, [request('a'), request('a')])
+    cassette = Cassette(str(cassette_file_path), 'replay')
+    replayed = [cassette.replay('generation', 'fake-model', request('a'))['content'] for _ in range(3)]
+    assert replayed == ['answer 1', 'answer 2', 'answer 2']
+
+
+def test_requests_that_differ_only_in_unsent_keys_share_a_recording(tmp_path):
+    assert get_cassette_key('generation', 'm', request('a')) == get_cassette_key('generation', 'm', request('a', serial_num=2, tools_type='4_random'))
+    assert get_cassette_key('generation', 'm', request('a')) != get_cassette_key('generation', 'm', request('a', tools=[{'type': 'function'}]))
+    assert get_cassette_key('generation', 'm', request('a')) != get_cassette_key('judge', 'm', request('a'))
+    assert get_cassette_key('generation', 'm', request('a')) != get_cassette_key('generation', 'other', request('a'))
+
+    cassette_file_path = tmp_path / 'run.cassette.jsonl'
+    record(cassette_file_path, [request('a')])
+    cassette = Cassette(str(cassette_file_path), 'replay')
+    assert cassette.replay('generation', 'fake-model', request('a', tools_type='4_random'))['content'] == 'answer 1'
+
+
+def test_unrecorded_request_raises(tmp_path):
+    cassette_file_path = tmp_path / 'run.cassette.jsonl'
+    record(cassette_file_path, [request('a')])
+    cassette = Cassette(str(cassette_file_path), 'replay')
+    with pytest.raises(Exception, match='not recorded'):
+        cassette.replay('generation', 'fake-model', request('b'))
+    with pytest.raises(Exception, match='not recorded'):
+        cassette.replay('judge', 'fake-model', request('a'))
+
+
+def test_recorded_entry_keeps_the_request(tmp_path):
+    cassette_file_path = tmp_path / 'run.cassette.jsonl'
+    record(cassette_file_path, [request('a')])
+    entry = json.loads(cassette_file_path.read_text())
+    assert entry['request'] == request('a')
+    assert entry['usage']['prompt_tokens'] == 10
+    assert entry['serial_num'] == 1
+
+
+def test_get_cassette_options(tmp_path):
+    assert get_cassette(None, None) is None
+    assert get_cassette(str(tmp_path / 'run.cassette.jsonl'), None).mode == 'record'
+    with pytest.raises(Exception):
+        get_cassette('a.jsonl', 'b.jsonl')
+    with pytest.raises(Exception, match='not found'):
+        get_cassette(None, str(tmp_path / 'missing.jsonl'))
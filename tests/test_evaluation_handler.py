@@ -0,0 +1,80 @@
+import copy
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.evaluation_handler import EvaluationHandler
+from src.formatter import get_eval_key, is_error_evaluation
+from src.hedging import CallDeadlineExceeded
+
+TOOLS = {
+    'exact': [{'type': 'function', 'function': {'name': 'getTodayBoxOfficeRanking', 'parameters': {}}}],
+    '4_random': [{'type': 'function', 'function': {'name': 'getCurrentCryptoPrices', 'parameters': {}}}],
+}
+
+
+class FakeJudge:
+    def __init__(self, parties=1):
+        self.barrier = threading.Barrier(parties, timeout=5)
+        self.prompts = []
+
+    def predict(self, api_request):
+        self.prompts.append(api_request['messages'][0]['content'])
+        # every judge call of a batch is in flight at once
+        self.barrier.wait()
+        return {'id': 'judge', 'choices': [{'message': {'role': 'assistant', 'content': 'wrong function\npass\npass'},
+                                            'finish_reason': 'stop'}]}
+
+
+@pytest.fixture
+def handler():
+    return EvaluationHandler('singlecall', judge_type='openai', judge_api_key='test-key')
+
+
+def singlecall_rows(tools_types):
+    # the rows of a query share their query, ground truth and model response, as the rows of a payload may
+    query = {'serial_num': 1, 'messages': [{'role': 'user', 'content': '현재 박스오피스 순위가 궁금해요'}],
+             'ground_truth': {'name': 'getTodayBoxOfficeRanking', 'arguments': '{}'}, 'acceptable_arguments': None}
+    response = {'role': 'assistant', 'content': None,
+                'tool_calls': [{'id': 'call_1', 'type': 'function', 'function': {'name': 'getMovieList', 'arguments': '{}'}}]}
+    return [(dict(query, tools=TOOLS[tools_type], tools_type=tools_type), response) for tools_type in tools_types]
+
+
+def test_concurrent_evaluations_of_a_query_do_not_change_the_shared_rows(handler):
+    rows = singlecall_rows(['exact', '4_random'] * 4)
+    original_rows = copy.deepcopy(rows)
+    handler.executor = FakeJudge(parties=len(rows))
+    with ThreadPoolExecutor(max_workers=len(rows)) as pool:
+        response_formatters = list(pool.map(lambda inp_out: handler.evaluate_request(*inp_out), rows))
+    assert rows == original_rows
+    # one prompt per tools_type, whichever thread built it
+    assert len(set(handler.executor.prompts)) == 2
+    assert all('"id"' not in prompt for prompt in handler.executor.prompts)
+    assert [response_formatter.request_model['type_of_output'] for response_formatter in response_formatters] == ['call'] * 8
+
+
+class DeadlineJudge:
+    def predict(self, api_request):
+        raise CallDeadlineExceeded('judge call exceeded 5s')
+
+
+@pytest.mark.parametrize('eval_format', ['full', 'slim'])
+def test_judge_deadline_is_an_error_evaluation_that_retry_errors_re_judges(tmp_path, eval_format):
+    handler = EvaluationHandler('singlecall', judge_type='openai', judge_api_key='test-key', eval_format=eval_format)
+    handler.executor = DeadlineJudge()
+    (inp, out), = singlecall_rows(['exact'])
+    eval_file_path, eval_log_file_path = tmp_path / 'eval.jsonl', tmp_path / 'eval_report.tsv'
+    with open(eval_file_path, 'w') as eval_raw_fw, open(eval_log_file_path, 'w') as eval_tsv_fw:
+        handler.save_evaluation(handler.evaluate_request(inp, out), eval_raw_fw, eval_tsv_fw)
+    eval_output = handler.eval_reg.eval_output
+    assert is_error_evaluation(eval_output[0])
+    assert get_eval_key(eval_output[0]) == 'fail'
+    # --debug prints the placeholder like a judge response
+    handler.fetch(dict(inp, type_of_output='call'), out, debug=True)
+
+    handler.executor = FakeJudge()
+    eval_output = handler.retry_error_evaluations([inp], [out], eval_output, eval_file_path, eval_log_file_path)
+    assert not is_error_evaluation(eval_output[0])
+    assert get_eval_key(eval_output[0]) == 'pass'
+    assert len(eval_file_path.read_text().splitlines()) == 1
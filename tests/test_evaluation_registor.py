@@ -0,0 +1,43 @@
+from src.formatter import get_eval_key, mark_error_response
+from src.evaluation_registor import DialogEvaluationRegistor, CommonEvaluationRegistor, get_pass_vector
+
+
+def record(serial_num, is_pass, type_of_output='call', category=None, error=None):
+    model_response = {'role': 'assistant', 'content': 'answer', 'tool_calls': None}
+    if error is not None:
+        model_response = mark_error_response({'role': 'assistant', 'content': '오류 발생', 'tool_calls': None}, error)
+    model_request = {'serial_num': serial_num, 'type_of_output': type_of_output}
+    if category is not None:
+        model_request['category'] = category
+    return {'model_request': model_request, 'model_response': model_response, 'is_pass': is_pass}
+
+
+def test_errored_response_is_an_error_not_a_fail():
+    assert get_eval_key(record(1, 'fail', error='deadline: provider call exceeded')) == 'error'
+    assert get_eval_key(record(1, 'fail')) == 'fail'
+
+
+def test_dialog_display_leaves_errors_out_of_the_pass_rate(capsys):
+    eval_reg = DialogEvaluationRegistor()
+    eval_reg.set_eval_output([record(1, 'pass'), record(2, 'fail'), record(3, 'fail', error='bedrock: ReadTimeoutError'),
+                              record(4, 'fail', type_of_output='slot', error='bedrock: ReadTimeoutError')])
+    assert eval_reg.get_running_pass_rate() == (0.5, 2)
+    eval_reg.display()
+    output = capsys.readouterr().out
+    assert 'total : 1/2' in output
+    assert 'error : 2' in output
+    assert 'avg(micro) : 0.5' in output
+
+
+def test_common_display_with_an_errored_category(capsys):
+    eval_reg = CommonEvaluationRegistor()
+    eval_reg.set_eval_output([record(1, 'pass', category='a'), record(2, 'fail', category='b', error='deadline: timeout')])
+    eval_reg.display()
+    output = capsys.readouterr().out
+    assert 'total : 1/1' in output
+    assert 'error : 1' in output
+
+
+def test_pass_vector_leaves_errors_out():
+    eval_output = [record(1, 'pass'), record(2, 'fail'), record(3, 'fail', error='deadline: timeout')]
+    assert get_pass_vector(eval_output) == {'1': 1, '2': 0}
@@ -0,0 +1,139 @@
+import json
+
+import pytest
+
+from src.evaluation_registor import SingleCallEvaluationRegistor, get_pass_vector
+from src.formatter import (
+    CommonResponseFormatter,
+    DialogResponseFormatter,
+    SingleCallResponseFormatter,
+    convert_eval_key,
+    get_eval_key,
+    is_error_evaluation,
+    mark_error_response,
+    resolve_eval_output
+)
+
+REQUESTS = {
+    CommonResponseFormatter: {'serial_num': 3, 'category': 'weather', 'type_of_output': 'call'},
+    SingleCallResponseFormatter: {'serial_num': 1, 'tools_type': '4_random'},
+    DialogResponseFormatter: {'serial_num': 2, 'type_of_output': 'slot'},
+}
+TYPE_KEYS = {
+    CommonResponseFormatter: ('category', 'type_of_output'),
+    SingleCallResponseFormatter: ('tools_type',),
+    DialogResponseFormatter: ('type_of_output',),
+}
+MESSAGES_KEYS = {CommonResponseFormatter: 'messages', SingleCallResponseFormatter: 'query', DialogResponseFormatter: 'query'}
+EVALUATE_RESPONSES = [
+    {'id': 'judge', 'choices': [{'message': {'role': 'assistant', 'content': '함수 선택이 정확합니다\npass\npass'}}]},
+    {'completion': '인자가 틀렸습니다\nfail\nfail'},
+    {'results': [{'outputText': '통과\n통과'}]},
+    {'content': '판단 불가'},
+    {'unknown': 'shape'},
+]
+
+
+def request_model(formatter_class):
+    return dict(REQUESTS[formatter_class], messages=[{'role': 'user', 'content': '오늘 날씨 알려줘'}],
+                ground_truth={'name': 'getWeather', 'arguments': '{"city": "서울"}'}, acceptable_arguments=None, tools=[])
+
+
+def legacy_report_arguments(formatter_class, model_request, model_response, evaluate_response):
+    # the report arguments of the pydantic formatters (root validator set_report_params)
+    content = None
+    if 'choices' in evaluate_response and len(evaluate_response['choices']) > 0:
+        if 'message' in evaluate_response['choices'][0] and 'content' in evaluate_response['choices'][0]['message']:
+            content = evaluate_response['choices'][0]['message']['content']
+    elif 'completion' in evaluate_response:
+        content = evaluate_response['completion']
+    elif 'results' in evaluate_response and len(evaluate_response['results']) > 0:
+        if 'outputText' in evaluate_response['results'][0]:
+            content = evaluate_response['results'][0]['outputText']
+    elif 'content' in evaluate_response:
+        content = evaluate_response['content']
+    if content is None:
+        content = "No reasoning available"
+    report_arguments = {'serial_num': model_request['serial_num'], 'is_pass': convert_eval_key(evaluate_response)}
+    report_arguments.update({key: model_request[key] for key in TYPE_KEYS[formatter_class]})
+    report_arguments.update({
+        'ground_truth': json.dumps(model_request['ground_truth'], ensure_ascii=False),
+        'acceptable_arguments': json.dumps(model_request['acceptable_arguments'], ensure_ascii=False),
+        'model_output': json.dumps(model_response, ensure_ascii=False),
+        'reasoning': json.dumps({'reasoning': content}, ensure_ascii=False),
+        MESSAGES_KEYS[formatter_class]: json.dumps(model_request['messages'], ensure_ascii=False),
+    })
+    return report_arguments
+
+
+@pytest.mark.parametrize('formatter_class', list(REQUESTS))
+@pytest.mark.parametrize('evaluate_response', EVALUATE_RESPONSES)
+def test_records_match_the_pydantic_formatters(formatter_class, evaluate_response):
+    model_request = request_model(formatter_class)
+    model_response = {'role': 'assistant', 'content': None,
+                      'tool_calls': [{'type': 'function', 'function': {'name': 'getWeather', 'arguments': '{"city": "서울"}'}}]}
+    response_formatter = formatter_class(request_model=model_request, response_model=model_response,
+                                         evaluate_prompt='prompt', evaluate_response=evaluate_response)
+    report_arguments = legacy_report_arguments(formatter_class, model_request, model_response, evaluate_response)
+    expected = {'evaluate_prompt': 'prompt', 'evaluate_response': evaluate_response, 'tsv_keys': list(formatter_class.tsv_keys),
+                'report_arguments': report_arguments, 'model_request': model_request, 'model_response': model_response}
+    # the lines of *.eval.jsonl are unchanged, key order included
+    assert json.dumps(response_formatter.to_dict(), ensure_ascii=False) == json.dumps(expected, ensure_ascii=False)
+    tsv_keys = ['messages' if key == 'input_messages' else key for key in formatter_class.tsv_keys]
+    assert response_formatter.to_tsv() == ''.join(f"{report_arguments[key]}\t" for key in tsv_keys)
+    assert response_formatter.get_tsv_title() == '#' + ''.join(f"{key}\t" for key in formatter_class.tsv_keys)
+
+
+def test_records_keep_references_to_the_request():
+    model_request = request_model(SingleCallResponseFormatter)
+    response_formatter = SingleCallResponseFormatter(request_model=model_request, response_model={}, evaluate_prompt='',
+                                                     evaluate_response=EVALUATE_RESPONSES[0])
+    assert response_formatter.to_dict()['model_request'] is model_request
+    assert response_formatter.report_arguments is response_formatter.report_arguments
+    with pytest.raises(AttributeError):
+        response_formatter.extra = 1
+
+
+def singlecall_formatters():
+    api_request_list, response_formatters = [], []
+    for serial_num, tools_type, evaluate_response in [(1, 'exact', EVALUATE_RESPONSES[0]), (1, '4_random', EVALUATE_RESPONSES[1]),
+                                                      (2, 'exact', mark_error_response(dict(EVALUATE_RESPONSES[1]), 'deadline: 5s'))]:
+        model_request = dict(request_model(SingleCallResponseFormatter), serial_num=serial_num, tools_type=tools_type)
+        api_request_list.append(model_request)
+        response_formatters.append(SingleCallResponseFormatter(request_model=model_request, response_model={'role': 'assistant'},
+                                                               evaluate_prompt='prompt', evaluate_response=evaluate_response))
+    return api_request_list, response_formatters
+
+
+def test_slim_records_resolve_to_the_full_records(capsys):
+    api_request_list, response_formatters = singlecall_formatters()
+    full_output = [json.loads(json.dumps(f.to_dict(), ensure_ascii=False)) for f in response_formatters]
+    slim_output = [json.loads(json.dumps(f.to_slim_dict(), ensure_ascii=False)) for f in response_formatters]
+    assert all('model_request' not in data and 'evaluate_prompt' not in data for data in slim_output)
+    resolved_output = resolve_eval_output(slim_output, api_request_list)
+    assert [data['model_request'] for data in resolved_output] == api_request_list
+    assert [get_eval_key(data) for data in resolved_output] == [get_eval_key(data) for data in full_output] == ['pass', 'fail', 'fail']
+    assert [is_error_evaluation(data) for data in resolved_output] == [is_error_evaluation(data) for data in full_output] == [False, False, True]
+    assert get_pass_vector(slim_output) == get_pass_vector(full_output) == {'1.exact': 1, '1.4_random': 0, '2.exact': 0}
+
+    displays = []
+    for eval_output in (full_output, resolved_output):
+        eval_reg = SingleCallEvaluationRegistor()
+        eval_reg.set_eval_output(eval_output)
+        eval_reg.display()
+        displays.append(capsys.readouterr().out)
+    assert displays[0] == displays[1]
+
+
+def test_slim_report_leaves_the_query_out():
+    _, response_formatters = singlecall_formatters()
+    for response_formatter in response_formatters:
+        full_columns = response_formatter.to_tsv().split('\t')
+        assert response_formatter.to_slim_tsv().split('\t') == full_columns[:-2] + ['']
+    assert response_formatters[0].get_slim_tsv_title() == '#' + ''.join(f"{key}\t" for key in SingleCallResponseFormatter.tsv_keys[:-1])
+
+
+def test_resolve_eval_output_keeps_full_records():
+    api_request_list, response_formatters = singlecall_formatters()
+    full_output = [f.to_dict() for f in response_formatters]
+    assert resolve_eval_output(full_output, []) == full_output
@@ -0,0 +1,55 @@
+import time
+import threading
+
+import pytest
+
+from src.hedging import HedgedCaller, CallDeadlineExceeded
+from src.metrics_collector import MetricsCollector, record_retry, record_usage
+
+
+def slow_call(release):
+    def predict(api_request):
+        record_retry(RuntimeError('throttled'))
+        release.wait(5)
+        record_retry(RuntimeError('throttled'))
+        record_usage(prompt_tokens=10, completion_tokens=3)
+        return api_request
+    return predict
+
+
+def test_calls_inline_without_deadline_or_hedge():
+    threads = []
+    caller = HedgedCaller(lambda api_request: threads.append(threading.current_thread()) or api_request)
+    assert caller('request') == 'request'
+    assert threads == [threading.current_thread()]
+
+
+def test_attempts_run_on_a_bounded_pool():
+    caller = HedgedCaller(lambda api_request: api_request, call_timeout=5, max_concurrency=2)
+    for idx in range(50):
+        assert caller(idx) == idx
+    assert caller.pool.workers <= 4
+
+
+def test_abandoned_attempt_is_counted_in_the_call_and_the_report():
+    release = threading.Event()
+    metrics_collector = MetricsCollector()
+    caller = HedgedCaller(slow_call(release), call_timeout=0.2)
+    metrics_collector.add_hedged_caller('generation', 'fake', caller)
+    with pytest.raises(CallDeadlineExceeded):
+        metrics_collector.call('generation', 'fake', caller, {'serial_num': 1})
+    request_metric = metrics_collector.get_request_metrics('generation')[0]
+    assert request_metric['abandoned'] == 1
+    assert request_metric['retries'] == 1
+    assert metrics_collector.summary()['abandoned']['generation/fake']['finished'] == 0
+
+    release.set()
+    deadline = time.monotonic() + 5
+    while caller.get_abandoned_report()['finished'] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    report = metrics_collector.summary()['abandoned']['generation/fake']
+    assert report['attempts'] == 1
+    assert report['finished'] == 1
+    assert report['retries'] == 1
+    assert report['prompt_tokens'] == 10
+    assert report['completion_tokens'] == 3
@@ -0,0 +1,111 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from evaluate import configure_connections
+from src import openai_utils
+
+
+@pytest.fixture(autouse=True)
+def default_http_pool():
+    openai_utils.configure_http_pool()
+    yield
+    openai_utils.configure_http_pool()
+
+
+def connection_pool(http_client):
+    # the httpcore pool behind the transport of the client
+    return http_client._transport._pool
+
+
+def test_clients_share_one_http_client():
+    openai_client = openai_utils.create_openai_client(api_key='key', base_url='http://127.0.0.1:1/v1')
+    azure_client = openai_utils.create_openai_client(azure=True, api_key='key', azure_endpoint='http://127.0.0.1:2',
+                                                     api_version='2024-02-01')
+    http_client = openai_utils.get_http_client()
+    assert openai_client._client is http_client
+    assert azure_client._client is http_client
+
+
+def test_pool_settings_are_applied_to_the_next_clients():
+    previous_client = openai_utils.create_openai_client(api_key='key')
+    openai_utils.configure_http_pool(max_connections=7, request_timeout=30)
+    openai_client = openai_utils.create_openai_client(api_key='key')
+    http_client = openai_utils.get_http_client()
+    assert openai_client._client is http_client
+    # clients created before keep the previous pool
+    assert previous_client._client is not http_client
+    pool = connection_pool(http_client)
+    assert pool._max_connections == 7
+    assert pool._max_keepalive_connections == 7
+    assert pool._keepalive_expiry == openai_utils.KEEPALIVE_EXPIRY
+    assert openai_client.timeout.read == 30
+    assert openai_client.timeout.connect == openai_utils.CONNECT_TIMEOUT
+
+
+def test_default_pool_settings():
+    pool = connection_pool(openai_utils.get_http_client())
+    assert pool._max_connections == openai_utils.DEFAULT_MAX_CONNECTIONS
+    assert openai_utils.get_request_timeout().read == openai_utils.DEFAULT_REQUEST_TIMEOUT
+
+
+@pytest.mark.parametrize('options, max_connections', [
+    ({}, 2),
+    ({'batch_size': 8, 'use_async': True}, 9),
+    ({'batch_size': 8, 'use_async': True, 'hedge': True}, 18),
+    ({'batch_size': 8, 'autotune': True}, 16),
+])
+def test_pool_is_sized_for_the_model_and_judge_calls(options, max_connections):
+    params = dict({'batch_size': 1, 'use_async': False, 'autotune': False, 'hedge': False, 'http2': False, 'request_timeout': 45},
+                  **options)
+    configure_connections(params)
+    assert connection_pool(openai_utils.get_http_client())._max_connections == max_connections
+    assert openai_utils.get_request_timeout().read == 45
+
+
+class ModelsHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    connections = set()
+    lock = threading.Lock()
+    barrier = None
+
+    def do_GET(self):
+        with self.lock:
+            self.connections.add(self.client_address)
+        if self.barrier is not None:
+            self.barrier.wait()
+        body = json.dumps({'object': 'list', 'data': []}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def models_server():
+    ModelsHandler.connections = set()
+    ModelsHandler.barrier = None
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ModelsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}/v1'
+    server.shutdown()
+    server.server_close()
+
+
+def test_warm_up_opens_connections_that_the_calls_reuse(models_server):
+    openai_utils.configure_http_pool(max_connections=4)
+    clients = [openai_utils.create_openai_client(api_key='key', base_url=models_server) for _ in range(2)]
+    # 2 calls per client, all in flight at once
+    ModelsHandler.barrier = threading.Barrier(4, timeout=5)
+    openai_utils.warm_up_clients(clients, 3)
+    ModelsHandler.barrier = None
+    warmed_up = set(ModelsHandler.connections)
+    assert len(warmed_up) == 4
+    clients[0].models.list()
+    assert ModelsHandler.connections == warmed_up
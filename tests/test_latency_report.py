@@ -0,0 +1,39 @@
+from src.formatter import get_request_key, mark_error_response
+from src.latency_report import get_latency_records, summarize_latency, report_latency
+
+
+def evaluation(serial_num, is_pass, tools_type='exact', error=None):
+    model_response = {'role': 'assistant', 'content': 'answer', 'tool_calls': None}
+    if error is not None:
+        model_response = mark_error_response({'role': 'assistant', 'content': '오류 발생', 'tool_calls': None}, error)
+    return {'model_request': {'serial_num': serial_num, 'tools_type': tools_type, 'type_of_output': 'call'},
+            'model_response': model_response, 'is_pass': is_pass}
+
+
+def stream_metric(data, stream_time, time_to_tool_call=None):
+    return {'request_key': get_request_key(data['model_request']), 'latency': stream_time,
+            'time_to_first_token': stream_time / 2, 'time_to_tool_call': time_to_tool_call, 'stream_time': stream_time}
+
+
+def test_errors_are_counted_apart_from_the_pass_rate():
+    eval_output = [evaluation(1, 'pass'), evaluation(2, 'fail'), evaluation(3, 'fail', error='deadline: timeout'),
+                   evaluation(4, 'pass', tools_type='4_random')]
+    generation_metrics = [stream_metric(data, 1.0 + idx) for idx, data in enumerate(eval_output)]
+    summary = summarize_latency(get_latency_records(generation_metrics, eval_output))
+    assert summary['overall']['requests'] == 4
+    assert summary['overall']['errors'] == 1
+    assert summary['overall']['pass_rate'] == 2 / 3
+    assert summary['by_tools_type']['exact']['pass_rate'] == 0.5
+    assert summary['by_is_pass']['error'] == dict(summary['by_is_pass']['error'], requests=1, errors=1, pass_rate=None)
+    # the timing of an errored call is still measured
+    assert summary['by_is_pass']['error']['stream_time']['max'] == 3.0
+
+
+def test_requests_without_stream_timing_are_left_out(tmp_path, capsys):
+    eval_output = [evaluation(1, 'pass'), evaluation(2, 'fail', error='bedrock: ReadTimeoutError')]
+    generation_metrics = [stream_metric(eval_output[1], 2.0), dict(stream_metric(eval_output[0], 1.0), stream_time=None)]
+    assert report_latency(generation_metrics[1:], eval_output, str(tmp_path / 'run.latency.json')) is None
+    summary = report_latency(generation_metrics, eval_output, str(tmp_path / 'run.latency.json'))
+    assert summary['overall']['requests'] == 1
+    assert '1 requests, 1 errors, pass rate n/a' in capsys.readouterr().out
+    assert (tmp_path / 'run.latency.json').exists()
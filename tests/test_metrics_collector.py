@@ -0,0 +1,136 @@
+import json
+
+import pytest
+
+from src.bedrock_utils import record_bedrock_usage
+from src.metrics_collector import MetricsCollector, get_price, load_price_table, record_retry, record_usage
+from src.openai_utils import record_openai_usage
+
+
+def answer(api_request):
+    return {'role': 'assistant', 'content': api_request['content']}
+
+
+def throttled_answer(api_request):
+    record_retry(RuntimeError('throttled'))
+    record_retry()
+    return answer(api_request)
+
+
+def failing_call(api_request):
+    record_retry(TimeoutError('read timeout'))
+    raise ConnectionError('provider down')
+
+
+def test_stage_wall_times_are_accumulated():
+    metrics_collector = MetricsCollector()
+    for _ in range(2):
+        with metrics_collector.stage('generation'):
+            pass
+    with pytest.raises(ValueError):
+        with metrics_collector.stage('judge'):
+            raise ValueError()
+    stages = metrics_collector.summary()['stages']
+    assert stages['generation']['count'] == 2
+    assert stages['judge']['count'] == 1
+    assert stages['generation']['wall_time'] >= 0.0
+
+
+def test_call_records_the_request_metrics():
+    metrics_collector = MetricsCollector()
+    request = {'serial_num': 3, 'tools_type': 'exact', 'content': 'a'}
+    assert metrics_collector.call('generation', 'fake', throttled_answer, request, queued_at=metrics_collector.origin) == answer(request)
+    with pytest.raises(ConnectionError):
+        metrics_collector.call('generation', 'fake', failing_call, request)
+    first, second = metrics_collector.get_request_metrics('generation')
+    assert (first['serial_num'], first['request_key'], first['tools_type']) == (3, '3.exact', 'exact')
+    assert first['retries'] == 2 and first['retry_errors'] == ['RuntimeError', 'unknown']
+    assert first['error_class'] is None and first['queue_wait'] >= 0.0
+    assert second['error_class'] == 'ConnectionError' and second['retry_errors'] == ['TimeoutError']
+    assert metrics_collector.get_request_metrics('judge') == []
+
+
+def test_call_tags_the_judge_call_with_the_evaluated_request():
+    metrics_collector = MetricsCollector()
+    metrics_collector.call('judge', 'fake', answer, {'content': 'prompt'},
+                           tag_request={'serial_num': 1, 'type_of_output': 'slot'}, model='gpt-4o')
+    request_metric = metrics_collector.get_request_metrics('judge')[0]
+    assert (request_metric['request_key'], request_metric['type_of_output'], request_metric['model']) == ('1', 'slot', 'gpt-4o')
+
+
+def test_summary_per_provider(tmp_path):
+    metrics_collector = MetricsCollector()
+    for idx in range(3):
+        metrics_collector.call('generation', 'fake', throttled_answer if idx == 0 else answer, {'serial_num': idx, 'content': 'a'})
+    with pytest.raises(ConnectionError):
+        metrics_collector.call('generation', 'fake', failing_call, {'serial_num': 3})
+    provider = metrics_collector.summary()['providers']['generation/fake']
+    assert provider['requests'] == 4
+    assert provider['errors'] == 1
+    assert provider['retries'] == 3
+    assert provider['retry_rate'] == 0.75
+    assert provider['error_classes'] == {'RuntimeError': 1, 'unknown': 1, 'TimeoutError': 1, 'ConnectionError': 1}
+    assert provider['latency']['p50'] is not None
+
+    metrics_file_path = tmp_path / 'run.metrics.json'
+    metrics_collector.save(str(metrics_file_path))
+    saved = json.loads(metrics_file_path.read_text())
+    assert len(saved['requests']) == 4
+    assert saved['providers']['generation/fake']['requests'] == 4
+
+
+def test_price_lookup_prefers_the_longest_model_key():
+    price_table = load_price_table()
+    assert get_price(price_table, 'gpt-4o-mini-2024-07-18') == price_table['gpt-4o-mini']
+    assert get_price(price_table, 'gpt-4o-2024-08-06') == price_table['gpt-4o']
+    assert get_price(price_table, 'us.anthropic.claude-3-5-sonnet-20240620-v1:0') == price_table['anthropic.claude-3-5-sonnet']
+    assert get_price(price_table, 'my-local-model') is None
+    assert get_price(price_table, None) is None
+    assert load_price_table('/nonexistent/price_table.cfg') == {}
+
+
+def openai_call(prompt_tokens, cached_tokens, completion_tokens):
+    def predict(api_request):
+        record_openai_usage({'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                                       'prompt_tokens_details': {'cached_tokens': cached_tokens}}})
+        return {}
+    return predict
+
+
+def bedrock_call(api_request):
+    record_bedrock_usage({'usage': {'inputTokens': 100, 'cacheReadInputTokens': 1000, 'cacheWriteInputTokens': 200, 'outputTokens': 50},
+                          'metrics': {'latencyMs': 800}})
+    return {}
+
+
+def test_usage_totals_and_cost_per_provider():
+    metrics_collector = MetricsCollector()
+    for tools_type in ('exact', '4_random'):
+        metrics_collector.call('generation', 'openai', openai_call(1000, 400, 100), {'serial_num': 1, 'tools_type': tools_type},
+                               model='gpt-4o-mini')
+    metrics_collector.call('judge', 'bedrock', bedrock_call, {'serial_num': 1}, model='us.anthropic.claude-3-5-sonnet-20240620-v1:0')
+    usage = metrics_collector.summary()['usage']
+    openai_usage = usage['by_provider']['generation/openai']
+    assert (openai_usage['calls'], openai_usage['prompt_tokens'], openai_usage['cached_tokens'], openai_usage['completion_tokens']) == (2, 2000, 800, 200)
+    assert openai_usage['cache_hit_rate'] == 0.4
+    # (600 * 0.15 + 400 * 0.075 + 100 * 0.6) / 1M per call
+    assert openai_usage['estimated_cost'] == pytest.approx(2 * 180 / 1e6)
+    bedrock_usage = usage['by_provider']['judge/bedrock']
+    # Converse inputTokens leave out the tokens read from and written to the cache
+    assert (bedrock_usage['prompt_tokens'], bedrock_usage['cached_tokens'], bedrock_usage['cache_write_tokens']) == (1300, 1000, 200)
+    # 100 * 3 + 1000 * 0.3 + 200 * 3.75 + 50 * 15
+    assert bedrock_usage['estimated_cost'] == pytest.approx(2100 / 1e6)
+    assert metrics_collector.get_request_metrics('judge')[0]['provider_latency'] == 0.8
+    assert usage['by_tools_type']['generation']['exact']['prompt_tokens'] == 1000
+
+
+def test_unpriced_or_usage_free_calls():
+    metrics_collector = MetricsCollector()
+    metrics_collector.call('generation', 'inhouse', openai_call(10, 0, 5), {'serial_num': 1}, model='gpt-4o')
+    metrics_collector.call('generation', 'inhouse', openai_call(10, 0, 5), {'serial_num': 2}, model='my-local-model')
+    metrics_collector.call('judge', 'fake', lambda api_request: record_usage() or {}, {'serial_num': 1}, model='gpt-4o')
+    usage = metrics_collector.summary()['usage']['by_provider']
+    # one unpriced call leaves the total unpriced rather than understated
+    assert usage['generation/inhouse']['estimated_cost'] is None
+    assert usage['judge/fake']['cache_hit_rate'] is None
+    assert usage['judge/fake']['estimated_cost'] == 0.0
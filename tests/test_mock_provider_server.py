@@ -0,0 +1,117 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from argparse import Namespace
+from http.server import ThreadingHTTPServer
+
+import openai
+import pytest
+
+from benchmarks.mock_provider_server import MockProvider, MockProviderHandler
+
+WEATHER_TOOL = {'type': 'function', 'function': {'name': 'getWeather', 'parameters': {
+    'type': 'object', 'properties': {'city': {'type': 'string'}, 'unit': {'type': 'string', 'enum': ['C', 'F']}}, 'required': ['city', 'unit']}}}
+
+
+def provider_args(**kwargs):
+    args = dict(seed=0, latency_median=0.0, latency_sigma=0.0, rate_limit_latency=0.0, error_rate=0.0, rate_limit_rate=0.0,
+                burst_every=0, burst_length=0, retry_after=1, tool_call_rate=1.0, canned_path=None, stream_interval=0.0, verbose=False)
+    args.update(kwargs)
+    return Namespace(**args)
+
+
+@pytest.fixture
+def mock_server():
+    servers = []
+
+    def start(**kwargs):
+        handler = type('Handler', (MockProviderHandler,), {'provider': MockProvider(provider_args(**kwargs))})
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f'http://127.0.0.1:{server.server_address[1]}'
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def post(url, payload):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode('utf-8'), headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status, dict(response.headers), response.read().decode('utf-8')
+    except urllib.error.HTTPError as e:
+        return e.code, dict(e.headers), e.read().decode('utf-8')
+
+
+def chat_request(content='서울 날씨 알려줘', **kwargs):
+    return dict({'model': 'mock', 'messages': [{'role': 'user', 'content': content}], 'tools': [WEATHER_TOOL]}, **kwargs)
+
+
+def test_openai_client_gets_a_tool_call_with_the_required_arguments(mock_server):
+    client = openai.OpenAI(base_url=f'{mock_server()}/v1', api_key='mock-key', max_retries=0)
+    response = client.chat.completions.create(**chat_request())
+    tool_call = response.choices[0].message.tool_calls[0]
+    assert tool_call.function.name == 'getWeather'
+    assert json.loads(tool_call.function.arguments) == {'city': 'mock', 'unit': 'C'}
+    assert response.usage.prompt_tokens > 0
+
+
+def test_streamed_response_rebuilds_the_tool_call(mock_server):
+    status, headers, body = post(f'{mock_server()}/v1/chat/completions', chat_request(stream=True, stream_options={'include_usage': True}))
+    events = [line[len('data: '):] for line in body.splitlines() if line.startswith('data: ')]
+    assert events[-1] == '[DONE]'
+    chunks = [json.loads(event) for event in events[:-1]]
+    arguments = ''.join(tool_call['function']['arguments'] for chunk in chunks for choice in chunk['choices']
+                        for tool_call in choice['delta'].get('tool_calls', []))
+    assert json.loads(arguments) == {'city': 'mock', 'unit': 'C'}
+    assert chunks[-1]['usage']['prompt_tokens'] > 0
+
+
+def test_answers_are_deterministic_and_canned_answers_match(mock_server, tmp_path):
+    canned_path = tmp_path / 'canned.jsonl'
+    canned_path.write_text(json.dumps({'match': '안녕', 'content': '안녕하세요'}, ensure_ascii=False) + '\n', encoding='utf-8')
+    base_url = mock_server(tool_call_rate=0.5, canned_path=str(canned_path))
+    answers = [json.loads(post(f'{base_url}/v1/chat/completions', chat_request(content))[2])['choices'][0]['message']
+               for content in ['질문 1', '질문 2', '질문 3', '질문 1', '안녕']]
+    assert answers[0] == answers[3]
+    assert answers[4]['content'] == '안녕하세요'
+
+
+def test_rate_limit_bursts_and_errors(mock_server):
+    base_url = mock_server(burst_every=3, burst_length=1, retry_after=2)
+    statuses = [post(f'{base_url}/v1/chat/completions', chat_request(f'질문 {idx}')) for idx in range(4)]
+    assert [status for status, _, _ in statuses] == [429, 200, 200, 429]
+    assert statuses[0][1]['Retry-After'] == '2'
+    assert post(f'{mock_server(error_rate=1.0)}/v1/chat/completions', chat_request())[0] == 500
+
+
+def test_latency_and_errors_depend_on_the_request_and_its_attempt():
+    provider = MockProvider(provider_args(latency_median=0.5, latency_sigma=0.5, error_rate=0.5))
+    other_provider = MockProvider(provider_args(latency_median=0.5, latency_sigma=0.5, error_rate=0.5))
+    bodies = [json.dumps(chat_request(f'질문 {idx}')).encode('utf-8') for idx in range(20)]
+    first_attempts = [provider.get_outcome(body) for body in bodies]
+    # another server, or the same requests in another order, sees the same outcomes
+    assert [other_provider.get_outcome(body) for body in reversed(bodies)] == first_attempts[::-1]
+    # a retry is a new draw
+    assert [provider.get_outcome(body) for body in bodies] != first_attempts
+    assert {outcome for _, outcome in first_attempts} == {None, 'error'}
+
+
+def test_bedrock_and_gemini_formats(mock_server):
+    base_url = mock_server()
+    bedrock_request = {'messages': [{'role': 'user', 'content': [{'text': '서울 날씨'}]}],
+                       'toolConfig': {'tools': [{'toolSpec': {'name': 'getWeather', 'inputSchema': {'json': WEATHER_TOOL['function']['parameters']}}}]}}
+    status, _, body = post(f'{base_url}/model/anthropic.claude-3-5-sonnet/converse', bedrock_request)
+    response = json.loads(body)
+    assert status == 200 and response['stopReason'] == 'tool_use'
+    assert response['output']['message']['content'][0]['toolUse']['input'] == {'city': 'mock', 'unit': 'C'}
+    gemini_request = {'contents': [{'role': 'user', 'parts': [{'text': '서울 날씨'}]}],
+                      'tools': [{'functionDeclarations': [dict(WEATHER_TOOL['function'])]}]}
+    status, _, body = post(f'{base_url}/v1/projects/p/locations/l/publishers/google/models/gemini-1.5-pro:generateContent', gemini_request)
+    assert json.loads(body)['candidates'][0]['content']['parts'][0]['functionCall']['name'] == 'getWeather'
+    with urllib.request.urlopen(f'{base_url}/health', timeout=5) as response:
+        assert response.status == 200
@@ -0,0 +1,257 @@
+import time
+import threading
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import openai
+import pytest
+
+from src import openai_utils
+from src.metrics_collector import MetricsCollector
+
+
+class FakeRawResponse:
+    def __init__(self, chunks, headers=None):
+        self.headers = headers or {}
+        self.chunks = chunks
+
+    def parse(self):
+        return iter(self.chunks)
+
+
+def fake_client(create):
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+        create=create, with_raw_response=SimpleNamespace(create=create))))
+
+
+def test_client_pool_releases_a_stream_after_it_is_read():
+    pool = openai_utils.OpenaiClientPool(['key-1'])
+    member = pool.members[0]
+    member.client = fake_client(lambda **kwargs: FakeRawResponse(['a', 'b']))
+    stream = pool.create(model='m', messages=[], stream=True)
+    assert member.in_flight == 1
+    assert next(stream) == 'a'
+    assert member.in_flight == 1
+    assert list(stream) == ['b']
+    assert member.in_flight == 0
+    assert member.reserved_tokens == 0
+
+
+def test_replica_pool_releases_a_stream_after_it_is_read():
+    pool = openai_utils.OpenaiReplicaPool(['http://127.0.0.1:1/v1'], api_key='key', health_interval=0)
+    member = pool.members[0]
+    member.client = fake_client(lambda **kwargs: iter(['a', 'b']))
+    stream = pool.create(model='m', messages=[], stream=True)
+    assert member.in_flight == 1
+    assert list(stream) == ['a', 'b']
+    assert member.in_flight == 0
+    assert member.outstanding_tokens == 0
+
+
+def test_replica_pool_releases_a_stream_that_fails():
+    def chunks():
+        yield 'a'
+        raise RuntimeError('connection reset')
+
+    pool = openai_utils.OpenaiReplicaPool(['http://127.0.0.1:1/v1'], api_key='key', health_interval=0)
+    member = pool.members[0]
+    member.client = fake_client(lambda **kwargs: chunks())
+    with pytest.raises(RuntimeError):
+        list(pool.create(model='m', messages=[], stream=True))
+    assert member.in_flight == 0
+
+
+@pytest.mark.parametrize('value, seconds', [('1s', 1.0), ('6m0s', 360.0), ('20ms', 0.02), ('1h2m', 3720.0), ('0.5', 0.5),
+                                            ('', None), (None, None), ('soon', None)])
+def test_parse_reset_duration(value, seconds):
+    assert openai_utils.parse_reset_duration(value) == seconds
+
+
+@pytest.mark.parametrize('headers, seconds', [({'retry-after-ms': '250', 'retry-after': '1'}, 0.25), ({'retry-after': '2'}, 2.0),
+                                              ({'retry-after': 'Wed, 21 Oct 2015 07:28:00 GMT'}, None), ({}, None), (None, None)])
+def test_get_retry_after(headers, seconds):
+    assert openai_utils.get_retry_after(headers) == seconds
+
+
+def rate_limit_headers(remaining_requests, remaining_tokens, reset_tokens='1s'):
+    return {'x-ratelimit-limit-requests': '100', 'x-ratelimit-remaining-requests': str(remaining_requests),
+            'x-ratelimit-limit-tokens': '10000', 'x-ratelimit-remaining-tokens': str(remaining_tokens),
+            'x-ratelimit-reset-tokens': reset_tokens}
+
+
+def test_requests_go_to_the_member_with_the_most_headroom():
+    pool = openai_utils.OpenaiClientPool(['key-1', 'key-2'])
+    first, second = pool.members
+    pool.release(pool.acquire(), headers=rate_limit_headers(90, 9000))
+    pool.release(pool.acquire(), headers=rate_limit_headers(20, 9000))
+    assert (first.remaining_requests, second.remaining_requests) == (90, 20)
+    assert all(pool.acquire() is first for _ in range(3))
+    # requests in flight count against the headroom of their member
+    assert first.get_headroom() == pytest.approx(0.87)
+
+
+def test_member_out_of_tokens_is_saturated_until_its_window_resets():
+    pool = openai_utils.OpenaiClientPool(['key-1', 'key-2'])
+    first, second = pool.members
+    pool.release(pool.acquire(), headers=rate_limit_headers(90, 0, reset_tokens='6m0s'))
+    assert first.saturated_until - time.monotonic() == pytest.approx(360.0, abs=1.0)
+    assert all(pool.acquire() is second for _ in range(3))
+    assert pool.get_status()[0]['saturations'] == 1
+
+
+def test_member_without_enough_tokens_for_the_request_is_skipped():
+    pool = openai_utils.OpenaiClientPool(['key-1', 'key-2'])
+    first, second = pool.members
+    first.remaining_tokens, first.limit_tokens = 5000, 10000
+    second.remaining_tokens, second.limit_tokens = 100, 100
+    # the second member has the most headroom, but only the first can take 1000 tokens
+    assert pool.acquire(tokens=1000) is first
+    assert first.reserved_tokens == 1000
+
+
+def rate_limit_error(headers):
+    request = openai_utils.httpx.Request('POST', 'https://api.openai.com/v1/chat/completions')
+    return openai.RateLimitError('Rate limit reached', response=openai_utils.httpx.Response(429, headers=headers, request=request), body=None)
+
+
+def test_rate_limited_request_fails_over_to_another_key():
+    def rate_limited(**kwargs):
+        raise rate_limit_error({'retry-after': '30'})
+
+    pool = openai_utils.OpenaiClientPool(['key-1', 'key-2'])
+    first, second = pool.members
+    first.client = fake_client(rate_limited)
+    second.client = fake_client(lambda **kwargs: FakeRawResponse(['answer'], rate_limit_headers(99, 9900)))
+    metrics_collector = MetricsCollector()
+    response = metrics_collector.call('generation', 'openai', lambda api_request: pool.create(**api_request),
+                                      {'model': 'gpt-4o', 'messages': [{'role': 'user', 'content': '안녕'}]})
+    assert list(response) == ['answer']
+    assert metrics_collector.get_request_metrics('generation')[0]['retry_errors'] == ['RateLimitError']
+    assert first.saturated_until - time.monotonic() == pytest.approx(30.0, abs=1.0)
+    assert (first.rate_limits, first.in_flight, second.in_flight) == (1, 0, 0)
+
+
+def test_rate_limited_everywhere_gives_up():
+    pool = openai_utils.OpenaiClientPool(['key-1'], max_rate_limits=2)
+    attempts = []
+
+    def rate_limited(**kwargs):
+        attempts.append(kwargs)
+        raise rate_limit_error({'retry-after-ms': '10'})
+    pool.members[0].client = fake_client(rate_limited)
+    with pytest.raises(openai.RateLimitError):
+        pool.create(model='gpt-4o', messages=[])
+    assert len(attempts) == 2
+
+
+def test_azure_members_use_their_deployment():
+    pool = openai_utils.OpenaiClientPool(['key'], api_bases=['https://east.openai.azure.com', 'https://west.openai.azure.com'],
+                                         models=['gpt-4o-east', 'gpt-4o-west'], api_version='2024-06-01')
+    assert [member.name for member in pool.members] == ['east.openai.azure.com/gpt-4o-east', 'west.openai.azure.com/gpt-4o-west']
+    models = []
+    for member in pool.members:
+        member.client = fake_client(lambda **kwargs: models.append(kwargs['model']) or FakeRawResponse([]))
+    pool.create(model='gpt-4o', messages=[])
+    pool.create(model='gpt-4o', messages=[])
+    assert sorted(models) == ['gpt-4o-east', 'gpt-4o-west']
+    with pytest.raises(Exception, match='one per member'):
+        openai_utils.OpenaiClientPool(['key-1', 'key-2', 'key-3'], api_bases=['https://east.openai.azure.com', 'https://west.openai.azure.com'])
+
+
+def replica_pool(n_replicas=3):
+    pool = openai_utils.OpenaiReplicaPool([f'http://127.0.0.1:{idx + 1}/v1' for idx in range(n_replicas)], api_key='key', health_interval=0)
+    return pool, pool.members
+
+
+def test_replica_with_the_fewest_outstanding_requests_is_selected():
+    pool, (first, second, third) = replica_pool()
+    first.in_flight, second.in_flight, third.in_flight = 2, 1, 1
+    second.outstanding_tokens, third.outstanding_tokens = 500, 100
+    # fewest requests in flight, then fewest tokens in flight
+    member = pool.acquire(tokens=300)
+    assert member is third
+    assert (third.in_flight, third.outstanding_tokens) == (2, 400)
+    assert pool.acquire() is second
+    pool.release(third, tokens=300)
+    assert (third.in_flight, third.outstanding_tokens) == (1, 100)
+
+
+def test_long_requests_do_not_pile_up_on_one_replica():
+    pool, members = replica_pool(2)
+    held = [pool.acquire(tokens=tokens) for tokens in (4000, 100, 100)]
+    assert [member.base_url for member in held] == [members[0].base_url, members[1].base_url, members[1].base_url]
+    assert (members[0].outstanding_tokens, members[1].outstanding_tokens) == (4000, 200)
+
+
+def connection_error():
+    return openai.APIConnectionError(request=openai_utils.httpx.Request('POST', 'http://127.0.0.1:1/v1/chat/completions'))
+
+
+def status_error(status_code):
+    request = openai_utils.httpx.Request('POST', 'http://127.0.0.1:1/v1/chat/completions')
+    response = openai_utils.httpx.Response(status_code, request=request)
+    return openai.APIStatusError(f'status {status_code}', response=response, body=None)
+
+
+@pytest.mark.parametrize('error', [connection_error(), status_error(503)])
+def test_dead_replica_is_dropped_and_the_request_fails_over(error):
+    def down(**kwargs):
+        raise error
+
+    pool, (first, second) = replica_pool(2)
+    first.client = fake_client(down)
+    second.client = fake_client(lambda **kwargs: 'answer')
+    metrics_collector = MetricsCollector()
+    assert metrics_collector.call('generation', 'inhouse', lambda api_request: pool.create(**api_request),
+                                  {'model': 'm', 'messages': []}) == 'answer'
+    assert metrics_collector.get_request_metrics('generation')[0]['retries'] == 1
+    assert (first.healthy, first.failures, first.in_flight) == (False, 1, 0)
+    assert all(pool.acquire() is second for _ in range(3))
+
+
+def test_request_error_is_not_a_failover():
+    def bad_request(**kwargs):
+        raise status_error(400)
+
+    pool, (first, second) = replica_pool(2)
+    first.client = second.client = fake_client(bad_request)
+    with pytest.raises(openai.APIStatusError):
+        pool.create(model='m', messages=[])
+    assert first.healthy and second.healthy
+    assert first.requests + second.requests == 1
+
+
+class HealthHandler(BaseHTTPRequestHandler):
+    status = 200
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(self.status if self.path == '/health' else 404)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+@pytest.fixture
+def health_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), type('Handler', (HealthHandler,), {}))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_health_checks_drop_and_bring_back_replicas(health_server):
+    base_url = f'http://127.0.0.1:{health_server.server_address[1]}/v1'
+    assert openai_utils.check_replica_health(base_url)
+    health_server.RequestHandlerClass.status = 503
+    assert not openai_utils.check_replica_health(base_url)
+
+    closed_port_url = 'http://127.0.0.1:1/v1'
+    pool = openai_utils.OpenaiReplicaPool([base_url, closed_port_url], api_key='key', health_interval=0, health_timeout=1.0)
+    pool.check_health()
+    assert [member.healthy for member in pool.members] == [False, False]
+    health_server.RequestHandlerClass.status = 200
+    pool.check_health()
+    assert [member.healthy for member in pool.members] == [True, False]
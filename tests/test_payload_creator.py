@@ -0,0 +1,85 @@
+import os
+import shutil
+
+import pytest
+
+from src.payload_creator import PayloadCreatorFactory
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def singlecall_set(tmp_path):
+    input_file_path = tmp_path / 'FunctionChat-Singlecall.jsonl'
+    with open(f'{REPO_PATH}/data/FunctionChat-Singlecall.jsonl', 'r', encoding='utf-8') as ff:
+        input_file_path.write_text(''.join(ff.readlines()[:3]), encoding='utf-8')
+    shutil.copy(f'{REPO_PATH}/data/system_prompt.txt', tmp_path / 'system_prompt.txt')
+    return tmp_path
+
+
+def create_payload(tmp_path, tools_type='all', temperature=0.1, system_prompt='system_prompt.txt'):
+    payload_creator = PayloadCreatorFactory.get_payload_creator('singlecall', temperature, str(tmp_path / system_prompt))
+    compiled = []
+    compile_payload = payload_creator.compile_payload
+
+    def counted_compile_payload(test_set, **kwargs):
+        compiled.append(True)
+        return compile_payload(test_set, **kwargs)
+    payload_creator.compile_payload = counted_compile_payload
+    api_request_list = payload_creator.create_payload(
+        input_file_path=str(tmp_path / 'FunctionChat-Singlecall.jsonl'), request_file_path=str(tmp_path / 'request.jsonl'),
+        reset=False, tools_type=tools_type, compiled_dir=str(tmp_path), save_request_file=False)
+    return api_request_list, bool(compiled)
+
+
+def compiled_files(tmp_path):
+    return sorted(path for path in os.listdir(tmp_path) if path.endswith('.compiled.jsonl'))
+
+
+def test_artifact_is_reused_when_nothing_changed(singlecall_set):
+    first, compiled = create_payload(singlecall_set)
+    assert compiled
+    second, compiled = create_payload(singlecall_set)
+    assert not compiled
+    assert second == first
+    assert len(compiled_files(singlecall_set)) == 1
+
+
+def test_artifact_is_rebuilt_when_the_source_changes(singlecall_set):
+    first, _ = create_payload(singlecall_set)
+    input_file_path = singlecall_set / 'FunctionChat-Singlecall.jsonl'
+    lines = input_file_path.read_text(encoding='utf-8').splitlines(keepends=True)
+    input_file_path.write_text(''.join(lines[:2]), encoding='utf-8')
+    second, compiled = create_payload(singlecall_set)
+    assert compiled
+    assert len(second) < len(first)
+    assert len(compiled_files(singlecall_set)) == 2
+
+
+@pytest.mark.parametrize('options', [{'tools_type': 'exact'}, {'temperature': 0.7}, {'system_prompt': 'other_prompt.txt'}])
+def test_artifact_is_rebuilt_when_an_option_changes(singlecall_set, options):
+    (singlecall_set / 'other_prompt.txt').write_text('another system prompt', encoding='utf-8')
+    create_payload(singlecall_set)
+    _, compiled = create_payload(singlecall_set, **options)
+    assert compiled
+    assert len(compiled_files(singlecall_set)) == 2
+
+
+def test_truncated_artifact_is_rebuilt(singlecall_set):
+    first, _ = create_payload(singlecall_set)
+    compiled_file_path = singlecall_set / compiled_files(singlecall_set)[0]
+    lines = compiled_file_path.read_text(encoding='utf-8').splitlines(keepends=True)
+    compiled_file_path.write_text(''.join(lines[:-1]), encoding='utf-8')
+    second, compiled = create_payload(singlecall_set)
+    assert compiled
+    assert second == first
+
+
+def test_tools_type_rows_of_a_query_do_not_share_objects(singlecall_set):
+    api_request_list, _ = create_payload(singlecall_set)
+    rows = [request for request in api_request_list if request['serial_num'] == api_request_list[0]['serial_num']]
+    assert len(rows) == 5
+    rows[0]['ground_truth']['name'] = 'changed'
+    rows[0]['messages'].append({'role': 'user', 'content': 'changed'})
+    assert all(row['ground_truth']['name'] != 'changed' for row in rows[1:])
+    assert all(len(row['messages']) == 2 for row in rows[1:])
@@ -0,0 +1,76 @@
+import pytest
+
+from src.run_directory import RunDirectory, get_run_config
+
+
+@pytest.fixture
+def params(tmp_path):
+    input_file_path = tmp_path / 'FunctionChat-Singlecall.jsonl'
+    input_file_path.write_text('{"serial_num": 1}\n', encoding='utf-8')
+    return {'input_path': str(input_file_path), 'model': 'gpt-4', 'temperature': 0.1, 'tools_type': 'all',
+            'api_key': 'secret-1', 'batch_size': 1, 'debug': False}
+
+
+def run_directory(tmp_path, params):
+    return RunDirectory(str(tmp_path / 'output'), 'run', get_run_config('singlecall', params))
+
+
+@pytest.mark.parametrize('changed', [{'model': 'gpt-4o'}, {'temperature': 0.7}, {'tools_type': 'exact'}])
+def test_a_changed_option_gives_a_new_directory(tmp_path, params, changed):
+    assert run_directory(tmp_path, params).path != run_directory(tmp_path, dict(params, **changed)).path
+
+
+def test_a_changed_input_file_gives_a_new_directory(tmp_path, params):
+    path = run_directory(tmp_path, params).path
+    with open(params['input_path'], 'a', encoding='utf-8') as ff:
+        ff.write('{"serial_num": 2}\n')
+    assert run_directory(tmp_path, params).path != path
+
+
+def test_a_moved_input_file_keeps_its_directory(tmp_path, params):
+    moved_file_path = tmp_path / 'moved.jsonl'
+    moved_file_path.write_bytes(open(params['input_path'], 'rb').read())
+    assert run_directory(tmp_path, params).path == run_directory(tmp_path, dict(params, input_path=str(moved_file_path))).path
+
+
+def test_secrets_and_excluded_options_keep_the_directory(tmp_path, params):
+    changed = dict(params, api_key='secret-2', judge_api_key='secret-3', batch_size=8, debug=True, reset=True)
+    assert run_directory(tmp_path, params).path == run_directory(tmp_path, changed).path
+    config = get_run_config('singlecall', changed)
+    assert not {'api_key', 'judge_api_key', 'batch_size', 'debug', 'reset'} & set(config)
+
+
+def test_a_second_acquire_of_the_directory_raises(tmp_path, params):
+    first, second = run_directory(tmp_path, params), run_directory(tmp_path, params)
+    first.acquire()
+    try:
+        with pytest.raises(Exception, match='locked by another process'):
+            second.acquire()
+    finally:
+        first.release()
+    second.acquire()
+    second.release()
+
+
+def test_manifest_records_the_run(tmp_path, params):
+    with run_directory(tmp_path, params) as run_dir:
+        open(run_dir.get_file_path('run.output.jsonl'), 'w').close()
+        manifest = run_dir.load_manifest()
+        assert manifest['status'] == 'running'
+        created_at = manifest['created_at']
+    manifest = run_dir.load_manifest()
+    assert manifest['status'] == 'finished'
+    assert manifest['created_at'] == created_at
+    assert manifest['config_hash'] == run_dir.config_hash
+    assert manifest['config']['input_path_sha256']
+    assert manifest['files'] == ['run.output.jsonl']
+
+
+def test_manifest_records_a_failed_run_and_releases_the_lock(tmp_path, params):
+    with pytest.raises(RuntimeError):
+        with run_directory(tmp_path, params):
+            raise RuntimeError('provider down')
+    run_dir = run_directory(tmp_path, params)
+    assert run_dir.load_manifest()['status'] == 'failed'
+    run_dir.acquire()
+    run_dir.release()
@@ -0,0 +1,106 @@
+import os
+import json
+import time
+
+import pytest
+
+from src.run_directory import RunDirectory
+from src.run_planner import CHARS_PER_TOKEN, format_duration, get_exact_pass_rate, plan_run
+
+
+def dialog_requests():
+    return [{'serial_num': idx, 'type_of_output': type_of_output, 'messages': [{'role': 'user', 'content': 'x' * 40}],
+             'tools': [], 'ground_truth': {'role': 'assistant', 'content': 'y' * 10}, 'acceptable_arguments': None}
+            for idx, type_of_output in enumerate(['call', 'call', 'call', 'call', 'completion', 'slot'])]
+
+
+def run_directory(output_path, model='gpt-4o', config=None):
+    return RunDirectory(str(output_path), f'FunctionChat-Dialog.{model}', config or {'model': model})
+
+
+def write_prior_run(output_path, model, exact_passes, latency_mean):
+    prior_run = run_directory(output_path, model, {'model': model, 'temperature': 0.7})
+    records = [{'request_key': str(idx), 'is_pass': 'pass' if idx < exact_passes else 'fail',
+                'reasoning': 'exact-eval\n\npass\npass\n' if idx < exact_passes else 'judged', 'model_response': {}}
+               for idx in range(4)]
+    (output_path / prior_run.path.split('/')[-1]).mkdir(parents=True)
+    with open(prior_run.get_file_path(f'{prior_run.run_name}.eval.jsonl'), 'w', encoding='utf-8') as ff:
+        ff.write(''.join(f'{json.dumps(record)}\n' for record in records))
+    latency = {'p50': latency_mean, 'p95': 2 * latency_mean, 'p99': 2 * latency_mean, 'mean': latency_mean, 'max': 2 * latency_mean}
+    with open(prior_run.get_file_path(f'{prior_run.run_name}.metrics.json'), 'w', encoding='utf-8') as ff:
+        ff.write(json.dumps({'providers': {'generation/OpenaiModelAPI': {'latency': latency},
+                                           'judge/OpenaiModelAPI': {'latency': dict(latency, mean=3.0)}}}))
+
+
+def plan(run_dir, api_request_list, batch_size=1, use_async=False, only_exact=False):
+    return plan_run('dialog', api_request_list, run_dir, run_dir.get_file_path('run.output.jsonl'),
+                    run_dir.get_file_path('run.eval.jsonl'), 'gpt-4o', batch_size, use_async, only_exact)
+
+
+def test_plan_without_a_prior_run_is_an_upper_bound(tmp_path):
+    api_request_list = dialog_requests()
+    result = plan(run_directory(tmp_path), api_request_list)
+    assert (result['requests'], result['model_calls'], result['judge_calls']) == (6, 6, 6)
+    assert result['exact_pass_rate'] is None
+    assert (result['generation_wall_time'], result['judge_wall_time']) == (None, None)
+    # messages and (empty) tools of every model call
+    message_chars = len(json.dumps(api_request_list[0]['messages'])) + len('[]')
+    assert result['model_input_tokens'] == 6 * -(-message_chars // CHARS_PER_TOKEN)
+    assert result['judge_input_tokens'] > result['model_input_tokens']
+
+
+def test_plan_counts_the_cached_outputs_and_evaluations(tmp_path):
+    run_dir = run_directory(tmp_path)
+    (tmp_path / run_dir.path.split('/')[-1]).mkdir(parents=True)
+    with open(run_dir.get_file_path('run.output.jsonl'), 'w') as ff:
+        ff.write('{}\n{}\n{}\n')
+    with open(run_dir.get_file_path('run.eval.jsonl'), 'w') as ff:
+        ff.write('{}\n')
+    result = plan(run_dir, dialog_requests())
+    assert (result['model_calls'], result['cached_model_outputs']) == (3, 3)
+    assert (result['judge_calls'], result['cached_evaluations']) == (5, 1)
+
+
+def test_plan_uses_the_exact_pass_rate_and_latency_of_a_prior_run(tmp_path):
+    write_prior_run(tmp_path, 'gpt-4o', exact_passes=3, latency_mean=1.0)
+    result = plan(run_directory(tmp_path), dialog_requests())
+    assert result['exact_pass_rate'] == 0.75
+    # 2 non-call requests and the quarter of the 4 call requests that did not pass by exact match
+    assert result['judge_calls'] == 3.0
+    assert result['generation_wall_time'] == 6.0
+    assert result['judge_wall_time'] == 9.0
+    # batches wait for their slowest call
+    assert plan(run_directory(tmp_path), dialog_requests(), batch_size=4, use_async=True)['generation_wall_time'] == 2 * 2.0
+    assert plan(run_directory(tmp_path), dialog_requests(), only_exact=True)['judge_calls'] == 0.0
+
+
+def test_prior_run_of_the_same_model_is_preferred(tmp_path):
+    write_prior_run(tmp_path, 'gpt-4o', exact_passes=1, latency_mean=1.0)
+    write_prior_run(tmp_path, 'other-model', exact_passes=4, latency_mean=1.0)
+    assert plan(run_directory(tmp_path), dialog_requests())['exact_pass_rate'] == 0.25
+    # a model without a prior run of its own falls back to the latest run of any model
+    latest_run = run_directory(tmp_path, 'other-model', {'model': 'other-model', 'temperature': 0.7})
+    latest_eval_file_path = latest_run.get_file_path(f'{latest_run.run_name}.eval.jsonl')
+    os.utime(latest_eval_file_path, (time.time() + 60, time.time() + 60))
+    new_run = run_directory(tmp_path, 'new-model')
+    result = plan_run('dialog', dialog_requests(), new_run, new_run.get_file_path('run.output.jsonl'),
+                      new_run.get_file_path('run.eval.jsonl'), 'new-model', 1, False, False)
+    assert (result['exact_pass_rate'], result['exact_pass_rate_source']) == (1.0, latest_eval_file_path)
+
+
+def test_exact_pass_rate_of_full_records(tmp_path):
+    eval_file_path = tmp_path / 'run.eval.jsonl'
+    api_request_list = dialog_requests()
+    records = [{'model_request': api_request_list[0], 'evaluate_response': {'id': 'exact-match', 'choices': [{'message': {'content': 'pass\npass'}}]},
+                'model_response': {}},
+               {'model_request': api_request_list[1], 'evaluate_response': {'id': 'judge', 'choices': [{'message': {'content': 'pass\npass'}}]},
+                'model_response': {}},
+               {'model_request': api_request_list[4], 'evaluate_response': {'id': 'judge', 'choices': [{'message': {'content': 'pass\npass'}}]},
+                'model_response': {}}]
+    eval_file_path.write_text(''.join(f'{json.dumps(record)}\n' for record in records))
+    assert get_exact_pass_rate(str(eval_file_path), 'dialog', api_request_list) == (0.5, 2)
+
+
+@pytest.mark.parametrize('seconds, expected', [(None, 'unknown (no prior run metrics)'), (59.6, '0h 01m 00s'), (3725, '1h 02m 05s')])
+def test_format_duration(seconds, expected):
+    assert format_duration(seconds) == expected
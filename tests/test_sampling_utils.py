@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from src.sampling_utils import stratified_sample, stratified_order
+
+
+def make_requests(stratum_sizes):
+    return [{'serial_num': idx, 'tools_type': f'type-{stratum}'}
+            for stratum, size in enumerate(stratum_sizes) for idx in range(size)]
+
+
+def count_strata(requests, indices):
+    counts = {}
+    for idx in indices:
+        counts[requests[idx]['tools_type']] = counts.get(requests[idx]['tools_type'], 0) + 1
+    return counts
+
+
+def test_sample_n_with_small_strata_returns_the_requested_size():
+    requests = make_requests([50, 1, 2, 1])
+    sampled = stratified_sample(requests, 'singlecall', sample_n=10)
+    assert len(sampled) == 10
+    # every stratum is represented when the sample is large enough
+    assert len(count_strata(requests, sampled)) == 4
+
+
+def test_sample_n_size_on_random_strata():
+    rng = np.random.default_rng(0)
+    for _ in range(500):
+        sizes = [int(size) for size in rng.integers(1, 60, size=rng.integers(1, 8))]
+        requests = make_requests(sizes)
+        sample_n = int(rng.integers(1, len(requests) + 1))
+        sampled = stratified_sample(requests, 'singlecall', sample_n=sample_n)
+        assert len(sampled) == sample_n, (sizes, sample_n)
+        assert len(set(sampled)) == len(sampled)
+
+
+def test_sample_keeps_stratum_proportions():
+    sizes = [100, 300, 60, 40]
+    requests = make_requests(sizes)
+    sampled = stratified_sample(requests, 'singlecall', sample_frac=0.25)
+    assert len(sampled) == 125
+    counts = count_strata(requests, sampled)
+    for stratum, size in enumerate(sizes):
+        assert abs(counts[f'type-{stratum}'] - size * 0.25) <= 1
+
+
+def test_sample_is_seed_stable():
+    requests = make_requests([30, 20, 10])
+    assert stratified_sample(requests, 'singlecall', sample_n=12) == stratified_sample(requests, 'singlecall', sample_n=12)
+    assert stratified_sample(requests, 'singlecall', sample_n=12, seed=1) != stratified_sample(requests, 'singlecall', sample_n=12)
+    assert stratified_order(requests, 'singlecall') == stratified_order(requests, 'singlecall')
+
+
+def test_tiny_sample_frac_samples_one_request():
+    requests = make_requests([30, 20])
+    assert len(stratified_sample(requests, 'singlecall', sample_frac=0.001)) == 1
+
+
+def test_invalid_sample_size_raises():
+    requests = make_requests([30, 20])
+    with pytest.raises(ValueError):
+        stratified_sample(requests, 'singlecall', sample_n=0)
+    with pytest.raises(ValueError):
+        stratified_sample(requests, 'singlecall', sample_frac=0)
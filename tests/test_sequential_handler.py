@@ -0,0 +1,76 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src.evaluation_registor import SingleCallEvaluationRegistor
+from src.metrics_collector import MetricsCollector
+from src.sequential_handler import SequentialEvaluationHandler
+
+
+def sequential_handler(pass_count, case_count, **kwargs):
+    evaluation_handler = SimpleNamespace(eval_reg=SimpleNamespace(pass_count=pass_count, case_count=case_count))
+    return SequentialEvaluationHandler('singlecall', None, evaluation_handler, **kwargs)
+
+
+def test_no_stop_before_the_minimum_size():
+    assert sequential_handler(0, 29, reject_below=0.5, min_size=30).get_stop_reason() is None
+
+
+def test_rejects_once_the_upper_bound_is_below_the_threshold():
+    # wilson upper bound of 0/30 is 0.114
+    assert sequential_handler(0, 30, reject_below=0.2, min_size=30).get_stop_reason().startswith('rejected (upper bound 0.114')
+    assert sequential_handler(0, 30, reject_below=0.1, min_size=30).get_stop_reason() is None
+
+
+@pytest.mark.parametrize('target_ci_width, stops', [(0.07, True), (0.06, False)])
+def test_stops_once_the_interval_is_narrow_enough(target_ci_width, stops):
+    # wilson interval of 400/800 is 0.069 wide
+    stop_reason = sequential_handler(400, 800, target_ci_width=target_ci_width, min_size=30).get_stop_reason()
+    assert (stop_reason is not None) == stops
+
+
+def test_no_rule_never_stops():
+    assert sequential_handler(0, 1000).get_stop_reason() is None
+
+
+class FakeResponseHandler:
+    def __init__(self):
+        self.metrics_collector = MetricsCollector()
+        self.fetched = 0
+
+    def warm_up(self):
+        pass
+
+    def fetch(self, api_request_list, fp):
+        self.fetched += len(api_request_list)
+        return [{'role': 'assistant', 'content': 'answer', 'tool_calls': None} for _ in api_request_list]
+
+
+class FakeEvaluationHandler:
+    def __init__(self):
+        self.metrics_collector = MetricsCollector()
+        self.eval_reg = SingleCallEvaluationRegistor()
+
+    def warm_up(self):
+        pass
+
+    def evaluate_request(self, inp, out, only_exact=False):
+        return {'model_request': inp, 'model_response': out, 'is_pass': 'fail'}
+
+    def save_evaluation(self, eval_data, eval_raw_fw, eval_tsv_fw):
+        self.eval_reg.add_eval_output(eval_data)
+
+    def report_metrics(self, eval_log_file_path):
+        pass
+
+
+def test_evaluate_stops_generating_at_the_step_where_a_rule_fires(tmp_path, capsys):
+    api_request_list = [{'serial_num': idx, 'tools_type': tools_type} for idx in range(50) for tools_type in ('exact', '4_random')]
+    response_handler, evaluation_handler = FakeResponseHandler(), FakeEvaluationHandler()
+    handler = SequentialEvaluationHandler('singlecall', response_handler, evaluation_handler,
+                                          reject_below=0.2, step_size=20, min_size=30)
+    handler.evaluate(api_request_list, str(tmp_path / 'output.jsonl'), str(tmp_path / 'eval.jsonl'),
+                     str(tmp_path / 'eval_report.tsv'), reset=True)
+    assert response_handler.fetched == 40
+    assert evaluation_handler.eval_reg.get_eval_output_length() == 40
+    assert '* stop reason : rejected' in capsys.readouterr().out
@@ -0,0 +1,56 @@
+import time
+import importlib.util
+
+import pytest
+
+from src.metrics_collector import MetricsCollector
+from src.stage_profiler import StageProfiler, profiling
+
+
+def wait_for_provider(api_request):
+    time.sleep(0.05)
+    return api_request
+
+
+def test_reports_per_stage_with_the_network_wait(tmp_path):
+    with profiling('cprofile', str(tmp_path), 'run') as stage_profiler:
+        metrics_collector = MetricsCollector(stage_profiler=stage_profiler)
+        with metrics_collector.stage('payload'):
+            sum(range(1000))
+        for _ in range(2):
+            with metrics_collector.stage('generation'):
+                metrics_collector.call('generation', 'fake', wait_for_provider, {'serial_num': 1})
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        'run.profile.generation.prof', 'run.profile.generation.txt', 'run.profile.payload.prof', 'run.profile.payload.txt']
+    report = (tmp_path / 'run.profile.generation.txt').read_text()
+    network_wait = float(report.split('network wait (provider_wait) ')[1].split('s')[0])
+    # both entries of the stage are accumulated in one report
+    assert network_wait >= 0.09
+    assert 'wait_for_provider' in report
+
+
+def test_nested_stage_is_attributed_to_the_outer_stage(tmp_path):
+    stage_profiler = StageProfiler('cprofile', str(tmp_path), 'run')
+    with stage_profiler.profile('generation'):
+        with stage_profiler.profile('judge'):
+            pass
+    assert list(stage_profiler.profilers) == ['generation']
+    assert stage_profiler.active_stage is None
+
+
+def test_reports_are_written_when_the_run_fails(tmp_path):
+    with pytest.raises(RuntimeError):
+        with profiling('cprofile', str(tmp_path), 'run') as stage_profiler:
+            with stage_profiler.profile('judge'):
+                raise RuntimeError('judge down')
+    assert (tmp_path / 'run.profile.judge.txt').exists()
+
+
+def test_profiling_options(tmp_path):
+    with profiling(None, str(tmp_path), 'run') as stage_profiler:
+        assert stage_profiler is None
+    with pytest.raises(Exception, match='Unsupported profiler type'):
+        StageProfiler('yappi', str(tmp_path), 'run')
+    if importlib.util.find_spec('pyinstrument') is None:
+        with pytest.raises(Exception, match='requires the pyinstrument package'):
+            StageProfiler('pyinstrument', str(tmp_path), 'run')
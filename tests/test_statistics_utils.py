@@ -0,0 +1,89 @@
+import math
+
+import numpy as np
+import pytest
+
+from src.evaluation_registor import compare_eval_outputs
+from src.statistics_utils import (
+    bootstrap_pass_rate_intervals,
+    bootstrap_paired_difference,
+    mcnemar_test,
+    wilson_interval
+)
+
+
+def pass_vectors(both, only_a, only_b, neither):
+    a = [1] * both + [1] * only_a + [0] * only_b + [0] * neither
+    b = [1] * both + [0] * only_a + [1] * only_b + [0] * neither
+    return a, b
+
+
+def test_mcnemar_exact_test_with_few_discordant_pairs():
+    # two-sided binomial test of 1 against 5 discordant pairs: 2 * (C(6,0) + C(6,1)) / 2^6
+    result = mcnemar_test(*pass_vectors(10, 1, 5, 4))
+    assert result == {'only_a': 1, 'only_b': 5, 'statistic': 1.0, 'p_value': 14 / 64, 'method': 'exact'}
+
+
+def test_mcnemar_chi_square_with_continuity_correction():
+    # (|10 - 25| - 1)^2 / 35 = 5.6, p-value of chi2(1) at 5.6
+    result = mcnemar_test(*pass_vectors(50, 10, 25, 15))
+    assert result['method'] == 'chi2'
+    assert result['statistic'] == pytest.approx(5.6)
+    assert result['p_value'] == pytest.approx(0.01796, abs=1e-5)
+
+
+def test_mcnemar_without_discordant_pairs():
+    assert mcnemar_test([1, 0, 1], [1, 0, 1])['p_value'] == 1.0
+
+
+def test_wilson_interval_known_values():
+    lower, upper = wilson_interval(8, 10)
+    assert lower == pytest.approx(0.4902, abs=1e-4)
+    assert upper == pytest.approx(0.9433, abs=1e-4)
+    assert wilson_interval(0, 0) == (0.0, 1.0)
+    assert wilson_interval(10, 10)[1] == 1.0
+
+
+def test_bootstrap_pass_rate_intervals_match_the_normal_approximation():
+    lower, upper = bootstrap_pass_rate_intervals([50, 100, 0], [100, 100, 0])
+    # 0.5 +- 1.96 * sqrt(0.25 / 100)
+    assert lower[0] == pytest.approx(0.402, abs=0.015)
+    assert upper[0] == pytest.approx(0.598, abs=0.015)
+    assert (lower[1], upper[1]) == (1.0, 1.0)
+    assert math.isnan(lower[2]) and math.isnan(upper[2])
+
+
+def test_bootstrap_pass_rate_intervals_are_reproducible():
+    first = bootstrap_pass_rate_intervals([30], [70])
+    second = bootstrap_pass_rate_intervals([30], [70])
+    assert np.array_equal(first[0], second[0]) and np.array_equal(first[1], second[1])
+
+
+def test_paired_bootstrap_matches_an_index_resampling_bootstrap():
+    a, b = pass_vectors(60, 10, 20, 10)
+    result = bootstrap_paired_difference(a, b)
+    assert result['difference'] == pytest.approx(0.1)
+    rng = np.random.default_rng(0)
+    indices = rng.integers(0, len(a), size=(10000, len(a)))
+    differences = (np.asarray(b)[indices] - np.asarray(a)[indices]).mean(axis=1)
+    lower, upper = np.quantile(differences, [0.025, 0.975])
+    assert result['lower'] == pytest.approx(lower, abs=0.015)
+    assert result['upper'] == pytest.approx(upper, abs=0.015)
+
+
+def test_paired_bootstrap_edge_cases():
+    assert bootstrap_paired_difference([1, 0, 1], [1, 0, 1]) == {'difference': 0.0, 'lower': 0.0, 'upper': 0.0}
+    assert bootstrap_paired_difference([0, 0], [1, 1]) == {'difference': 1.0, 'lower': 1.0, 'upper': 1.0}
+    assert math.isnan(bootstrap_paired_difference([], [])['difference'])
+    with pytest.raises(ValueError):
+        bootstrap_paired_difference([1, 0], [1])
+
+
+def test_compare_eval_outputs_pairs_the_requests_both_runs_evaluated():
+    def eval_output(verdicts):
+        return [{'request_key': key, 'is_pass': is_pass, 'model_response': {}} for key, is_pass in verdicts.items()]
+    result = compare_eval_outputs(eval_output({'1': 'pass', '2': 'fail', '3': 'fail'}),
+                                  eval_output({'1': 'pass', '2': 'pass', '4': 'pass'}))
+    assert result['paired_count'] == 2
+    assert (result['base_pass_rate'], result['target_pass_rate']) == (0.5, 1.0)
+    assert (result['mcnemar']['only_a'], result['mcnemar']['only_b']) == (0, 1)
@@ -0,0 +1,88 @@
+import threading
+
+from src import openai_utils
+from src.hedging import HedgedCaller
+from src.response_handler import ResponseHandler
+from src.sticky_routing import StickyRoutes, get_route_key, sticky_route
+
+
+def test_routes_are_pinned_per_route_key():
+    sticky_routes = StickyRoutes()
+    assert sticky_routes.get(['a', 'b']) is None
+    sticky_routes.pin('a')
+    assert sticky_routes.routes == {}
+    with sticky_route('dialog-1'):
+        assert sticky_routes.get(['a', 'b']) is None
+        sticky_routes.pin('b')
+        assert sticky_routes.get(['a', 'b']) == 'b'
+        # a pinned member that is not available is not returned, the pool selects and pins another one
+        assert sticky_routes.get(['a']) is None
+    with sticky_route('dialog-2'):
+        assert sticky_routes.get(['a', 'b']) is None
+
+
+def test_oldest_routes_are_forgotten():
+    sticky_routes = StickyRoutes(max_routes=2)
+    for route_key in ('dialog-1', 'dialog-2', 'dialog-1', 'dialog-3'):
+        with sticky_route(route_key):
+            sticky_routes.pin(route_key)
+    assert list(sticky_routes.routes) == ['dialog-1', 'dialog-3']
+
+
+def test_route_key_is_per_thread_and_restored():
+    seen = []
+    with sticky_route('dialog-1'):
+        with sticky_route('dialog-2'):
+            assert get_route_key() == 'dialog-2'
+        assert get_route_key() == 'dialog-1'
+        thread = threading.Thread(target=lambda: seen.append(get_route_key()))
+        thread.start()
+        thread.join()
+    assert get_route_key() is None
+    assert seen == [None]
+
+
+def test_pool_keeps_a_dialog_on_its_replica_while_it_is_healthy():
+    pool = openai_utils.OpenaiReplicaPool(['http://127.0.0.1:1/v1', 'http://127.0.0.1:2/v1'], api_key='key', health_interval=0)
+    first, second = pool.members
+    with sticky_route('dialog-1'):
+        pinned = pool.acquire()
+    other = second if pinned is first else first
+    with sticky_route('dialog-1'):
+        # the least loaded replica would be the other one
+        assert pool.acquire() is pinned
+        pinned.healthy = False
+        assert pool.acquire() is other
+        pinned.healthy = True
+        assert pool.acquire() is other
+    assert pool.acquire() is pinned
+
+
+def test_hedged_attempts_keep_the_route_of_their_call():
+    caller = HedgedCaller(lambda api_request: get_route_key(), call_timeout=5)
+    with sticky_route('dialog-7'):
+        assert caller({}) == 'dialog-7'
+
+
+class RouteRecordingExecutor:
+    model = 'fake-model'
+
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, api_request):
+        self.calls.append((api_request['dialog_num'], api_request['serial_num'], get_route_key()))
+        return {'role': 'assistant', 'content': f"{api_request['dialog_num']}.{api_request['serial_num']}", 'tool_calls': None}
+
+
+def test_dialog_sticky_runs_the_turns_of_a_dialog_in_order_on_its_route(tmp_path):
+    response_handler = ResponseHandler('gpt-4o', 'test-key', None, None, None, None, batch_size=2, dialog_sticky=True)
+    response_handler.executor = RouteRecordingExecutor()
+    api_request_list = [{'dialog_num': dialog_num, 'serial_num': serial_num, 'messages': []}
+                        for dialog_num in (1, 2, 3) for serial_num in range(3)]
+    with open(tmp_path / 'response.jsonl', 'w') as fp:
+        outputs = response_handler.fetch_dialogs(api_request_list, fp)
+    assert [output['content'] for output in outputs] == [f"{r['dialog_num']}.{r['serial_num']}" for r in api_request_list]
+    for dialog_num in (1, 2, 3):
+        turns = [call for call in response_handler.executor.calls if call[0] == dialog_num]
+        assert turns == [(dialog_num, serial_num, f'dialog-{dialog_num}') for serial_num in range(3)]
@@ -0,0 +1,54 @@
+import json
+import threading
+
+import pytest
+
+from src.metrics_collector import MetricsCollector
+from src.trace_recorder import trace_span, tracing
+
+
+def load_events(trace_file_path):
+    return json.loads(trace_file_path.read_text())['traceEvents']
+
+
+def test_spans_are_not_recorded_without_tracing(tmp_path):
+    with trace_span('generation', 'provider', serial_num=1):
+        pass
+    with tracing(None):
+        with trace_span('generation', 'provider'):
+            pass
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_spans_of_every_thread_are_written(tmp_path):
+    trace_file_path = tmp_path / 'run.trace.json'
+    with tracing(str(trace_file_path)):
+        with trace_span('batch', 'batch', size=2):
+            thread = threading.Thread(name='model-call-1', target=lambda: MetricsCollector().call(
+                'generation', 'fake', lambda api_request: api_request, {'serial_num': 7, 'tools_type': 'exact'}))
+            thread.start()
+            thread.join()
+    events = load_events(trace_file_path)
+    spans = {event['name']: event for event in events if event['ph'] == 'X'}
+    assert spans['batch']['args'] == {'size': 2}
+    assert spans['generation']['args'] == {'provider': 'fake', 'serial_num': 7, 'tools_type': 'exact'}
+    assert spans['generation']['cat'] == 'provider'
+    assert spans['generation']['tid'] != spans['batch']['tid']
+    # the span of the call lies within the batch span
+    assert spans['batch']['ts'] <= spans['generation']['ts']
+    assert spans['generation']['ts'] + spans['generation']['dur'] <= spans['batch']['ts'] + spans['batch']['dur']
+    thread_names = {event['args']['name'] for event in events if event['ph'] == 'M'}
+    assert 'model-call-1' in thread_names
+
+
+def test_trace_is_written_when_the_run_fails(tmp_path):
+    trace_file_path = tmp_path / 'run.trace.json'
+    with pytest.raises(RuntimeError):
+        with tracing(str(trace_file_path)):
+            with trace_span('generation', 'provider'):
+                raise RuntimeError('provider down')
+    assert [event['name'] for event in load_events(trace_file_path) if event['ph'] == 'X'] == ['generation']
+    # tracing is off again after the block
+    with trace_span('judge', 'provider'):
+        pass
+    assert len(load_events(trace_file_path)) == 2